@@ -9,6 +9,7 @@
 # ]
 
 
+from .async_doc_store import AsyncDatabase, AsyncDocumentStore
 from .commandline import ParseError, Program, argument
 from .dataclasses_ext import (
     DataClassicValidationError,
@@ -17,6 +18,7 @@ from .dataclasses_ext import (
     dataclass,
     field,
     from_dict,
+    from_dicts,
     from_json,
     get_schema,
     is_dataclass,
@@ -24,4 +26,5 @@ from .dataclasses_ext import (
 )
 from .dctables import DataClassTable
 from .doc_store import Database, DocumentStore, Find
+from .sharded_doc_store import ShardedDocumentStore
 from .tables import DataTable, sample_table
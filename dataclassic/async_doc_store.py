@@ -0,0 +1,254 @@
+"""
+async_doc_store module
+----------------------
+
+asyncio wrappers for the JSON document store.  The queries and writes of a
+DocumentStore run on a dedicated thread pool over a pooled Database (see
+Database(..., pool_size=N)), so that neither SQLite nor the decoding of the
+documents blocks the event loop.
+
+..code::python
+
+    >>> async with AsyncDatabase("sqlite:///shapes.db", pool_size=4) as db:
+    ...     shapes = await AsyncDocumentStore.open("shapes", db, dtype=Shape)
+    ...     await shapes.insert_many([triangle, rectangle])
+    ...     red = await shapes.find("@color = ?", ("red",))
+    ...     async for shape in shapes.find_iter(order_by="ID"):
+    ...         print(shape)
+    ...     async with aclosing(shapes.find_iter(order_by="ID")) as found:
+    ...         async for shape in found:
+    ...             if shape.sides > 4:
+    ...                 break
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from dataclassic.doc_store import Database, DocumentStore
+from dataclassic.encoders import JsonEncoder
+
+# marks the end of the batches of an async iterator
+_DONE = object()
+
+
+class AsyncDatabase(object):
+    """
+    A pooled Database whose work is done by a dedicated thread pool.  Every worker
+    thread reads with a connection of the pool, writes are serialized by the
+    Database.
+    """
+
+    def __init__(
+        self, connection_string, encoder=JsonEncoder, pool_size=4, max_workers=None
+    ):
+        """
+        :param str connection_string: like sqlite:///path/to/file.db.  The database
+            must be a file, as the worker threads use separate connections.
+        :param encoder: the encoder for documents (see Database)
+        :param int pool_size: the number of reader connections kept by the pool
+        :param int max_workers: the number of worker threads.  Defaults to
+            *pool_size*, so no worker waits for a pooled connection.
+        """
+        self.db = Database(connection_string, encoder=encoder, pool_size=pool_size)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or pool_size, thread_name_prefix="dataclassic"
+        )
+        # the stop events of the running iterations (see iterate)
+        self._stops = set()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) on a worker thread and returns its result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def iterate(self, func, *args, batch_size=1000, **kwargs):
+        """
+        Iterates over the generator returned by func(*args, **kwargs).  The generator
+        runs on one worker thread and hands over its items *batch_size* at a time, at
+        most two batches ahead of the consumer.  An iteration left early should be
+        closed (for example with contextlib.aclosing) to stop the worker thread at
+        once.  Otherwise the worker thread stops when the database is closed.
+        """
+        loop = asyncio.get_running_loop()
+        batches = asyncio.Queue()
+        # free places for batches the consumer has not taken yet
+        slots = threading.Semaphore(2)
+        stop = threading.Event()
+        self._stops.add(stop)
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(batches.put_nowait, item)
+            except RuntimeError:
+                # the event loop is closed, nobody takes the items anymore
+                stop.set()
+
+        def wait_for_slot():
+            # polls, so the producer notices when the consumer or the database stops
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return False
+            return not stop.is_set()
+
+        def produce():
+            items = iter(())
+            try:
+                items = iter(func(*args, **kwargs))
+                batch = []
+                for item in items:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        if not wait_for_slot():
+                            return
+                        put(batch)
+                        batch = []
+                if batch and wait_for_slot():
+                    put(batch)
+            except Exception as err:
+                put(err)
+            finally:
+                if hasattr(items, "close"):
+                    items.close()
+                # the iteration held the connection of the worker until now
+                self.db.release()
+                put(_DONE)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        done = False
+        try:
+            while not done:
+                batch = await batches.get()
+                if batch is _DONE:
+                    done = True
+                elif isinstance(batch, Exception):
+                    raise batch
+                else:
+                    slots.release()
+                    for item in batch:
+                        yield item
+        finally:
+            # the consumer may stop early, let the producer finish
+            stop.set()
+            self._stops.discard(stop)
+            while not done:
+                done = await batches.get() is _DONE
+            await producer
+
+    async def close(self):
+        """
+        Stops the iterations still running, waits for the worker threads to finish
+        and closes the database
+        """
+        for stop in list(self._stops):
+            stop.set()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        self.db.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class AsyncDocumentStore(object):
+    """
+    asyncio interface of a DocumentStore.  The methods take the arguments of the
+    DocumentStore methods of the same name and are awaited (or iterated with
+    async for, in the case of find_iter and find2_iter).
+    """
+
+    def __init__(self, name, db, **kwargs):
+        """
+        :param str name: name of the collection
+        :param AsyncDatabase db: the database
+        :param kwargs: passed on to DocumentStore, like dtype or compression
+
+        The collection is opened (and created if needed) synchronously.  Within a
+        running event loop use open instead.
+        """
+        self.db = db
+        self.store = DocumentStore(name, db.db, **kwargs)
+
+    @classmethod
+    async def open(cls, name, db, **kwargs):
+        """
+        Opens (and creates if needed) the collection on a worker thread of *db*, so
+        the event loop is not blocked.  The arguments are those of AsyncDocumentStore.
+        """
+        self = cls.__new__(cls)
+        self.db = db
+        self.store = await db.run(DocumentStore, name, db.db, **kwargs)
+        return self
+
+    @property
+    def name(self):
+        return self.store.name
+
+    @property
+    def dtype(self):
+        return self.store.dtype
+
+    async def get(self, *args, **kwargs):
+        return await self.db.run(self.store.get, *args, **kwargs)
+
+    async def get_many(self, *args, **kwargs):
+        return await self.db.run(self.store.get_many, *args, **kwargs)
+
+    async def find(self, *args, **kwargs):
+        return await self.db.run(self.store.find, *args, **kwargs)
+
+    async def find2(self, *args, **kwargs):
+        return await self.db.run(self.store.find2, *args, **kwargs)
+
+    async def find_page(self, *args, **kwargs):
+        return await self.db.run(self.store.find_page, *args, **kwargs)
+
+    async def find2_page(self, *args, **kwargs):
+        return await self.db.run(self.store.find2_page, *args, **kwargs)
+
+    def find_iter(self, *args, batch_size=1000, **kwargs):
+        func = partial(self.store.find_iter, *args, batch_size=batch_size, **kwargs)
+        return self.db.iterate(func, batch_size=batch_size)
+
+    def find2_iter(self, *args, batch_size=1000, **kwargs):
+        func = partial(self.store.find2_iter, *args, batch_size=batch_size, **kwargs)
+        return self.db.iterate(func, batch_size=batch_size)
+
+    async def count(self, *args, **kwargs):
+        return await self.db.run(self.store.count, *args, **kwargs)
+
+    async def distinct(self, *args, **kwargs):
+        return await self.db.run(self.store.distinct, *args, **kwargs)
+
+    async def aggregate(self, *args, **kwargs):
+        return await self.db.run(self.store.aggregate, *args, **kwargs)
+
+    async def explain(self, *args, **kwargs):
+        return await self.db.run(self.store.explain, *args, **kwargs)
+
+    async def insert(self, *args, **kwargs):
+        return await self.db.run(self.store.insert, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self.db.run(self.store.insert_many, *args, **kwargs)
+
+    async def bulk_load(self, *args, **kwargs):
+        return await self.db.run(self.store.bulk_load, *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self.db.run(self.store.delete, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self.db.run(self.store.delete_many, *args, **kwargs)
+
+    async def add_index(self, *args, **kwargs):
+        return await self.db.run(self.store.add_index, *args, **kwargs)
+
+    async def update_index(self, *args, **kwargs):
+        return await self.db.run(self.store.update_index, *args, **kwargs)
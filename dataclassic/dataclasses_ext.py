@@ -49,7 +49,9 @@ Additional information on each field is stored in the metadata entry of the fiel
 
 """
 
+import base64
 import copy
+import sys
 import typing
 from dataclasses import MISSING, Field
 from dataclasses import dataclass as dataclass_
@@ -58,6 +60,7 @@ from dataclasses import fields, is_dataclass
 from datetime import date, datetime, timedelta
 from enum import Enum
 from functools import wraps
+from json.encoder import INFINITY, JSONEncoder, encode_basestring_ascii
 from pathlib import Path
 from uuid import UUID
 
@@ -70,6 +73,12 @@ except ImportError:
 
 __all__ = [
     "post_init_coersion",
+    "compile_coercion_plan",
+    "get_coercion_plan",
+    "from_dict",
+    "from_dicts",
+    "to_json",
+    "compile_post_init",
     "is_dataclass",
     "field",
     "fields",
@@ -116,6 +125,7 @@ def field(
     exclude_from_tree=False,
     json_key=None,
     nargs=1,
+    array_encoding=None,
 ) -> Field:
     metadata_ = {}  # if metadata is None else metadata
     if metadata:
@@ -126,6 +136,8 @@ def field(
     metadata_["exclude_from_tree"] = exclude_from_tree
     metadata_["nargs"] = nargs
     metadata_["json_key"] = json_key
+    # "base64" stores numpy arrays as their raw bytes (see encode_ndarray)
+    metadata_["array_encoding"] = array_encoding
 
     return field_(
         default=default,
@@ -150,113 +162,391 @@ def is_generic_container(cls):
         return True
 
 
-def post_init_coersion(cls):
-    def __post_init__(self):
-        # print('running post init')
-        for f in fields(self):
-            current_value = getattr(self, f.name)
-
-            if "converter" in f.metadata and f.metadata["converter"]:
-                # if a converter funciton is defined run it
-                if current_value is Unset:
-                    continue
-
-                current_value = f.metadata["converter"](current_value)
-                setattr(self, f.name, current_value)
-
-            elif is_dataclass(f.type):
-                if isinstance(current_value, dict):
-                    setattr(self, f.name, f.type(**current_value))
-                elif not isinstance(current_value, f.type):
-                    raise ValueError(
-                        f"Wrong item type: {type(current_value)}. Expected {f.type}"
-                    )
-
-            elif is_generic_container(f.type):
-                subtype = f.type.__args__[-1]
-                if f.type.__origin__ is list:
-                    if (current_value) is None:
-                        return []
-                    # handle generic lists
-                    if len(current_value) == 0:
-                        continue
-                    elif isinstance(current_value[0], dict):
-                        # print(current_value)
-                        # print(subtype)
-                        setattr(
-                            self,
-                            f.name,
-                            [subtype(**item_data) for item_data in current_value],
-                        )
-                    else:
-                        try:
-                            setattr(
-                                self,
-                                f.name,
-                                [
-                                    item_data
-                                    if isinstance(item_data, subtype)
-                                    else subtype(item_data)
-                                    for item_data in current_value
-                                ],
-                            )
-                        except Exception as ex:
-                            raise Exception(
-                                f"Error parsing item in field [{f.name}] - {ex.args[0]}\n"
-                                + f"All items must be of type [{subtype.__name__}] - items are "
-                                + f"{ex.__traceback__.tb_frame.f_locals['current_value']}"
-                            )
-
-                elif f.type.__origin__ is dict:
-                    if len(current_value) == 0:
-                        continue
-
-                    first_key = next(iter(current_value))
-                    if isinstance(current_value[first_key], dict):
-                        # print(current_value)
-                        setattr(
-                            self,
-                            f.name,
-                            {
-                                key: subtype(**item_data)
-                                for key, item_data in current_value.items()
-                            },
-                        )
-                    else:
-                        setattr(
-                            self,
-                            f.name,
-                            {
-                                key: item_data
-                                if isinstance(item_data, subtype)
-                                else subtype(item_data)
-                                for key, item_data in current_value.items()
-                            },
-                        )
-            else:
+class _SkipType:
+    """
+    Sentinel returned by a coercion step when the remaining work for a field
+    (assignment and validation) should be skipped.
+    """
+
+    def __repr__(self):
+        return "<SKIP>"
+
+
+_SKIP = _SkipType()
+
+
+class CoercionStep(typing.NamedTuple):
+    """
+    One precomputed entry in a class' coercion plan.
+
+    :param name: name of the field
+    :param kind: the kind of coercion ("convert", "nested", "list", "dict", "cast"
+        or None when the field is only validated)
+    :param ftype: the resolved type of the field
+    :param subtype: the item type for generic containers
+    :param converter: the converter function of the field or None
+    :param coerce: a function mapping the current value to the coerced value, or
+        returning _SKIP when assignment and validation should be skipped
+    :param validator: the validator function for the field or None
+    """
+
+    name: str
+    kind: typing.Optional[str]
+    ftype: typing.Any
+    subtype: typing.Any
+    converter: typing.Optional[typing.Callable]
+    coerce: typing.Optional[typing.Callable]
+    validator: typing.Optional[typing.Callable]
+
+
+def _resolve_type_hints(cls):
+    """
+    Resolves the string annotations of *cls* and its bases, each on its own (like
+    typing.get_type_hints).  An annotation naming something that is not defined is
+    left as it was declared, without affecting the others.  Other errors are raised.
+    """
+    hints = {}
+    for base in reversed(cls.__mro__):
+        module = sys.modules.get(base.__module__)
+        globalns = getattr(module, "__dict__", {})
+        localns = dict(vars(base))
+        for name, annotation in base.__dict__.get("__annotations__", {}).items():
+            if isinstance(annotation, str):
                 try:
-                    setattr(self, f.name, f.type(current_value))
-                except:
+                    annotation = eval(annotation, globalns, localns)
+                except NameError:
+                    # like a class defined later or within a function
                     pass
+            hints[name] = annotation
+    return hints
 
-            if "validator" in f.metadata and f.metadata["validator"]:
-                # if a validator function is defined, then run it
-                if not f.metadata["validator"](self):
-                    raise DataClassicValidationError(
-                        f"Validation for {cls.__name__}.{f.name} failed."
-                    )
 
-    setattr(cls, "__post_init__", __post_init__)
+_IMMUTABLE_TYPES = (int, float, str, bool, complex, bytes)
 
-    # cls = dataclass(cls)
+
+def _make_convert(converter):
+    def coerce(value):
+        if value is Unset:
+            return _SKIP
+        return converter(value)
+
+    return coerce
+
+
+def _make_nested(ftype):
+    def coerce(value):
+        if isinstance(value, dict):
+            return ftype(**value)
+        elif not isinstance(value, ftype):
+            raise ValueError(f"Wrong item type: {type(value)}. Expected {ftype}")
+        return value
+
+    return coerce
+
+
+def _make_list(name, subtype):
+    def coerce(value):
+        if value is None or len(value) == 0:
+            return _SKIP
+        elif isinstance(value[0], dict):
+            return [subtype(**item_data) for item_data in value]
+        try:
+            return [
+                item_data if isinstance(item_data, subtype) else subtype(item_data)
+                for item_data in value
+            ]
+        except Exception as ex:
+            raise Exception(
+                f"Error parsing item in field [{name}] - {ex.args[0]}\n"
+                + f"All items must be of type [{subtype.__name__}] - items are "
+                + f"{value}"
+            )
+
+    return coerce
+
+
+def _make_dict(subtype):
+    def coerce(value):
+        if value is None or len(value) == 0:
+            return _SKIP
+        if isinstance(next(iter(value.values())), dict):
+            return {key: subtype(**item_data) for key, item_data in value.items()}
+        return {
+            key: item_data if isinstance(item_data, subtype) else subtype(item_data)
+            for key, item_data in value.items()
+        }
+
+    return coerce
+
+
+def _is_ndarray_type(ftype):
+    return HAS_NUMPY and (
+        ftype is numpy.ndarray or getattr(ftype, "__origin__", None) is numpy.ndarray
+    )
+
+
+def _make_array():
+    def coerce(value):
+        if value is None or value is Unset or isinstance(value, numpy.ndarray):
+            return value
+        elif isinstance(value, dict) and "__ndarray__" in value:
+            return decode_ndarray(value)
+        return numpy.asarray(value)
+
+    return coerce
+
+
+def _make_cast(ftype):
+    if ftype in _IMMUTABLE_TYPES:
+        # values already of the exact type are returned unchanged by the cast
+        def coerce(value):
+            if type(value) is ftype:
+                return value
+            try:
+                return ftype(value)
+            except:  # nopep8
+                return value
+
+        return coerce
+
+    def coerce(value):
+        try:
+            return ftype(value)
+        except:  # nopep8
+            return value
+
+    return coerce
+
+
+def compile_coercion_plan(cls):
+    """
+    Builds the coercion plan for the dataclass *cls*.  Each field's converter,
+    validator, nested dataclass type or container item type is looked up once
+    here, so that __post_init__ only has to run the resulting list of steps.
+    """
+    hints = _resolve_type_hints(cls)
+    plan = []
+    for f in fields(cls):
+        ftype = hints.get(f.name, f.type)
+        converter = f.metadata.get("converter")
+        validator = f.metadata.get("validator") or None
+        subtype = None
+
+        if converter:
+            kind, coerce = "convert", _make_convert(converter)
+        elif is_dataclass(ftype):
+            kind, coerce = "nested", _make_nested(ftype)
+        elif _is_ndarray_type(ftype):
+            kind, coerce = "array", _make_array()
+        elif is_generic_container(ftype):
+            origin = getattr(ftype, "__origin__", None)
+            args = getattr(ftype, "__args__", None) or ()
+            subtype = args[-1] if args else None
+            if subtype is None or origin not in (list, dict):
+                # other generics (Optional, Union, tuple, ...) are not coerced
+                kind, coerce = None, None
+            elif origin is list:
+                kind, coerce = "list", _make_list(f.name, subtype)
+            else:
+                kind, coerce = "dict", _make_dict(subtype)
+        elif callable(ftype) and ftype is not typing.Any:
+            kind, coerce = "cast", _make_cast(ftype)
+        else:
+            kind, coerce = None, None
+
+        if coerce is None and validator is None:
+            continue
+
+        plan.append(
+            CoercionStep(
+                f.name, kind, ftype, subtype, converter or None, coerce, validator
+            )
+        )
+
+    return plan
+
+
+def get_coercion_plan(cls):
+    """
+    Returns the (cached) coercion plan for the dataclass *cls*
+    """
+    plan = cls.__dict__.get("__coercion_plan__")
+    if plan is None:
+        plan = compile_coercion_plan(cls)
+        setattr(cls, "__coercion_plan__", plan)
+    return plan
+
+
+def _generic_post_init(self, cls):
+    """
+    Runs the coercion plan of type(self) on the instance *self*
+    """
+    # the plan is compiled on first use, once the dataclass fields exist and
+    # forward references can be resolved
+    plan = type(self).__dict__.get("__coercion_plan__")
+    if plan is None:
+        plan = get_coercion_plan(type(self))
+
+    for name, kind, ftype, subtype, converter, coerce, validator in plan:
+        if coerce is not None:
+            current_value = getattr(self, name)
+            new_value = coerce(current_value)
+            if new_value is _SKIP:
+                continue
+            if new_value is not current_value:
+                setattr(self, name, new_value)
+
+        if validator is not None and not validator(self):
+            # if a validator function is defined, then run it
+            raise DataClassicValidationError(
+                f"Validation for {cls.__name__}.{name} failed."
+            )
+
+
+def _post_init_source(cls, owner, plan):
+    """
+    Renders the source of a __post_init__ function specialised for the coercion
+    *plan* of the class *owner*.  Returns the source text and the names that must
+    be bound as locals of the generated function.
+    """
+    local_vars = {
+        "_owner": owner,
+        "_generic": _generic_post_init,
+        "_cls": cls,
+        "_Unset": Unset,
+        "_SKIP": _SKIP,
+        "_ValidationError": DataClassicValidationError,
+    }
+    lines = [
+        "if type(self) is not _owner:",
+        "    return _generic(self, _cls)",
+    ]
+
+    for i, step in enumerate(plan):
+        if not step.name.isidentifier():
+            raise ValueError(f"Cannot generate code for field {step.name!r}")
+
+        attr = f"self.{step.name}"
+        body = []
+        if step.validator is not None:
+            local_vars[f"_validator_{i}"] = step.validator
+            local_vars[f"_message_{i}"] = (
+                f"Validation for {cls.__name__}.{step.name} failed."
+            )
+            body = [
+                f"if not _validator_{i}(self):",
+                f"    raise _ValidationError(_message_{i})",
+            ]
+
+        if step.kind == "convert":
+            local_vars[f"_converter_{i}"] = step.converter
+            lines.append(f"_v = {attr}")
+            lines.append("if _v is not _Unset:")
+            lines.append(f"    {attr} = _converter_{i}(_v)")
+            lines.extend("    " + line for line in body)
+        elif step.kind == "nested":
+            local_vars[f"_type_{i}"] = step.ftype
+            lines.append(f"_v = {attr}")
+            lines.append("if isinstance(_v, dict):")
+            lines.append(f"    {attr} = _type_{i}(**_v)")
+            lines.append(f"elif not isinstance(_v, _type_{i}):")
+            lines.append(
+                "    raise ValueError("
+                f'f"Wrong item type: {{type(_v)}}. Expected {{_type_{i}}}")'
+            )
+            lines.extend(body)
+        elif step.kind == "cast":
+            local_vars[f"_type_{i}"] = step.ftype
+            lines.append(f"_v = {attr}")
+            if step.ftype in _IMMUTABLE_TYPES:
+                lines.append(f"if type(_v) is not _type_{i}:")
+            else:
+                lines.append("if True:")
+            lines.append("    try:")
+            lines.append(f"        {attr} = _type_{i}(_v)")
+            lines.append("    except Exception:")
+            lines.append("        pass")
+            lines.extend(body)
+        elif step.coerce is not None:
+            # containers go through the generic coercion function of the step
+            local_vars[f"_coerce_{i}"] = step.coerce
+            lines.append(f"_v = _coerce_{i}({attr})")
+            lines.append("if _v is not _SKIP:")
+            lines.append(f"    {attr} = _v")
+            lines.extend("    " + line for line in body)
+        else:
+            lines.extend(body)
+
+    txt = "\n".join("        " + line for line in lines)
+    txt = (
+        f"def __create_fn__({', '.join(local_vars)}):\n"
+        "    def __post_init__(self):\n"
+        f"{txt}\n"
+        "    return __post_init__"
+    )
+    return txt, local_vars
+
+
+def compile_post_init(cls, owner):
+    """
+    Generates a __post_init__ function for *owner* with straight line code for
+    each step of its coercion plan.  Returns None if the plan cannot be
+    specialised, in which case the generic implementation should be used.
+    """
+    try:
+        txt, local_vars = _post_init_source(cls, owner, get_coercion_plan(owner))
+        ns = {}
+        exec(txt, {}, ns)
+    except Exception:
+        return None
+
+    fn = ns["__create_fn__"](**local_vars)
+    fn.__qualname__ = f"{owner.__qualname__}.__post_init__"
+    return fn
+
+
+def post_init_coersion(cls, codegen=False):
+    if codegen:
+
+        def __post_init__(self):
+            # generate the specialised function on first use and install it on
+            # the class so later instances call it directly
+            owner = type(self)
+            fn = compile_post_init(cls, owner)
+            if fn is None:
+
+                def fn(self):
+                    return _generic_post_init(self, cls)
+
+            fn.__dataclassic__ = True
+            setattr(owner, "__post_init__", fn)
+            fn(self)
+
+    else:
+
+        def __post_init__(self):
+            _generic_post_init(self, cls)
+
+    # marks the function as generated (see _plain_construction)
+    __post_init__.__dataclassic__ = True
+    setattr(cls, "__post_init__", __post_init__)
 
     return cls
 
 
 @wraps(dataclass_)
-def dataclass(cls, **kwargs):
-    cls = post_init_coersion(cls)
-    return dataclass_(cls, **kwargs)
+def dataclass(cls=None, /, *, codegen=False, **kwargs):
+    # codegen=True generates a __post_init__ specialised for the class (with exec)
+    # the first time an instance is created.  Fields that cannot be specialised
+    # use the generic coercion path.
+    def wrap(cls):
+        cls = post_init_coersion(cls, codegen=codegen)
+        return dataclass_(cls, **kwargs)
+
+    if cls is None:
+        return wrap
+
+    return wrap(cls)
 
 
 def get_schema(cls):
@@ -294,45 +584,90 @@ def get_schema(cls):
     # return cls
 
 
-def asdict(obj, *, dict_factory=dict, skip_fields=None):
+def to_document_value(obj):
+    """
+    Converts *obj* to the plain python value that asdict would store for it
+    (dataclasses become dicts, enums their values, dates strings, ...)
+    """
+    if type(obj) in _ATOMIC_TYPES:
+        return obj
+    return _asdict_inner(obj, dict, (), False)
+
+
+# leaf values that are immutable and can be returned without copying
+_ATOMIC_TYPES = frozenset((int, float, str, bool, type(None), UUID, bytes, complex))
+
+
+def get_asdict_fields(cls):
+    """
+    Returns a (cached) tuple of (field name, serialized key, binary) for the
+    dataclass *cls*.  The key is the field's json_key if one is defined.  binary
+    is True if numpy arrays in the field are stored with encode_ndarray.
+    """
+    spec = cls.__dict__.get("__asdict_fields__")
+    if spec is None:
+        spec = tuple(
+            (
+                f.name,
+                f.metadata.get("json_key") or f.name,
+                f.metadata.get("array_encoding") == "base64",
+            )
+            for f in fields(cls)
+        )
+        setattr(cls, "__asdict_fields__", spec)
+    return spec
+
+
+def asdict(obj, *, dict_factory=dict, skip_fields=None, copy=True):
+    """
+    Converts the dataclass instance *obj* to a dict, recursing into nested
+    dataclasses, lists, tuples and dicts.
+
+    :param dict_factory: the type used to create the dicts
+    :param skip_fields: names of fields that are left out
+    :param bool copy: if False, leaf values that are not known to be immutable are
+        returned as they are rather than deep copied.  Use this when the result is
+        only serialized.
+    """
     if skip_fields is None:
         skip_fields = tuple()
     if not is_dataclass(obj):
         raise TypeError("asdict() should be called on dataclass instances")
-    retval = _asdict_inner(obj, dict_factory, skip_fields=skip_fields)
+    retval = _asdict_inner(obj, dict_factory, skip_fields, copy)
     return retval
 
 
-def _asdict_inner(obj, dict_factory, skip_fields):
-    if is_dataclass(obj):
+def _asdict_inner(obj, dict_factory, skip_fields, deep=True):
+    if type(obj) in _ATOMIC_TYPES:
+        return obj
+    elif is_dataclass(obj):
         result = []
-        for f in fields(obj):
-            if f.name in skip_fields:
+        for name, key, binary in get_asdict_fields(type(obj)):
+            if name in skip_fields:
                 continue
-            val = getattr(obj, f.name)
+            val = getattr(obj, name)
             if val is Unset:
                 continue
-            value = _asdict_inner(val, dict_factory, skip_fields)
+            if binary and HAS_NUMPY and isinstance(val, numpy.ndarray):
+                val = encode_ndarray(val)
+            elif type(val) not in _ATOMIC_TYPES:
+                val = _asdict_inner(val, dict_factory, skip_fields, deep)
 
-            # if the field has "json_key" defined, it should be serialized
+            # if the field has "json_key" defined, it is serialized
             # with that key, rather than the field name
-            if "json_key" in f.metadata:
-                key = (
-                    f.name if f.metadata["json_key"] is None else f.metadata["json_key"]
-                )
-                result.append((key, value))
-            else:
-                result.append((f.name, value))
+            result.append((key, val))
         return dict_factory(result)
     elif isinstance(obj, tuple) and hasattr(obj, "_fields"):
-        return type(obj)(*[_asdict_inner(v, dict_factory, skip_fields) for v in obj])
+        return type(obj)(
+            *[_asdict_inner(v, dict_factory, skip_fields, deep) for v in obj]
+        )
     elif isinstance(obj, (list, tuple)):
-        return type(obj)(_asdict_inner(v, dict_factory, skip_fields) for v in obj)
+        return type(obj)(_asdict_inner(v, dict_factory, skip_fields, deep) for v in obj)
     elif isinstance(obj, dict):
         return type(obj)(
             (
-                _asdict_inner(k, dict_factory, skip_fields),
-                _asdict_inner(v, dict_factory, skip_fields),
+                _asdict_inner(k, dict_factory, skip_fields, deep),
+                _asdict_inner(v, dict_factory, skip_fields, deep),
             )
             for k, v in obj.items()
             if v is not None and v is not Unset
@@ -342,11 +677,50 @@ def _asdict_inner(obj, dict_factory, skip_fields):
     elif isinstance(obj, date):
         return str(obj)
     elif HAS_NUMPY and isinstance(obj, numpy.ndarray):
-        dtype = type(obj[0])
-        converter = JSON_TYPE_CONVERTERS[dtype]
-        return [converter(x) for x in obj]
-    else:
+        return _ndarray_tolist(obj)
+    elif HAS_NUMPY and isinstance(obj, numpy.generic):
+        return obj.item()
+    elif deep:
         return copy.deepcopy(obj)
+    else:
+        return obj
+
+
+def _ndarray_tolist(arr):
+    """
+    Converts a numpy array of any shape to (nested) lists of python values
+    """
+    values = arr.tolist()
+    if arr.dtype.kind in "biufU":
+        # numbers, booleans and strings already are plain python values
+        return values
+    # object, datetime, ... arrays may hold values that need converting
+    return _asdict_inner(values, dict, (), False)
+
+
+def encode_ndarray(arr):
+    """
+    Encodes a numpy array as a dict holding its raw bytes (base64 encoded), dtype
+    and shape.  Values are not converted to python objects, so this is much
+    faster and more compact than a list for large numeric arrays.
+    """
+    if arr.dtype.hasobject:
+        raise TypeError("Arrays of python objects cannot be stored as raw bytes")
+    arr = numpy.ascontiguousarray(arr)
+    return {
+        "__ndarray__": base64.b64encode(arr.data).decode("ascii"),
+        "dtype": arr.dtype.str,
+        "shape": list(arr.shape),
+    }
+
+
+def decode_ndarray(data):
+    """
+    Creates a numpy array from a dict created by encode_ndarray
+    """
+    buffer = bytearray(base64.b64decode(data["__ndarray__"]))
+    arr = numpy.frombuffer(buffer, dtype=numpy.dtype(data["dtype"]))
+    return arr.reshape(data["shape"])
 
 
 JSON_SCHEMA_TYPES = {
@@ -395,19 +769,153 @@ def get_schema_type(obj):
     return JSON_SCHEMA_TYPES.get(obj, obj.__name__)
 
 
-def to_json(dc_obj):
-    from json import dumps
+def get_json_fields(cls):
+    """
+    Returns a (cached) tuple of (field name, rendered key, rendered key with a
+    leading separator, binary) for writing instances of the dataclass *cls* as
+    JSON.
+    """
+    spec = cls.__dict__.get("__json_fields__")
+    if spec is None:
+        spec = []
+        for name, key, binary in get_asdict_fields(cls):
+            rendered = encode_basestring_ascii(key) + ": "
+            spec.append((name, rendered, ", " + rendered, binary))
+        spec = tuple(spec)
+        setattr(cls, "__json_fields__", spec)
+    return spec
+
+
+_PLAIN_ENCODER = JSONEncoder()
+
+
+def _json_float(o):
+    # same output as the json module with allow_nan=True
+    if o != o:
+        return "NaN"
+    elif o == INFINITY:
+        return "Infinity"
+    elif o == -INFINITY:
+        return "-Infinity"
+    return float.__repr__(o)
+
+
+def _json_key(key):
+    """
+    Renders a dict key the same way json.dumps(asdict(...)) does
+    """
+    if isinstance(key, Enum):
+        key = key.value
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    elif key is True:
+        return '"true"'
+    elif key is False:
+        return '"false"'
+    elif key is None:
+        return '"null"'
+    elif isinstance(key, int):
+        return '"' + int.__repr__(key) + '"'
+    elif isinstance(key, float):
+        return '"' + _json_float(key) + '"'
+    elif isinstance(key, date):
+        return encode_basestring_ascii(str(key))
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key)}")
+
+
+def _write_json(obj, parts):
+    """
+    Appends the JSON text for *obj* to the list *parts*.  The output is the same
+    as json.dumps(asdict(obj)), but no intermediate dicts or lists are built.
+    """
+    t = type(obj)
+    if t is str:
+        parts.append(encode_basestring_ascii(obj))
+    elif t is int:
+        parts.append(int.__repr__(obj))
+    elif t is float:
+        parts.append(_json_float(obj))
+    elif obj is None:
+        parts.append("null")
+    elif obj is True:
+        parts.append("true")
+    elif obj is False:
+        parts.append("false")
+    elif hasattr(t, "__dataclass_fields__"):
+        parts.append("{")
+        first = True
+        for name, key, sep_key, binary in get_json_fields(t):
+            val = getattr(obj, name)
+            if val is Unset:
+                continue
+            parts.append(key if first else sep_key)
+            first = False
+            if binary and HAS_NUMPY and isinstance(val, numpy.ndarray):
+                val = encode_ndarray(val)
+            _write_json(val, parts)
+        parts.append("}")
+    elif t is list or t is tuple or isinstance(obj, (list, tuple)):
+        if not obj:
+            parts.append("[]")
+            return
+        parts.append("[")
+        first = True
+        for val in obj:
+            if not first:
+                parts.append(", ")
+            first = False
+            _write_json(val, parts)
+        parts.append("]")
+    elif isinstance(obj, dict):
+        parts.append("{")
+        first = True
+        for key, val in obj.items():
+            if val is None or val is Unset:
+                continue
+            parts.append(
+                _json_key(key) + ": " if first else ", " + _json_key(key) + ": "
+            )
+            first = False
+            _write_json(val, parts)
+        parts.append("}")
+    elif isinstance(obj, Enum):
+        _write_json(obj.value, parts)
+    elif isinstance(obj, date):
+        parts.append(encode_basestring_ascii(str(obj)))
+    elif isinstance(obj, str):
+        parts.append(encode_basestring_ascii(obj))
+    elif isinstance(obj, int):
+        parts.append(int.__repr__(obj))
+    elif isinstance(obj, float):
+        parts.append(_json_float(obj))
+    elif HAS_NUMPY and isinstance(obj, numpy.ndarray):
+        if obj.dtype.kind in "biufU":
+            # plain python values, the C encoder writes these much faster
+            parts.append(_PLAIN_ENCODER.encode(obj.tolist()))
+        else:
+            _write_json(_ndarray_tolist(obj), parts)
+    elif HAS_NUMPY and isinstance(obj, numpy.generic):
+        _write_json(obj.item(), parts)
+    else:
+        raise TypeError(f"Object of type {t.__name__} is not JSON serializable")
 
-    return dumps(asdict(dc_obj))
+
+def to_json(dc_obj):
+    """
+    Writes the dataclass instance *dc_obj* as a JSON string.  The dataclass is
+    encoded directly, without first converting it to a dict with asdict.
+    """
+    if not is_dataclass(dc_obj) or isinstance(dc_obj, type):
+        raise TypeError("to_json() should be called on dataclass instances")
+    parts = []
+    _write_json(dc_obj, parts)
+    return "".join(parts)
 
 
 def from_json(json_string: str, dtype):
-    try:
-        from ujson import loads
-    except ImportError:
-        from json import loads
+    from dataclassic.encoders import get_json_backend
 
-    data: dict = loads(json_string)
+    data: dict = get_json_backend().loads(json_string)
 
     return from_dict(data, dtype)
 
@@ -417,10 +925,182 @@ def from_json(json_string: str, dtype):
     # return dtype(**data)
 
 
+def get_json_key_map(dtype):
+    """
+    Returns a (cached) dict mapping the json keys of *dtype* to field names.  Only
+    fields whose json_key differs from the field name are included.
+    """
+    key_map = dtype.__dict__.get("__json_key_map__")
+    if key_map is None:
+        key_map = {}
+        for f in fields(dtype):
+            key = f.metadata.get("json_key")
+            if key is not None and key != f.name:
+                key_map[key] = f.name
+        setattr(dtype, "__json_key_map__", key_map)
+    return key_map
+
+
 def from_dict(data: dict, dtype):
-    for f in fields(dtype):
-        key = f.name if f.metadata["json_key"] is None else f.metadata["json_key"]
+    for key, name in get_json_key_map(dtype).items():
         if key in data:
-            data[f.name] = data.pop(key)
+            data[name] = data.pop(key)
 
     return dtype(**data)
+
+
+def _column_check(step):
+    """
+    Returns a function telling if a list of values needs no work from the
+    coercion *step*, or None if that cannot be known without running the step.
+    """
+    if step.kind == "convert" and step.converter in _IMMUTABLE_TYPES:
+        allowed = {step.converter, UnsetType}
+        return lambda column: allowed.issuperset(map(type, column))
+    elif step.kind == "cast" and step.ftype in _IMMUTABLE_TYPES:
+        allowed = {step.ftype}
+        return lambda column: allowed.issuperset(map(type, column))
+    elif step.kind == "nested":
+        ftype = step.ftype
+        return lambda column: all(isinstance(value, ftype) for value in column)
+    elif step.kind in ("list", "dict"):
+        return lambda column: all(value is None or len(value) == 0 for value in column)
+    elif step.kind is None:
+        return lambda column: True
+    return None
+
+
+def _plain_construction(dtype):
+    """
+    Tells if instances of *dtype* are set up only by the __init__ generated by
+    dataclasses and the __post_init__ added by dataclassic (if any), so that the
+    columnar path can skip both without losing custom initialization code.
+    """
+    code = getattr(dtype.__init__, "__code__", None)
+    if code is None or code.co_filename != "<string>":
+        # an __init__ written in the class body
+        return False
+    post_init = getattr(dtype, "__post_init__", None)
+    return post_init is None or getattr(post_init, "__dataclassic__", False)
+
+
+def _build_columnar(records, dtype):
+    """
+    Builds instances of *dtype* from already renamed keyword dicts.  Each field is
+    checked once over the whole batch; if every value already has the type the
+    coercion plan would produce, the instances are created without running
+    __post_init__ (validators are still run).  Otherwise None is returned, which
+    is also the case for classes with a custom __init__ or __post_init__.
+    """
+    if not _plain_construction(dtype):
+        return None
+
+    plan = get_coercion_plan(dtype)
+    names = {f.name for f in fields(dtype) if f.init}
+
+    for rec in records:
+        if not names.issuperset(rec):
+            return None
+
+    for step in plan:
+        check = _column_check(step)
+        if check is None:
+            return None
+        name = step.name
+        f = dtype.__dataclass_fields__[name]
+        column = [rec[name] for rec in records if name in rec]
+        if len(column) < len(records) and f.default is not MISSING:
+            column.append(f.default)
+        if not check(column):
+            return None
+
+    static_defaults = {}
+    factories = []
+    required = set()
+    for f in fields(dtype):
+        if f.default is not MISSING:
+            static_defaults[f.name] = f.default
+        elif f.default_factory is not MISSING:
+            factories.append((f.name, f.default_factory))
+        elif f.init:
+            required.add(f.name)
+
+    validators = [
+        (step.name, step.kind, step.validator)
+        for step in plan
+        if step.validator is not None
+    ]
+
+    # plain instances get their __dict__ filled directly
+    use_dict = not hasattr(dtype, "__slots__")
+
+    results = []
+    setter = object.__setattr__
+    new = object.__new__
+    for rec in records:
+        if not required.issubset(rec):
+            # let the dataclass raise its usual error for a missing argument
+            return None
+
+        obj = new(dtype)
+        if use_dict:
+            d = obj.__dict__
+            d.update(static_defaults)
+            for name, factory in factories:
+                d[name] = factory()
+            d.update(rec)
+        else:
+            for name, value in static_defaults.items():
+                setter(obj, name, value)
+            for name, factory in factories:
+                setter(obj, name, factory())
+            for name, value in rec.items():
+                setter(obj, name, value)
+
+        for name, kind, validator in validators:
+            # skip the validators the coercion of __post_init__ skips (_SKIP)
+            value = getattr(obj, name)
+            if kind == "convert" and value is Unset:
+                continue
+            if kind in ("list", "dict") and (value is None or len(value) == 0):
+                continue
+            if not validator(obj):
+                raise DataClassicValidationError(
+                    f"Validation for {dtype.__name__}.{name} failed."
+                )
+        results.append(obj)
+
+    return results
+
+
+def from_dicts(records, dtype, columnar=False):
+    """
+    Creates instances of the dataclass *dtype* from an iterable of dicts.  This is
+    a generator, so records are converted one at a time as they are consumed.
+    Unlike from_dict, the input dicts are not modified.
+
+    :param records: an iterable of dicts
+    :param type dtype: the dataclass type to create
+    :param bool columnar: if True, the records are collected and checked field by
+        field.  When all values already have the right types the instances are
+        created without running __post_init__.  This requires the whole batch to
+        be held in memory.  Classes with their own __init__ or __post_init__ are
+        always created by calling them.
+    """
+    key_map = get_json_key_map(dtype)
+
+    if key_map:
+        records = (
+            {key_map.get(key, key): value for key, value in rec.items()}
+            for rec in records
+        )
+
+    if columnar:
+        records = list(records)
+        results = _build_columnar(records, dtype)
+        if results is not None:
+            yield from results
+            return
+
+    for rec in records:
+        yield dtype(**rec)
@@ -80,16 +80,44 @@ The above example is equivalent to:
     >>> s = shapes.find(query, ('red', 4))
 
 """
+
 # from dataclasses import is_dataclass
 
 
+import atexit
+import base64
+import json
+import multiprocessing
 import re
+import queue
 import sqlite3
+import threading
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
+from typing import NamedTuple
 from warnings import warn
 
-from dataclassic.dataclasses_ext import asdict, from_dict, is_dataclass
-from dataclassic.encoders import JsonEncoder, ZlibEncoder
+from dataclassic.dataclasses_ext import (
+    Unset,
+    asdict,
+    from_dicts,
+    get_json_key_map,
+    is_dataclass,
+    to_document_value,
+)
+from dataclassic.encoders import (
+    HAS_MSGPACK,
+    CompressedEncoder,
+    JsonEncoder,
+    MsgPackEncoder,
+    ZlibEncoder,
+    get_json_backend,
+    train_dictionary,
+)
 from dataclassic.sql_helper import Column, Relationship, dialects
 from dataclassic.sql_helper import sqlite_dialect as dialect
 
@@ -98,6 +126,11 @@ COLLECTION_SCHEMA = [
     Column(name="Document", dtype="Text", nullable=False),
 ]
 
+METADATA_SCHEMA = [
+    Column(name="Key", dtype="TEXT", nullable=False, primary_key=True),
+    Column(name="Value", dtype="BLOB"),
+]
+
 
 class DocumentStoreNotFound(Exception):
     """
@@ -107,6 +140,52 @@ class DocumentStoreNotFound(Exception):
     pass
 
 
+class QueryPlan(NamedTuple):
+    """
+    Describes how a find query is executed (see DocumentStore.explain)
+    """
+
+    #: the rendered sql command
+    sql: str
+    #: the parameters of the sql command
+    params: tuple
+    #: the queried attributes read from an index, mapped to the index name
+    indexes: dict
+    #: the queried attributes read from the documents
+    decoded: list
+    #: the sql function reading attributes from the documents ("json_extract" or "field")
+    function: str
+    #: the details of SQLite's EXPLAIN QUERY PLAN output
+    plan: list
+    #: True if attributes are read from every document of the collection
+    full_scan: bool
+
+
+class Page(NamedTuple):
+    """
+    A page of documents (see DocumentStore.find_page)
+    """
+
+    #: the documents of the page
+    items: list
+    #: the token of the next page, None if this is the last page
+    token: str
+
+
+def warn_full_scan(query_plan):
+    """
+    A DocumentStore.full_scan_hook issuing a warning for queries that read
+    attributes from every document
+    """
+    msg = (
+        "Query reads the attributes {0} from every document using {1}. "
+        "Consider adding an index.\nsql   ={2}".format(
+            query_plan.decoded, query_plan.function, query_plan.sql
+        )
+    )
+    warn(msg)
+
+
 class Row(sqlite3.Row):
     def __str__(self):
         return "Row({0})".format(str({k: self[k] for k in self}))
@@ -115,27 +194,286 @@ class Row(sqlite3.Row):
         return str(self)
 
 
+# the pooled databases a thread took a reader connection from during the current
+# DocumentStore operation (see _pooled_operation)
+_operation = threading.local()
+
+
+def _pooled_operation(method):
+    """
+    Decorates a DocumentStore method, so that the reader connections the calling
+    thread takes from pooled databases during the method are given back to their
+    pools when it returns.  Nested operations give them back with the outermost one.
+    """
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if getattr(_operation, "leased", None) is not None:
+            return method(*args, **kwargs)
+        leased = _operation.leased = []
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _operation.leased = None
+            for db in leased:
+                db.release()
+
+    return wrapper
+
+
+class _Lease(object):
+    """
+    Holds the pooled connection of a thread and returns it to the pool when the
+    thread ends (its thread local storage is deleted) or releases it.
+    """
+
+    def __init__(self, db, conn):
+        self.db = db
+        self.conn = conn
+        self.pool = db._idle
+        self.leases = db._leases
+
+    def __del__(self):
+        self.db._release(self.conn, self.pool, self.leases)
+
+
 class Database(object):
     """
     Abstraction for sqlite database that can contain 'nosql' type JSON document stores.
     The @Database object provides methods that will be common across collections.
+
+    A pooled database (pool_size > 0) can be shared by threads.  Each thread
+    transparently gets a reader connection for the operations of a DocumentStore,
+    which goes back to the pool when the operation returns, while all writes go
+    through one writer connection, one transaction at a time (see transaction).  At
+    most *pool_size* reader connections are in use at once; a thread needing one
+    beyond that waits for another thread to give its connection back.  Connections
+    used outside of these operations (like db.conn or the iterations of find_iter)
+    are kept by the thread until it ends or calls release.  The database is
+    switched to WAL journaling, so the readers are not blocked by the writer.
+
+    .. code:: python
+
+        >>> db = Database("sqlite:///shapes.db", pool_size=4)
+        >>> shapes = DocumentStore("shapes", db)
+        >>> with ThreadPoolExecutor(4) as pool:
+        ...     results = list(pool.map(shapes.find, queries))
     """
 
-    def __init__(self, connection_string, conn=None, encoder=JsonEncoder):
+    def __init__(
+        self,
+        connection_string,
+        conn=None,
+        encoder=JsonEncoder,
+        pool_size=None,
+        timeout=5.0,
+    ):
+        """
+        :param str connection_string: like sqlite:///path/to/file.db
+        :param conn: an existing database connection to use
+        :param encoder: the encoder for documents.  This may be an encoder class, an
+            encoder instance or the name of a json backend ("orjson", "ujson",
+            "msgspec", "json" or "auto").  Collections use the same json backend.
+        :param int pool_size: the maximum number of reader connections in use by
+            threads at once.  None uses a single connection.  Pooling requires a
+            database file.
+        :param float timeout: seconds a pooled connection waits for a lock held by
+            another connection, and a thread waits for a free reader connection
+            before a sqlite3.OperationalError is raised
+        """
 
         dialect_name = connection_string.partition(":///")[0]
         self.dialect = dialects[dialect_name]()
+        self.connection_string = connection_string
 
-        if conn is None:
-            db_connection_string = connection_string.partition(":///")[-1]
-            self.conn = self.dialect.connect(db_connection_string)
+        if isinstance(encoder, str):
+            encoder = JsonEncoder(backend=encoder)
+        elif isinstance(encoder, type):
+            encoder = encoder()
+        # the encoder used by the field function is set per thread (see encoder)
+        self._encoder = encoder
+        self._local = threading.local()
+
+        # memo of documents decoded by the field function (see _field)
+        self.field_cache_size = 4
+        self.reset_field_stats()
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        if pool_size:
+            if conn is not None:
+                raise ValueError("A pooled database opens its own connections")
+            if connection_string.partition(":///")[-1] in ("", ":memory:"):
+                raise ValueError("A pooled database requires a database file")
+            self._open_pool()
         else:
+            if conn is None:
+                db_connection_string = connection_string.partition(":///")[-1]
+                conn = self.dialect.connect(db_connection_string)
             self.conn = conn
+            self._configure(conn)
 
-        self.connection_string = connection_string
-        self.conn.row_factory = sqlite3.Row
-        self.conn.create_function("field", 2, self._field)
-        self.encoder = encoder()
+    @property
+    def conn(self):
+        """
+        The database connection of the calling thread.  In a pooled database this is
+        the writer connection within a transaction and a reader connection otherwise.
+        """
+        if not self.pool_size:
+            return self._conn
+        local = self._local
+        if getattr(local, "writing", 0):
+            return self._writer
+        lease = getattr(local, "lease", None)
+        if lease is None:
+            lease = local.lease = _Lease(self, self._acquire())
+            leased = getattr(_operation, "leased", None)
+            if leased is not None:
+                leased.append(self)
+        return lease.conn
+
+    @conn.setter
+    def conn(self, conn):
+        self._conn = conn
+
+    @property
+    def default_encoder(self):
+        """
+        The encoder the database was created with.  Unlike encoder, it is not changed
+        by the queries of collections.
+        """
+        return self._encoder
+
+    @property
+    def encoder(self):
+        """
+        The encoder decoding documents in the field function.  Collections set it
+        before their queries, so it is kept per thread.
+        """
+        return getattr(self._local, "encoder", self._encoder)
+
+    @encoder.setter
+    def encoder(self, encoder):
+        self._local.encoder = encoder
+
+    def _field_state(self):
+        """
+        Gets the memo of the field function and its counters [calls, decodes] for
+        the calling thread
+        """
+        try:
+            return self._local.field_state
+        except AttributeError:
+            state = self._local.field_state = ({}, [0, 0])
+            return state
+
+    def _configure(self, conn):
+        """
+        Sets the row factory and registers the field functions on a new connection
+        """
+        conn.row_factory = sqlite3.Row
+        conn.create_function("field", 2, self._field)
+        conn.create_function("field_json", 2, self._field_json)
+
+    def _open(self):
+        """
+        Opens and configures a connection usable by any thread of a pooled database
+        """
+        db_connection_string = self.connection_string.partition(":///")[-1]
+        conn = self.dialect.connect(
+            db_connection_string, check_same_thread=False, timeout=self.timeout
+        )
+        self._configure(conn)
+        return conn
+
+    def _open_pool(self):
+        self._closed = False
+        self._idle = queue.LifoQueue()
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        # one permit per reader connection in use
+        self._leases = threading.BoundedSemaphore(self.pool_size)
+        self._writer = self._open()
+        self._writer.execute("pragma journal_mode = wal")
+
+    def _acquire(self):
+        """
+        Takes an idle reader connection from the pool or opens a new one, waiting up
+        to timeout seconds while pool_size connections are in use
+        """
+        if not self._leases.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                "All {0} connections of the pool are in use. Threads keep their "
+                "connection until they end or call release().".format(self.pool_size)
+            )
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._open()
+        except BaseException:
+            self._leases.release()
+            raise
+
+    def _release(self, conn, pool, leases):
+        """
+        Returns a reader connection to the pool it was taken from, or closes it if
+        that pool was closed
+        """
+        try:
+            if self._closed or pool is not self._idle:
+                conn.close()
+                return
+            if conn.in_transaction:
+                conn.rollback()
+            pool.put(conn)
+        finally:
+            leases.release()
+
+    def release(self):
+        """
+        Returns the reader connection of the calling thread to the pool, so another
+        thread can use it.  This happens automatically when a DocumentStore operation
+        returns or the thread ends.  The thread gets a connection again on its next
+        query.
+        """
+        if self.pool_size:
+            self._local.__dict__.pop("lease", None)
+
+    @contextmanager
+    def writer(self):
+        """
+        Context manager giving the calling thread the connection that writes to the
+        database.  In a pooled database the writer connection is locked until the
+        context exits and the thread's queries use it meanwhile.  The context does not
+        commit (see transaction).
+        """
+        if not self.pool_size:
+            yield self.conn
+            return
+        local = self._local
+        with self._write_lock:
+            local.writing = getattr(local, "writing", 0) + 1
+            try:
+                yield self._writer
+            finally:
+                local.writing -= 1
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager for writing to the database.  It gives the writer connection
+        (see writer) and commits when the context exits, or rolls back on an error.
+
+        .. code:: python
+
+            >>> with db.transaction() as conn:
+            ...     conn.execute("delete from collectionj_shapes")
+        """
+        with self.writer() as conn:
+            with conn:
+                yield conn
 
     def cursor(self):
         """
@@ -147,14 +485,31 @@ class Database(object):
         """
         Establish a connection to the database
         """
+        if self.pool_size:
+            self._open_pool()
+            return
         db_connection_string = self.connection_string.partition(":///")[-1]
         self.conn = self.dialect.connect(db_connection_string)
+        self._configure(self.conn)
 
     def close(self):
         """
-        Close the database connection
+        Close the database connection.  A pooled database closes all its idle
+        connections, the calling thread's connection and the writer.  Connections in
+        use by other threads are closed when they are released.
         """
-        self.conn.close()
+        if not self.pool_size:
+            self.conn.close()
+            return
+        self._closed = True
+        self.release()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            self._writer.close()
 
     def reopen(self):
         """
@@ -168,7 +523,13 @@ class Database(object):
         Closes and reestablishes the database connection
         """
         cls = type(self)
-        return cls(self.connection_string, None, encoder=self.encoder)
+        return cls(
+            self.connection_string,
+            None,
+            encoder=self.default_encoder,
+            pool_size=self.pool_size,
+            timeout=self.timeout,
+        )
 
     def tables(self):
         """
@@ -227,6 +588,18 @@ class Database(object):
 
         return table_name in self.tables()
 
+    def has_json1(self):
+        """
+        Tells if the SQLite library supports the JSON1 functions (like json_extract)
+        """
+        if getattr(self, "_has_json1", None) is None:
+            try:
+                self.conn.execute("select json_extract('{\"a\": 1}', '$.a')")
+                self._has_json1 = True
+            except sqlite3.OperationalError:
+                self._has_json1 = False
+        return self._has_json1
+
     def encode(self, val):
         """
         Encodes the given value to be stored in the collection table
@@ -253,7 +626,18 @@ class Database(object):
         :param val: the value from the database
         :param f: the name of the field to retrieve.  It can be mutltipart like a.b
         """
-        val = self.decode(val)
+        # a query referencing several attributes calls this once per attribute for
+        # the same row, so recently decoded documents are remembered
+        cache, counts = self._field_state()
+        counts[0] += 1
+        doc = cache.get(val)
+        if doc is None:
+            doc = self.decode(val)
+            counts[1] += 1
+            cache[val] = doc
+            if len(cache) > self.field_cache_size:
+                del cache[next(iter(cache))]
+        val = doc
 
         if "." in f:
             fs = f.split(".")
@@ -272,6 +656,35 @@ class Database(object):
             else:
                 return None
 
+    def _field_json(self, val, f):
+        """
+        Like the *field* function, but returns the value json encoded, so objects and
+        lists can be returned to sqlite as well
+        """
+        return get_json_backend().dumps(self._field(val, f))
+
+    def clear_field_cache(self):
+        """
+        Forgets the documents decoded by the field function.  This is done before
+        each query, as the encoder may change between collections.
+        """
+        self._field_state()[0].clear()
+
+    def field_stats(self):
+        """
+        Returns a dict with the number of calls of the field function, the number
+        of documents it decoded and the number of decodes saved by its memo.  Like
+        the memo, the counters are kept per thread.
+        """
+        calls, decodes = self._field_state()[1]
+        return {"calls": calls, "decodes": decodes, "saved": calls - decodes}
+
+    def reset_field_stats(self):
+        """
+        Resets the counters reported by field_stats (of the calling thread)
+        """
+        self._field_state()[1][:] = [0, 0]
+
     @classmethod
     def from_sa_session(cls, sa_session):
         """
@@ -406,6 +819,121 @@ def render_simple_op(func_str, children):
     return column_name + " " + func_str, tuple()
 
 
+def json_path(attribute):
+    """
+    Converts a dotted attribute name like 'a.b' to a JSON path like '$.a.b' for
+    SQLite's json functions
+    """
+    path = "$"
+    for part in attribute.split("."):
+        if part.isidentifier():
+            path += "." + part
+        else:
+            path += '."' + part.replace('"', '\\"') + '"'
+    return path
+
+
+def quote_sql_string(val):
+    """
+    Quotes *val* as an sql string literal
+    """
+    return "'" + val.replace("'", "''") + "'"
+
+
+# the sqlite pragmas DocumentStore.bulk_load(..., pragmas=True) applies.  The database may
+# be corrupted if the computer crashes (not the application) during the load.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "off",
+    "temp_store": "memory",
+}
+
+# the sql functions DocumentStore.aggregate may compute
+AGGREGATE_FUNCTIONS = ("count", "sum", "total", "avg", "min", "max")
+
+# find(..., parallel=N) decodes in worker processes only from this many rows on.
+# Below it, starting the work in the workers costs more than it saves.
+PARALLEL_DECODE_MIN_ROWS = 20000
+
+# the number of rowids looked up by one query of _fetch_documents
+FETCH_BATCH_SIZE = 500
+
+# process pools for parallel decoding by number of workers
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def _process_pool(workers):
+    """
+    Gets the process pool with *workers* processes, which is kept for later queries
+    """
+    with _process_pools_lock:
+        pool = _process_pools.get(workers)
+        if pool is None:
+            # forked workers would inherit the locks and sqlite connections of the
+            # threads of this process, so they are started as fresh interpreters
+            pool = _process_pools[workers] = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+    return pool
+
+
+@atexit.register
+def _shutdown_process_pools():
+    """
+    Stops the worker processes of the pools, when the interpreter exits
+    """
+    with _process_pools_lock:
+        pools = list(_process_pools.values())
+        _process_pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+
+def _returned_document(doc, as_dicts=True):
+    """
+    Gets an inserted document as insert returns it: dataclasses as dicts if
+    *as_dicts* is True
+    """
+    if as_dicts and is_dataclass(doc):
+        return asdict(doc)
+    return doc
+
+
+# the read connections of a worker process by database file
+_worker_connections = {}
+
+
+def _fetch_documents(conn, table, rowids):
+    """
+    Fetches the stored documents of the rows *rowids* of the collection *table*, in
+    the order of *rowids*
+    """
+    found = {}
+    for i in range(0, len(rowids), FETCH_BATCH_SIZE):
+        batch = rowids[i : i + FETCH_BATCH_SIZE]
+        cmd = "select rowid, Document from {0} where rowid in ({1})".format(
+            dialect.qname(table), ", ".join("?" * len(batch))
+        )
+        found.update((row[0], row[1]) for row in conn.execute(cmd, batch))
+    return [found[rowid] for rowid in rowids]
+
+
+def _decode_chunk(path, table, encoder, rowids, dtype):
+    """
+    Fetches the documents of the rows *rowids* from the database file *path* (in a
+    worker process), decodes them and builds dataclasses of *dtype* from them.  Only
+    the rowids are sent to the worker, so the parent does not handle the documents.
+    """
+    conn = _worker_connections.get(path)
+    if conn is None:
+        conn = _worker_connections[path] = sqlite3.connect(path)
+    docs = [encoder.decode(blob) for blob in _fetch_documents(conn, table, rowids)]
+    if dtype is not None:
+        docs = list(from_dicts(docs, dtype, columnar=True))
+    return docs
+
+
 attribute_regex = re.compile(
     r"(\@\S+\b)"
 )  # an attribute in a query string is preceded by an @ character
@@ -417,50 +945,126 @@ class DocumentStore(object):
 
     """
 
-    def __init__(self, name, db=None, use_zlib_encoder=False, dtype=None):
+    @_pooled_operation
+    def __init__(
+        self,
+        name,
+        db=None,
+        use_zlib_encoder=False,
+        dtype=None,
+        json_backend=None,
+        use_binary_encoder=False,
+        compression=None,
+        compression_level=None,
+        cache_size=None,
+    ):
         """
         Initializes the collection class
         :param str name: name of the collection
         :param Database db: database being used
         :param bool use_zlib_encoder: whether or not to use compression on the json blobs
         :param type dtype: dataclass type that can be inserted and retrieved from the collection
+        :param str json_backend: the json library used for the documents (see
+            encoders.get_json_backend).  By default the json encoder of the database
+            is used, with its backend and allow_nan setting.
+        :param bool use_binary_encoder: whether or not to store the documents as binary
+            MessagePack blobs instead of json.  This requires the msgpack library.
+        :param str compression: compress the json documents with this algorithm
+            ("zlib", "zstd" or "lz4").  A shared dictionary for the compression can be
+            trained with train_dictionary.
+        :param int compression_level: the compression level for *compression*
+        :param int cache_size: keep up to this many of the documents read by get and
+            get_many in a least recently used cache.  None disables the cache.
         """
 
         self.name = name
         self.dtype = dtype
+        # documents read by get and get_many by ID, least recently used first
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # incremented by every invalidation, so reads started before an
+        # invalidation do not put outdated documents into the cache
+        self._cache_generation = 0
+        self.reset_cache_stats()
+        # read @attributes with json_extract when possible (see uses_json1)
+        self.use_json1 = True
+        # called with the QueryPlan of queries that read attributes from every
+        # document, like warn_full_scan
+        self.full_scan_hook = None
 
         if isinstance(db, str):
             # a connection string was provided
             db = Database(db)
         self.db = db
 
+        json_encoder = db.default_encoder
+        if not isinstance(json_encoder, JsonEncoder):
+            json_encoder = JsonEncoder(backend=json_backend)
+        elif json_backend not in (None, json_encoder.backend.name):
+            json_encoder = JsonEncoder(json_backend, json_encoder.allow_nan)
+
         tables = db.tables()
         if ("collectionj_" + name) in tables:
             # table exists and uses a json encoder
             self.table_name = "collectionj_" + name
-            self._encoder = JsonEncoder()
+            self._encoder = json_encoder
         elif ("collection_" + name) in tables:
             # table exists and uses a json encoder
             self.table_name = "collection_" + name
-            self._encoder = JsonEncoder()
+            self._encoder = json_encoder
         elif ("collectionz_" + name) in tables:
             # tables exists and uses a zlib encoder
             self.table_name = "collectionz_" + name
-            self._encoder = ZlibEncoder()
+            self._encoder = ZlibEncoder(json_encoder)
+        elif ("collectionb_" + name) in tables:
+            # tables exists and uses a binary (MessagePack) encoder.  Without the
+            # msgpack library it stays readable with the pure python one.
+            self.table_name = "collectionb_" + name
+            self._encoder = MsgPackEncoder(accelerated=HAS_MSGPACK)
+        elif ("collectionc_" + name) in tables:
+            # tables exists and uses a compressed encoder described in its metadata
+            self.table_name = "collectionc_" + name
+            metadata = self.get_metadata()
+            self._encoder = CompressedEncoder(
+                metadata["algorithm"],
+                metadata.get("level"),
+                metadata.get("dictionary"),
+                json_encoder,
+            )
         else:
             # table does not exist
-            if use_zlib_encoder:
+            if compression:
+                self.table_name = "collectionc_" + name
+                self._encoder = CompressedEncoder(
+                    compression, compression_level, None, json_encoder
+                )
+            elif use_binary_encoder:
+                self.table_name = "collectionb_" + name
+                self._encoder = MsgPackEncoder()
+            elif use_zlib_encoder:
                 self.table_name = "collectionz_" + name
-                self._encoder = ZlibEncoder()
+                self._encoder = ZlibEncoder(json_encoder)
             else:
                 self.table_name = "collectionj_" + name
-                self._encoder = JsonEncoder()
+                self._encoder = json_encoder
 
             self.create()
+
+        if (
+            isinstance(self._encoder, JsonEncoder)
+            and self._encoder.allow_nan
+            and self.find_expression_indexes()
+        ):
+            # the documents must stay readable by the json_extract of the indexes
+            self._encoder = JsonEncoder(
+                self._encoder.backend.name, allow_nan=False, **self._encoder._kwargs
+            )
         # self.db.encoder = self._encoder
         # if not self.table_name in tables:
         #     self.create()
 
+    @_pooled_operation
     def create(self, index_attributes=None):
         """
         Creates the collection in the database
@@ -469,7 +1073,116 @@ class DocumentStore(object):
 
         cmd = dialect.render_table(self.table_name, COLLECTION_SCHEMA)
 
-        self.db.cursor().execute(cmd)
+        with self.db.transaction() as conn:
+            conn.execute(cmd)
+
+        if isinstance(self._encoder, CompressedEncoder):
+            self.set_metadata("algorithm", self._encoder.algorithm)
+            self.set_metadata("level", self._encoder.level)
+
+    def get_metadata_table_name(self):
+        """
+        Gets the name of the table holding metadata (like the compression settings)
+        of this collection.
+        """
+        return "metadata_on_" + self.name
+
+    @_pooled_operation
+    def get_metadata(self):
+        """
+        Returns a dict of the metadata stored for this collection
+        """
+        table = self.get_metadata_table_name()
+        if table not in self.db.tables():
+            return {}
+        cmd = dialect.render_select(table, ["Key", "Value"])
+        return {row["Key"]: row["Value"] for row in self.db.conn.execute(cmd)}
+
+    @_pooled_operation
+    def set_metadata(self, key, value):
+        """
+        Stores a metadata value for this collection
+        """
+        table = self.get_metadata_table_name()
+        cmd_table = dialect.render_table(table, METADATA_SCHEMA)
+        cmd, params = dialect.render_insert(
+            table, {"Key": key, "Value": value}, on_conflict="replace"
+        )
+        with self.db.transaction() as conn:
+            conn.execute(cmd_table)
+            conn.execute(cmd, params)
+
+    @_pooled_operation
+    def train_dictionary(
+        self, sample_size=1000, dictionary_size=16384, batch_size=1000
+    ):
+        """
+        Trains a compression dictionary from a random sample of the documents of a
+        compressed collection and stores it in the collection's metadata.  All
+        documents are then recompressed with the new dictionary.
+
+        :param int sample_size: the number of documents to sample
+        :param int dictionary_size: the maximum size of the dictionary in bytes
+        :param int batch_size: the number of documents recompressed at a time
+        :returns: a dict with the number of documents and their total size before and
+            after recompression
+        """
+        if not isinstance(self._encoder, CompressedEncoder):
+            raise TypeError(
+                "Collection {0} is not compressed. Create it with "
+                "DocumentStore(..., compression=...)".format(self.name)
+            )
+
+        old_encoder = self._encoder
+        base_encoder = old_encoder.base_encoder
+
+        cmd = "select Document from {t} order by random() limit ?".format(
+            t=dialect.qname(self.table_name)
+        )
+        samples = [
+            base_encoder.encode(old_encoder.decode(row["Document"])).encode("utf-8")
+            for row in self.db.conn.execute(cmd, (int(sample_size),))
+        ]
+        dictionary = train_dictionary(samples, dictionary_size, old_encoder.algorithm)
+        new_encoder = old_encoder.with_dictionary(dictionary)
+
+        stats = {"documents": 0, "bytes_before": 0, "bytes_after": 0}
+        cmd_select = (
+            "select ID, Document from {t} where ID > ? order by ID limit ?".format(
+                t=dialect.qname(self.table_name)
+            )
+        )
+        cmd_update, __ = dialect.render_update(
+            self.table_name, "Document", None, "ID", None
+        )
+
+        # recompress in keyset ordered batches within one transaction
+        with self.db.transaction() as conn:
+            last_id = ""
+            while True:
+                rows = conn.execute(cmd_select, (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for row in rows:
+                    doc = old_encoder.decode(row["Document"])
+                    encoded = new_encoder.encode(doc)
+                    stats["bytes_before"] += len(row["Document"])
+                    stats["bytes_after"] += len(encoded)
+                    updates.append((encoded, row["ID"]))
+                conn.executemany(cmd_update, updates)
+                stats["documents"] += len(rows)
+                last_id = rows[-1]["ID"]
+
+            cmd, params = dialect.render_insert(
+                self.get_metadata_table_name(),
+                {"Key": "dictionary", "Value": dictionary},
+                on_conflict="replace",
+            )
+            conn.execute(cmd, params)
+
+        self._encoder = new_encoder
+        return stats
 
     def encode(self, val):
         """
@@ -491,15 +1204,54 @@ class DocumentStore(object):
         """
         return "index_" + attribute_name + "_on_" + self.name
 
+    def get_composite_index_name(self, attributes):
+        """
+        Gets the name of a composite index table for the given attribute names.
+        It does not gaurantee the indexes existance.
+        """
+        return "cindex_" + ",".join(attributes) + "_on_" + self.name
+
+    def get_expression_index_name(self, attribute_name):
+        """
+        Gets the name of an expression index for the given attribute name (or tuple of
+        attribute names).  It does not gaurantee the indexes existance.
+        """
+        if isinstance(attribute_name, tuple):
+            attribute_name = ",".join(attribute_name)
+        return "exprindex_" + attribute_name + "_on_" + self.name
+
+    @staticmethod
+    def _index_key(attribute_name):
+        """
+        Normalizes the attribute name(s) of an index.  A single attribute is a str and
+        several attributes are a tuple.
+        """
+        if isinstance(attribute_name, (list, tuple)):
+            if len(attribute_name) == 1:
+                return attribute_name[0]
+            return tuple(attribute_name)
+        return attribute_name
+
+    @_pooled_operation
     def has_index(self, attribute_name):
         """
-        Returns true if an index table for this attribute exists
+        Returns true if an index table or an expression index for this attribute (or
+        list of attributes) exists
         """
-        index_name = self.get_index_name(attribute_name)
+        key = self._index_key(attribute_name)
+        if isinstance(key, tuple):
+            index_name = self.get_composite_index_name(key)
+        else:
+            index_name = self.get_index_name(key)
 
-        return index_name in self.db.tables()
+        return (index_name in self.db.tables()) or (
+            key in self.find_expression_indexes()
+        )
 
-    def add_index(self, attribute_name, sqltype, suppress_warning=False):
+    @_pooled_operation
+    def add_index(
+        self, attribute_name, sqltype=None, suppress_warning=False, mode="table"
+    ):
         """
         Adds an tables into the database name like *index_{attribute_name}_on_{table_name}.
         This index is joined to the collection table at query time and should speed up queries,
@@ -510,7 +1262,32 @@ class DocumentStore(object):
         sqltype may be: REAL, INTEGER, TEXT, BLOB
 
         Additionally sqlite itself indexes this index table to make searches on it fast.
+
+        If *attribute_name* is a list of attributes (like ["color", "dims.width"]) a
+        composite index table *cindex_{attributes}_on_{table_name}* with one column per
+        attribute is created, and sqlite indexes these columns together.  A query
+        filtering or ordering on several of the attributes then joins this one table
+        instead of one table per attribute.  *sqltype* may be a list with one type per
+        attribute; by default the columns are untyped.  Documents missing some of the
+        attributes are stored with NULL values.
+
+        With mode="expression" an index on the json_extract expression reading the
+        attribute is created on the collection table itself instead
+        (*exprindex_{attribute_name}_on_{table_name}*).  SQLite maintains it as documents
+        are inserted, updated and deleted, and queries use it without a join.  This
+        requires a json encoded collection whose encoder writes strict json
+        (JsonEncoder(allow_nan=False)) and an SQLite library with JSON1.  *sqltype* is
+        not used in this mode.
         """
+        attribute_name = self._index_key(attribute_name)
+        if mode == "expression":
+            return self._add_expression_index(attribute_name, suppress_warning)
+        elif mode != "table":
+            raise ValueError('Index mode must be "table" or "expression"')
+
+        if isinstance(attribute_name, tuple):
+            return self._add_composite_index(attribute_name, sqltype, suppress_warning)
+
         index_name = self.get_index_name(attribute_name)
 
         if index_name in self.db.tables():
@@ -529,97 +1306,292 @@ class DocumentStore(object):
 
             fk = Relationship("ID", self.table_name, "ID", ondelete="CASCADE")
             cmd = dialect.render_table(index_name, IndexSchema, [fk])
-            # print(cmd)
-            self.db.conn.execute(cmd)
-
             index_cmd = dialect.render_index(
                 name="index_" + index_name, table=index_name, attribute=attribute_name
             )
 
-            self.db.conn.execute(index_cmd)
+            with self.db.transaction() as conn:
+                conn.execute(cmd)
+                conn.execute(index_cmd)
 
-    def update_index(self, attribute_name, echo_sql=False):
+    def _add_composite_index(self, attributes, sqltype=None, suppress_warning=False):
         """
-        Parses the json documents and populats the index tables associated with *attribute_name*
+        Creates an index table with a column for each of the *attributes*
         """
-        index_name = self.get_index_name(attribute_name)
+        index_name = self.get_composite_index_name(attributes)
 
-        cmd_find = dialect.render_select(
-            self.table_name,
-            dict([("ID", "ID"), ("@" + attribute_name, attribute_name)]),
-        )
-        cmd_find = self._resolve_attributes(cmd_find)
+        if index_name in self.db.tables():
+            if not suppress_warning:
+                msg = (
+                    "Index of attributes {0} on collection {1} not created "
+                    "because it already exists.".format(attributes, self.name)
+                )
+                warn(msg)
+            return
+
+        if not isinstance(sqltype, (list, tuple)):
+            sqltype = [sqltype] * len(attributes)
+
+        IndexSchema = [
+            Column(name="ID", dtype="CHAR(32)", primary_key=True, nullable=False)
+        ]
+        for attribute, ty in zip(attributes, sqltype):
+            IndexSchema.append(Column(name=attribute, dtype=ty or ""))
+
+        fk = Relationship("ID", self.table_name, "ID", ondelete="CASCADE")
+        cmd = dialect.render_table(index_name, IndexSchema, [fk])
 
-        # cmd_insert1 = 'insert into ' + index_name + '(ID,' + attribute_name + ') values(?,?)'
-        cmd_insert, __ = dialect.render_insert(
-            index_name, dict([("ID", None), (attribute_name, None)])
+        # the ID makes the index covering for the join with the collection table
+        index_cmd = dialect.render_index(
+            name="index_" + index_name,
+            table=index_name,
+            attribute=list(attributes) + ["ID"],
         )
-        # cmd_update = 'update ' + index_name + ' set ' + attribute_name + ' = ? where ID = ?'
-        cmd_update, __ = dialect.render_update(
-            index_name, attribute_name, None, "ID", None
+        with self.db.transaction() as conn:
+            conn.execute(cmd)
+            conn.execute(index_cmd)
+        self.find_composite_indexes(relook=True)
+
+    def _add_expression_index(self, attribute_name, suppress_warning=False):
+        """
+        Creates an index on the expression reading *attribute_name* from the documents
+        """
+        if not self.uses_json1():
+            raise ValueError(
+                "Expression indexes require a json encoded collection with strict "
+                "json (JsonEncoder(allow_nan=False)) and SQLite JSON1 support. Use "
+                "add_index(..., mode='table') for collection {0}".format(self.name)
+            )
+
+        if attribute_name in self.find_expression_indexes(relook=True):
+            if not suppress_warning:
+                msg = (
+                    "Index of attribute {0} on collection {1} not created "
+                    "because it already exists.".format(attribute_name, self.name)
+                )
+                warn(msg)
+            return
+
+        if isinstance(attribute_name, tuple):
+            expression = ", ".join(self._attribute_sql(a) for a in attribute_name)
+        else:
+            expression = self._attribute_sql(attribute_name)
+        index_cmd = dialect.render_expression_index(
+            self.get_expression_index_name(attribute_name),
+            self.table_name,
+            expression,
         )
+        with self.db.transaction() as conn:
+            conn.execute(index_cmd)
+        self.find_expression_indexes(relook=True)
 
-        # if the index does not exist, infer the type and create it
-        if attribute_name not in self.find_indexes():
-            try:
-                cursor_find = self.db.conn.execute(cmd_find)
-                result = cursor_find.fetchone()
-                ty = type(result[attribute_name])
-                sqltype = dialect.typemap[ty]
-                self.add_index(attribute_name, sqltype)
-            except:  # nopep8
-                raise DocumentStoreNotFound(
-                    'Index "{0}" not found and type '
-                    "could not be inferred for auto creation.".format(index_name)
+    @_pooled_operation
+    def find_expression_indexes(self, relook=False):
+        """
+        Returns a dict of expression indexes on the collection table.  The keys are the
+        attribute names (tuples of them for composite indexes) and the values are the
+        names of the indexes.
+        """
+        self._expression_indexes = getattr(self, "_expression_indexes", None)
+        if (self._expression_indexes is None) or (relook):
+            prefix = "exprindex_"
+            suffix = "_on_" + self.name
+            self._expression_indexes = {}
+            for name in dialect.get_indexes(self.db.conn, self.table_name):
+                if name.startswith(prefix) and name.endswith(suffix):
+                    attribute = name[len(prefix) : -len(suffix)]
+                    if "," in attribute:
+                        attribute = tuple(attribute.split(","))
+                    self._expression_indexes[attribute] = name
+
+        return self._expression_indexes
+
+    def get_change_log_name(self):
+        """
+        Gets the name of the table logging the IDs of changed documents, which is used
+        by incremental index updates.  It does not gaurantee the tables existance.
+        """
+        return "changes_on_" + self.name
+
+    def _track_changes(self):
+        """
+        Creates the change log table and the triggers on the collection table that
+        record the ID of every inserted, updated or deleted document in it, together
+        with an increasing sequence number.  The sequence is an autoincrement key, so
+        it keeps increasing after the processed changes are pruned from the log.
+        """
+        log_name = self.get_change_log_name()
+        if log_name in self.db.tables():
+            return
+
+        LogSchema = [
+            Column(name="Seq", dtype="INTEGER", primary_key=True, autoinc=True),
+            Column(name="ID", dtype="CHAR(32)", nullable=False, unique=True),
+        ]
+        log = dialect.qname(log_name)
+        # replacing the row of a document moves it to the next sequence number
+        cmd_trigger = (
+            "create trigger if not exists {n} after {e} on {t} begin "
+            "insert or replace into {log} (ID) values ({r}.ID); end"
+        )
+        with self.db.transaction() as conn:
+            conn.execute(dialect.render_table(log_name, LogSchema))
+            for event, row in (("insert", "new"), ("update", "new"), ("delete", "old")):
+                conn.execute(
+                    cmd_trigger.format(
+                        n=dialect.qname(event + "_" + log_name),
+                        e=event,
+                        t=dialect.qname(self.table_name),
+                        log=log,
+                        r=row,
+                    )
                 )
 
-        # now do the update
-        cursor_find = self.db.conn.execute(cmd_find)
-        result = cursor_find.fetchmany(10)
-        cursor_insert = self.db.conn.cursor()
-        while result:
+    @_pooled_operation
+    def update_index(self, attribute_name, echo_sql=False, incremental=False):
+        """
+        Parses the json documents and populats the index tables associated with *attribute_name*
+
+        The index table is rebuilt with one set based upsert of the attribute of every
+        document and one delete of the rows whose document is gone or no longer has the
+        attribute, in a single transaction.
+
+        :param attribute_name: the indexed attribute, or a list of attributes for a
+            composite index
+        :param bool echo_sql: print the sql commands being executed
+        :param bool incremental: only update the index rows of the documents changed
+            since the last update of this index.  The first incremental update starts
+            logging the changed documents (see get_change_log_name) and does a full
+            rebuild.
+        """
+        attribute_name = self._index_key(attribute_name)
+        if attribute_name in self.find_expression_indexes():
+            # expression indexes are kept up to date by SQLite
+            return
 
-            for doc in result:
-                # print(*r)
+        if isinstance(attribute_name, tuple):
+            attributes = attribute_name
+            index_name = self.get_composite_index_name(attributes)
+            if index_name not in self.db.tables():
+                self._add_composite_index(attributes)
+            expressions = [self._resolve_attributes("@" + a) for a in attributes]
+            # composite index tables have a row for every document
+            condition = "1"
+        else:
+            attributes = (attribute_name,)
+            index_name = self.get_index_name(attribute_name)
+            expression = self._resolve_attributes("@" + attribute_name)
+            expressions = [expression]
+            condition = "{0} is not null".format(expression)
+
+            # if the index does not exist, infer the type and create it
+            if attribute_name not in self.find_indexes():
+                cmd_find = dialect.render_select(
+                    self.table_name,
+                    dict([("@" + attribute_name, attribute_name)]),
+                    where=condition,
+                    limit=1,
+                )
+                cmd_find = self._resolve_attributes(cmd_find)
                 try:
-                    if echo_sql:
-                        print("Trying Insert:")
-                        print("    " + cmd_insert, (doc["ID"], doc[attribute_name]))
-                    cursor_insert.execute(cmd_insert, (doc["ID"], doc[attribute_name]))
-                except sqlite3.IntegrityError as err:
-                    if echo_sql:
-                        print("Insert failed trying update:")
-                        print("    " + cmd_insert, (doc["ID"], doc[attribute_name]))
-                    cursor_insert.execute(cmd_update, (doc[attribute_name], doc["ID"]))
-
-            result = cursor_find.fetchmany()
-
-        self.db.conn.commit()
-
-        # update the other.  look for items in the index who no longer have matching items in the
-        # collection table
-        cmd_find_index = dialect.render_select(index_name, "ID")
-        cursor_find_index = self.db.conn.execute(cmd_find_index)
-        result = cursor_find_index.fetchmany()
-        cmd_find_table = dialect.render_select(self.table_name, "ID", where="ID = ?")
-        cmd_delete, __ = dialect.render_delete(index_name, "ID", None)
-
-        while result:
-            # loop over rows in the index table
-            for doc in result:
-                # look for rows in the colleciton table with a matching ID
-                inner_cursor = self.db.conn.cursor()
-                inner_cursor.execute(cmd_find_table, (doc["ID"],))
-                inner_result = inner_cursor.fetchone()
-                if not inner_result:
-                    # if a matching id is not found, delete the row in the index table
-                    # because it nows points to nothing.
-                    inner_cursor.execute(cmd_delete, (doc["ID"],))
-
-            result = cursor_find_index.fetchmany()
-
-        self.db.conn.commit()
+                    result = self.db.conn.execute(cmd_find).fetchone()
+                    ty = type(result[attribute_name])
+                    sqltype = dialect.typemap[ty]
+                    self.add_index(attribute_name, sqltype)
+                    self.find_indexes(relook=True)
+                except:  # nopep8
+                    raise DocumentStoreNotFound(
+                        'Index "{0}" not found and type '
+                        "could not be inferred for auto creation.".format(index_name)
+                    )
+
+        if incremental:
+            self._track_changes()
+
+        log_name = self.get_change_log_name()
+        tracked = log_name in self.db.tables()
+        seq_key = "index_seq:" + index_name
+        last_seq = self.get_metadata().get(seq_key) if tracked else None
+        if tracked:
+            with self.db.transaction() as conn:
+                conn.execute(
+                    dialect.render_table(
+                        self.get_metadata_table_name(), METADATA_SCHEMA
+                    )
+                )
+
+        columns = [dialect.qname(a) for a in attributes]
+        values = dict(
+            i=dialect.qname(index_name),
+            a=", ".join(columns),
+            set=", ".join("{0} = excluded.{0}".format(c) for c in columns),
+            changed=" or ".join("{0} is not excluded.{0}".format(c) for c in columns),
+            t=dialect.qname(self.table_name),
+            log=dialect.qname(log_name),
+            e=", ".join(expressions),
+            cond=condition,
+        )
+        if incremental and last_seq is not None:
+            # only the documents logged after the last update
+            cmd_upsert = (
+                "insert into {i} (ID, {a}) "
+                "select {t}.ID, {e} from {t} join {log} on {log}.ID = {t}.ID "
+                "where {log}.Seq > ? and {log}.Seq <= ? and {cond} "
+                "on conflict(ID) do update set {set} where {changed}"
+            ).format(**values)
+            cmd_delete = (
+                "delete from {i} where ID in "
+                "(select ID from {log} where Seq > ? and Seq <= ?) "
+                "and ID not in (select {t}.ID from {t} join {log} on {log}.ID = {t}.ID "
+                "where {log}.Seq > ? and {log}.Seq <= ? and {cond})"
+            ).format(**values)
+        else:
+            cmd_upsert = (
+                "insert into {i} (ID, {a}) "
+                "select ID, {e} from {t} where {cond} "
+                "on conflict(ID) do update set {set} where {changed}"
+            ).format(**values)
+            cmd_delete = (
+                "delete from {i} where ID not in (select ID from {t} where {cond})"
+            ).format(**values)
+
+        with self.db.transaction() as conn:
+            params = ()
+            if tracked:
+                # the last sequence number handed out, even if its change was pruned
+                cmd_seq = (
+                    "select coalesce(max(seq), 0) as Seq from sqlite_sequence "
+                    "where name = ?"
+                )
+                seq = conn.execute(cmd_seq, (log_name,)).fetchone()["Seq"]
+                if incremental and last_seq is not None:
+                    params = (last_seq, seq)
+
+            if echo_sql:
+                print(cmd_upsert, params)
+                print(cmd_delete, params + params)
+            conn.execute(cmd_upsert, params)
+            conn.execute(cmd_delete, params + params)
+
+            if tracked:
+                cmd, params = dialect.render_insert(
+                    self.get_metadata_table_name(),
+                    {"Key": seq_key, "Value": seq},
+                    on_conflict="replace",
+                )
+                conn.execute(cmd, params)
 
+                # forget the changes every incrementally updated index has seen
+                metadata = self.get_metadata()
+                seqs = [
+                    metadata["index_seq:" + t]
+                    for t, __, __ in self._index_tables()
+                    if "index_seq:" + t in metadata
+                ]
+                cmd_prune = "delete from {log} where Seq <= ?".format(**values)
+                conn.execute(cmd_prune, (min(seqs),))
+
+    @_pooled_operation
     def find_indexes(self, relook=False):
         """
         Returns a dict of indexes for this table.  The keys are the attribute names that indexed and
@@ -639,107 +1611,203 @@ class DocumentStore(object):
 
         return self._indexes
 
-    def insert(self, doc, upsert=False):
+    @_pooled_operation
+    def find_composite_indexes(self, relook=False):
         """
-        Inserts a document into the collection table
-
-        :param dict doc: the document (dict) to insert
-        :param bool upsert: If True and the document already exists,
-            then the existing document is updated
+        Returns a dict of composite index tables for this table.  The keys are tuples of
+        the indexed attribute names and the values are the names of the index tables.
         """
+        self._composite_indexes = getattr(self, "_composite_indexes", None)
+        if (not self._composite_indexes) or (relook):
+            prefix = "cindex_"
+            suffix = "_on_" + self.name
 
-        if is_dataclass(doc):
-            doc_obj = doc
-            doc = asdict(doc_obj)
+            self._composite_indexes = {}
 
-        doc["ID"] = doc.get("ID", uuid.uuid1().hex)
+            for t in self.db.tables():
+                if t.startswith(prefix) and t.endswith(suffix):
+                    attributes = tuple(t[len(prefix) : -len(suffix)].split(","))
+                    self._composite_indexes[attributes] = t
 
-        encoded_item = self.encode(doc)
-        # cmd1 = 'insert into {n} values(?,?)'.format(n=self.table_name)
-        cmd, params = dialect.render_insert(
-            self.table_name, {"ID": doc["ID"], "Document": encoded_item}
-        )
+        return self._composite_indexes
 
-        indexes = self.find_indexes()
+    def _index_tables(self):
+        """
+        Returns a list of (index table, attributes, default) for the index tables of
+        this collection.  *default* is the value stored for documents missing an
+        attribute, which is Unset (not allowed) for single attribute index tables.
+        """
+        tables = [(t, (a,), Unset) for a, t in self.find_indexes().items()]
+        tables.extend(
+            (t, attributes, None)
+            for attributes, t in self.find_composite_indexes().items()
+        )
+        return tables
 
-        with self.db.conn as conn:
+    def _get_index_row(self, uid, doc, attributes, default=Unset):
+        """
+        Gets the row of an index table on *attributes* for the document *doc*
+        """
+        return (uid,) + tuple(self._get_attribute(doc, a, default) for a in attributes)
+
+    def _prepare_document(self, doc):
+        """
+        Returns the ID of *doc* and the object to encode for it.  Dataclasses with an
+        ID are encoded directly, other documents are converted to dicts and given an
+        ID if they do not have one.
+        """
+        if is_dataclass(doc):
+            uid = getattr(doc, "ID", None)
+            if uid is not None and uid is not Unset:
+                return uid, doc
+            doc = asdict(doc)
+
+        doc["ID"] = doc.get("ID", uuid.uuid1().hex)
+        return doc["ID"], doc
+
+    def _get_attribute(self, doc, attribute_name, default=Unset):
+        """
+        Gets the value of the attribute *attribute_name* of a document (dict) or a
+        dataclass instance, as it is stored in the encoded document.  Nested attributes
+        are given with dots like 'a.b'.  If the attribute is missing *default* is
+        returned, or a KeyError is raised if no default is given.
+        """
+        val = doc
+        for part in attribute_name.split("."):
+            if is_dataclass(val):
+                name = get_json_key_map(type(val)).get(part, part)
+                val = getattr(val, name, Unset)
+            elif isinstance(val, dict):
+                val = val.get(part, Unset)
+            else:
+                val = Unset
+            if val is Unset:
+                if default is Unset:
+                    raise KeyError(attribute_name)
+                return default
+        return to_document_value(val)
+
+    @_pooled_operation
+    def insert(self, doc, upsert=False, as_dicts=True):
+        """
+        Inserts a document into the collection table
+
+        :param dict doc: the document (dict or dataclass) to insert
+        :param bool upsert: If True and the document already exists,
+            then the existing document is updated
+        :param bool as_dicts: return dataclasses with an ID as dicts (like asdict).
+            With False they are returned as they are, which saves building the dicts.
+        :returns: the inserted document
+        """
+
+        uid, doc = self._prepare_document(doc)
+
+        encoded_item = self.encode(doc)
+        # cmd1 = 'insert into {n} values(?,?)'.format(n=self.table_name)
+        cmd, params = dialect.render_insert(
+            self.table_name, {"ID": uid, "Document": encoded_item}
+        )
+
+        index_tables = self._index_tables()
+
+        with self.db.transaction() as conn:
             try:
                 conn.execute(cmd, params)
 
-                for attribute_name in indexes:
-                    index_name = indexes[attribute_name]
+                for index_name, attributes, default in index_tables:
                     cmd_insert, __ = dialect.render_insert(
-                        index_name, dict([("ID", None), (attribute_name, None)])
+                        index_name, dict.fromkeys(("ID",) + attributes)
+                    )
+                    conn.execute(
+                        cmd_insert,
+                        self._get_index_row(uid, doc, attributes, default),
                     )
-                    conn.execute(cmd_insert, (doc["ID"], doc[attribute_name]))
 
             except sqlite3.IntegrityError as err:
                 if upsert:
                     # cmd_update = 'update ' + self.table_name + ' set Document = ? where ID = ?'
                     cmd_update, params = dialect.render_update(
-                        self.table_name, "Document", encoded_item, "ID", doc["ID"]
+                        self.table_name, "Document", encoded_item, "ID", uid
                     )
                     conn.execute(cmd_update, params)
-                    for attribute_name in indexes:
-                        index_name = indexes[attribute_name]
-                        cmd_update, __ = dialect.render_update(
-                            index_name, attribute_name, None, "ID", None
+                    for index_name, attributes, default in index_tables:
+                        cmd_replace, __ = dialect.render_insert(
+                            index_name,
+                            dict.fromkeys(("ID",) + attributes),
+                            on_conflict="replace",
+                        )
+                        conn.execute(
+                            cmd_replace,
+                            self._get_index_row(uid, doc, attributes, default),
                         )
-                        conn.execute(cmd_update, (doc[attribute_name], doc["ID"]))
                 else:
                     msg = (
                         "Document with id={0} already exists. "
-                        + f"To update use insert(..,upsert=True)".format(doc["ID"])
+                        + f"To update use insert(..,upsert=True)".format(uid)
                     )
                     warn(msg)
 
-        return doc
+        self._invalidate((uid,))
+        return _returned_document(doc, as_dicts)
 
-    def insert_many(self, docs, cursor=None, do_commit=False):
+    @_pooled_operation
+    def insert_many(self, docs, cursor=None, do_commit=False, as_dicts=True):
         """
         Inserts multiple documents into the collection table
 
-        :param docs: list of documents (dicts) to insert
+        :param docs: list of documents (dicts or dataclasses) to insert
         :param cursor: a database connection cursor to use.  If this is None a new
             cursor is created
         :param do_commit: whether or not to commit the changes after all documents
             have been inserted
+        :param bool as_dicts: return dataclasses with an ID as dicts (see insert)
+        :returns: the inserted documents
 
         Using the cursor and do_commit parameters are included for performance
         considerations.  The calling code could provide an existing cursor and
         handle calling commit.  This can lead to performane improvements if
-        many inserts and deletes are being done.
+        many inserts and deletes are being done.  Without a cursor, a pooled database
+        inserts the documents in one transaction of its writer connection.
         """
+        if cursor is None and self.db.pool_size:
+            # a pooled database writes with its writer connection only
+            with self.db.transaction() as conn:
+                docs = self.insert_many(docs, conn.cursor(), as_dicts=as_dicts)
+            # again after the commit, for reads of the old documents meanwhile
+            self._invalidate(self._prepare_document(doc)[0] for doc in docs)
+            return docs
+
         cmd, __ = dialect.render_insert(
             self.table_name, dict([("ID", None), ("Document", None)])
         )
 
+        uids = []
         _docs = []
         for doc in docs:
-            if is_dataclass(doc):
-                doc_obj = doc
-                doc = asdict(doc_obj)
-            doc["ID"] = doc.get("ID", uuid.uuid1().hex)
+            uid, doc = self._prepare_document(doc)
+            uids.append(uid)
             _docs.append(doc)
 
         docs = _docs
 
-        indexes = self.find_indexes()
+        index_tables = self._index_tables()
 
-        params = tuple([(doc["ID"], self.encode(doc)) for doc in docs])
+        params = tuple([(uid, self.encode(doc)) for uid, doc in zip(uids, docs)])
         if not cursor:
             cursor = self.db.cursor()
 
         try:
             cursor.executemany(cmd, params)
 
-            for attribute_name in indexes:
-                index_name = indexes[attribute_name]
+            for index_name, attributes, default in index_tables:
                 index_params = tuple(
-                    [((doc["ID"], doc[attribute_name])) for doc in docs]
+                    [
+                        self._get_index_row(uid, doc, attributes, default)
+                        for uid, doc in zip(uids, docs)
+                    ]
                 )
                 cmd_insert, __ = dialect.render_insert(
-                    index_name, dict([("ID", None), (attribute_name, None)])
+                    index_name, dict.fromkeys(("ID",) + attributes)
                 )
                 cursor.executemany(cmd_insert, index_params)
 
@@ -750,8 +1818,97 @@ class DocumentStore(object):
         if do_commit:
             self.db.conn.commit()
 
-        return docs
+        self._invalidate(uids)
+        return [_returned_document(doc, as_dicts) for doc in docs]
+
+    @_pooled_operation
+    def bulk_load(self, docs, batch_size=1000, on_conflict="ignore", pragmas=None):
+        """
+        Loads documents from an iterable (like a generator) into the collection.  The
+        documents are read, encoded and written *batch_size* at a time, each batch in
+        its own transaction, so memory use does not grow with the number of documents.
+
+        :param docs: an iterable of documents (dicts or dataclasses)
+        :param int batch_size: the number of documents written per transaction
+        :param str on_conflict: what to do with a document whose ID already exists.
+            "ignore" keeps the existing document, "replace" overwrites it and "error"
+            raises the sqlite3.IntegrityError, rolling back the current batch (the
+            batches before it stay committed).
+        :param pragmas: sqlite pragmas applied for the duration of the load, like
+            {"synchronous": "off"}.  True applies BULK_LOAD_PRAGMAS.  The previous
+            values are restored afterwards.
+        :returns: a dict with the number of documents read and the number of documents
+            written
+
+        Examples:
+
+            >>> stats = shapes.bulk_load(
+            ...     (json.loads(line) for line in open("shapes.jsonl")),
+            ...     on_conflict="replace",
+            ...     pragmas=True,
+            ... )
+        """
+        if on_conflict not in ("ignore", "replace", "error"):
+            raise ValueError('on_conflict must be "ignore", "replace" or "error"')
+        if pragmas is True:
+            pragmas = BULK_LOAD_PRAGMAS
+        verb = None if on_conflict == "error" else on_conflict
 
+        # the statements are rendered once and prepared once by sqlite3's cache
+        cmd, __ = dialect.render_insert(
+            self.table_name, dict.fromkeys(("ID", "Document")), on_conflict=verb
+        )
+        index_cmds = [
+            (
+                dialect.render_insert(
+                    index_name, dict.fromkeys(("ID",) + attributes), on_conflict=verb
+                )[0],
+                attributes,
+                default,
+            )
+            for index_name, attributes, default in self._index_tables()
+        ]
+
+        # a pooled database writes with its writer connection only
+        with self.db.writer() as conn:
+            previous = {}
+            if pragmas:
+                # the journal mode can not be changed within a transaction
+                conn.commit()
+            for name, value in (pragmas or {}).items():
+                previous[name] = conn.execute("pragma {0}".format(name)).fetchone()[0]
+                conn.execute("pragma {0} = {1}".format(name, value))
+
+            stats = {"documents": 0, "written": 0}
+            docs = iter(docs)
+            try:
+                while True:
+                    batch = [
+                        self._prepare_document(doc) for doc in islice(docs, batch_size)
+                    ]
+                    if not batch:
+                        break
+                    params = [(uid, self.encode(doc)) for uid, doc in batch]
+                    with conn:
+                        cursor = conn.executemany(cmd, params)
+                        stats["written"] += cursor.rowcount
+                        for index_cmd, attributes, default in index_cmds:
+                            conn.executemany(
+                                index_cmd,
+                                [
+                                    self._get_index_row(uid, doc, attributes, default)
+                                    for uid, doc in batch
+                                ],
+                            )
+                    self._invalidate(uid for uid, __ in batch)
+                    stats["documents"] += len(batch)
+            finally:
+                for name, value in previous.items():
+                    conn.execute("pragma {0} = {1}".format(name, value))
+
+        return stats
+
+    @_pooled_operation
     def delete(self, doc):
         """Deletes a single document from the DocumentStore
         :param doc: the document (dict) to delete
@@ -764,20 +1921,20 @@ class DocumentStore(object):
         # cmd = 'DELETE FROM {t} WHERE ID = ?'
         cmd_delete, params = dialect.render_delete(self.table_name, "ID", uid)
 
-        with self.db.conn as conn:
+        with self.db.transaction() as conn:
             try:
                 conn.execute(cmd_delete, params)
-                indexes = self.find_indexes()
-                for attribute_name in indexes:
-                    cmd_delete, params = dialect.render_delete(
-                        indexes[attribute_name], "ID", uid
-                    )
+                for index_name, __, __ in self._index_tables():
+                    cmd_delete, params = dialect.render_delete(index_name, "ID", uid)
                     conn.execute(cmd_delete, params)
             except Exception as e:
 
                 msg = "Could not delete document with ID = {0}".format(id)
                 warn(msg + "\n" + msg)
 
+        self._invalidate((uid,))
+
+    @_pooled_operation
     def delete_many(self, docs, cursor=None, do_commit=False):
         """
         Deletes multiple documents from the DocumentStore
@@ -795,11 +1952,21 @@ class DocumentStore(object):
         if not docs:
             return
 
+        if cursor is None and self.db.pool_size:
+            # a pooled database writes with its writer connection only
+            with self.db.transaction() as conn:
+                self.delete_many(docs, conn.cursor())
+            # again after the commit, for reads of the old documents meanwhile
+            self._invalidate(
+                doc.ID if is_dataclass(doc) else doc.get("ID") for doc in docs
+            )
+            return
+
         uids = []
         for doc in docs:
-            if is_dataclass(doc) and hasattr(doc, "ID"):
-                uids.append(doc.ID)
-            if "ID" in doc:
+            if is_dataclass(doc):
+                uids.append((doc.ID,))
+            elif "ID" in doc:
                 uids.append((doc["ID"],))
         # uids = [(doc['ID'],) for doc in docs]
 
@@ -811,11 +1978,8 @@ class DocumentStore(object):
 
         try:
             cursor.executemany(cmd, uids)
-            indexes = self.find_indexes()
-            for attribute_name in indexes:
-                cmd_delete, __ = dialect.render_delete(
-                    indexes[attribute_name], "ID", None
-                )
+            for index_name, __, __ in self._index_tables():
+                cmd_delete, __ = dialect.render_delete(index_name, "ID", None)
                 cursor.executemany(cmd_delete, uids)
 
         except Exception as e:
@@ -825,52 +1989,266 @@ class DocumentStore(object):
         if do_commit:
             self.db.conn.commit()
 
-    def _resolve_attributes(self, sql_command, use_index=False):
+        self._invalidate(uid for uid, in uids)
+
+    @_pooled_operation
+    def get(self, uid, default=None):
+        """
+        Gets the document with ID *uid*, or *default* if there is none.  The document
+        is read from the cache if the collection has one (see cache_size).
+        """
+        return self.get_many((uid,), default)[0]
+
+    @_pooled_operation
+    def get_many(self, uids, default=None):
+        """
+        Gets the documents with the IDs *uids*, in the same order.  *default* is
+        returned for IDs without a document.  The documents not in the cache are read
+        with one query per 500 IDs and then cached.
+
+        Cached documents and dataclasses are shared by all calls returning them, so
+        they should not be modified.  The cache is invalidated by the writes of this
+        DocumentStore object (insert, insert_many, bulk_load, delete and delete_many),
+        not by other objects or direct sql writing to the collection table.
+        """
+        uids = list(uids)
+        found = {}
+        if self.cache_size:
+            with self._cache_lock:
+                cache = self._cache
+                for uid in uids:
+                    doc = cache.get(uid, Unset)
+                    if doc is not Unset:
+                        cache.move_to_end(uid)
+                        found[uid] = doc
+                generation = self._cache_generation
+                self._cache_hits += len(found)
+
+        missing = [uid for uid in dict.fromkeys(uids) if uid not in found]
+        cmd = "select ID, Document from {t} where ID in ({{0}})".format(
+            t=dialect.qname(self.table_name)
+        )
+        for i in range(0, len(missing), 500):
+            chunk = missing[i : i + 500]
+            rows = self.db.conn.execute(
+                cmd.format(",".join("?" * len(chunk))), chunk
+            ).fetchall()
+            docs = self._decode_rows(rows)
+            loaded = {row["ID"]: doc for row, doc in zip(rows, docs)}
+            found.update(loaded)
+            if self.cache_size:
+                self._cache_put(loaded, generation)
+
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache_misses += len(missing)
+        return [found.get(uid, default) for uid in uids]
+
+    def _cache_put(self, docs, generation):
+        """
+        Puts the dict of documents *docs* by ID into the cache, unless the cache was
+        invalidated since *generation*, and evicts the least recently used documents
+        """
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            cache = self._cache
+            cache.update(docs)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+                self._cache_evictions += 1
+
+    def _invalidate(self, uids):
+        """
+        Removes the documents with the IDs *uids* from the cache
+        """
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache_generation += 1
+            for uid in uids:
+                self._cache.pop(uid, None)
+
+    def clear_cache(self):
+        """
+        Removes all documents from the cache
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._cache.clear()
+
+    def cache_stats(self):
+        """
+        Returns a dict with the number of documents found in the cache (hits), read
+        from the database (misses), evicted from the full cache (evictions) and
+        currently cached (size).
+        """
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "evictions": self._cache_evictions,
+            "size": len(self._cache),
+        }
+
+    def reset_cache_stats(self):
+        """
+        Resets the counters reported by cache_stats
+        """
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
+
+    def uses_json1(self):
+        """
+        Tells if @attributes are read with SQLite's json_extract function instead of
+        the python *field* function.  This is the case for json encoded collections
+        whose encoder writes strict json (JsonEncoder(allow_nan=False)), when the
+        SQLite library supports JSON1 and *use_json1* is not False.  json_extract
+        rejects the NaN and Infinity written by default.
+        """
+        return (
+            self.use_json1
+            and isinstance(self._encoder, JsonEncoder)
+            and not self._encoder.allow_nan
+            and self.db.has_json1()
+        )
+
+    def _attribute_sql(self, attribute):
+        """
+        Gets the sql expression reading *attribute* (like 'a.b') from the Document
+        column
+        """
+        if self.uses_json1():
+            return "json_extract(Document, {0})".format(
+                quote_sql_string(json_path(attribute))
+            )
+        return "field(Document, {0})".format(quote_sql_string(attribute))
+
+    def _resolve_attributes(self, sql_command, use_index=False, optional=()):
         """
         Searches for attributes in the sql command (prepended by an @ character) and replaces them
-        with a call to the user defined function *field*
+        with an expression reading the attribute from the document.  This is a call to
+        SQLite's json_extract function for json encoded collections, if it is available,
+        and a call to the user defined function *field* otherwise.
+
+        With *use_index* attributes are read from joined index tables where possible.
+        The *optional* attributes may be missing from matching documents (like sort
+        keys), so they are only read from index tables having a row for every document.
         """
         global attribute_regex
 
         self.db.encoder = self._encoder
-
-        indexes = self.find_indexes()
+        self.db.clear_field_cache()
 
         if not use_index:
             m = attribute_regex.findall(sql_command)
             for mi in m:
-                sub = 'field(Document, "{f}")'.format(f=mi[1:])
+                sub = self._attribute_sql(mi[1:])
                 sql_command = sql_command.replace(mi, sub)
 
             return sql_command
 
         else:
             sqljoins = []
+            columns = {}
             m = attribute_regex.findall(sql_command)
-            for mi in m:
-                attribute = mi[1:]
-                if attribute in indexes.keys():
-                    # the index tables will be joined, so the attribute will be an actual column
-                    sub = "{i}.{f}".format(i=indexes[attribute], f=attribute)
-                    sqljoins.append(
-                        " join {0} on {1}.ID={0}.ID".format(
-                            indexes[attribute], self.table_name
-                        )
+            attributes = list(dict.fromkeys(mi[1:] for mi in m))
+            for index_name, covered in self._plan_indexes(attributes, optional):
+                # the index tables will be joined, so the attributes will be actual columns
+                qindex = dialect.qname(index_name)
+                sqljoins.append(
+                    " join {0} on {1}.ID={0}.ID".format(
+                        qindex, dialect.qname(self.table_name)
                     )
-                else:
-                    # the attribute is not indexed, so we must fetch it from the Document
-                    sub = 'field(document, "{f}")'.format(f=attribute)
-                sql_command = sql_command.replace(mi, sub)
+                )
+                for attribute in covered:
+                    columns[attribute] = qindex + "." + dialect.qname(attribute)
+
+            def sub(match):
+                attribute = match.group(1)[1:]
+                if attribute in columns:
+                    return columns[attribute]
+                # the attribute is not indexed, so we must fetch it from the Document
+                return self._attribute_sql(attribute)
+
+            sql_command = attribute_regex.sub(sub, sql_command)
 
             return sql_command, "\n".join(sqljoins)
 
-    def find(self, clause=None, params=None, limit=None, dtype=None, echo_sql=False):
+    def _plan_indexes(self, attributes, optional=()):
+        """
+        Chooses the index tables to join for a query on *attributes*.  Index tables are
+        picked one at a time, preferring those whose leading attribute is queried (so
+        SQLite can search them) and then those covering the most attributes not yet
+        covered, so one composite index table replaces a join per attribute.
+
+        Single attribute index tables only have rows for documents with the
+        attribute, so they do not cover the *optional* attributes.
+
+        :returns: a list of (index table, covered attributes)
+        """
+        candidates = [
+            (t, attrs, default is Unset) for t, attrs, default in self._index_tables()
+        ]
+        remaining = list(attributes)
+        plan = []
+        while remaining:
+            best = None
+            for index_name, index_attributes, partial in candidates:
+                covered = [
+                    a
+                    for a in remaining
+                    if a in index_attributes and not (partial and a in optional)
+                ]
+                if not covered:
+                    continue
+                score = (index_attributes[0] in attributes, len(covered))
+                if best is None or score > best[0]:
+                    best = (score, index_name, covered)
+            if best is None:
+                break
+            __, index_name, covered = best
+            plan.append((index_name, covered))
+            remaining = [a for a in remaining if a not in covered]
+
+        return plan
+
+    @_pooled_operation
+    def find(
+        self,
+        clause=None,
+        params=None,
+        limit=None,
+        dtype=None,
+        echo_sql=False,
+        fields=None,
+        order_by=None,
+        offset=None,
+        after=None,
+        parallel=None,
+    ):
         """
         Searches for records in the collection.  To search for a field inside of the document
         use an *@* to prefix the the field name.
 
-        :param str clause: the *where* clause to use in the query
+        :param str clause: the *where* clause to use in the query, or a Find query
         :param int limit: the limit for the number of records to retrieve
+        :param list fields: only return these attributes (like ["ID", "dims.width"])
+            of the matching documents as dicts instead of the whole documents.  The
+            attributes are extracted by sqlite, so the documents are not decoded.
+        :param order_by: the attribute or list of attributes to sort by, like
+            ["@color", "@sides desc"].  Index tables on the attributes are used for the
+            sorting.
+        :param int offset: the number of matching records to skip
+        :param str after: a page token (see find_page).  Only the records following
+            the page the token was created for are returned.
+        :param int parallel: fetch and decode the documents and build the dataclasses
+            in this many worker processes, in chunks.  The query itself only selects
+            the rowids of the records, and their order is kept.  This is only done
+            for results of PARALLEL_DECODE_MIN_ROWS records or more from a database
+            file, outside of a transaction, and pays off for expensive documents
+            (large or compressed ones) on machines with several cores.  The dtype
+            must be importable by the workers.
         :param bool full_record: if False then only the matching documents are returnd.
                                  If True then the full database row is returned
                                  (the document is still parsed back into a python object)
@@ -890,18 +2268,250 @@ class DocumentStore(object):
 
         """
 
-        cmd = dialect.render_select(table=self.table_name, columns="Document")
+        if isinstance(clause, Find):
+            return self.find(
+                limit=limit,
+                echo_sql=echo_sql,
+                after=after,
+                parallel=parallel,
+                **clause._find_kwargs(
+                    dtype=dtype, fields=fields, order_by=order_by, offset=offset
+                ),
+            )
 
-        # Find JSON fields to include in query and replace them with calls to the field function
-        sqljoin = ""
-        if clause and len(clause) > 0:
-            clause, sqljoin = self._resolve_attributes(clause, use_index=True)
-            cmd += sqljoin + " where " + clause
+        path = self._worker_database_path() if parallel and parallel > 1 else None
+        if path is not None and not fields:
+            cursor = self._execute_find(
+                clause,
+                params,
+                limit,
+                echo_sql,
+                None,
+                order_by,
+                offset,
+                after,
+                rowids=True,
+            )
+            return self._decode_rowids(
+                [row[0] for row in cursor.fetchall()], dtype, parallel, path
+            )
 
-        # apply the record limit
-        if limit is not None:
-            cmd += " limit {0}".format(int(limit))
-        # print(cmd)
+        cursor = self._execute_find(
+            clause, params, limit, echo_sql, fields, order_by, offset, after
+        )
+
+        if fields:
+            return self._project(cursor.fetchall(), fields)
+
+        # now parse the fetched documents
+        return self._decode_rows(cursor.fetchall(), dtype)
+
+    def find_iter(
+        self,
+        clause=None,
+        params=None,
+        limit=None,
+        dtype=None,
+        batch_size=1000,
+        echo_sql=False,
+        fields=None,
+        order_by=None,
+        offset=None,
+        after=None,
+    ):
+        """
+        Like find, but returns a generator that fetches and decodes the matching
+        documents *batch_size* rows at a time, so only one batch is held in memory.
+
+        :param str clause: the *where* clause to use in the query, or a Find query
+        :param params: the parameters of the *where* clause
+        :param int limit: the limit for the number of records to retrieve
+        :param type dtype: dataclass type to build from the documents.  By default the
+            dtype of the collection is used
+        :param int batch_size: the number of rows fetched at a time
+        :param list fields: only return these attributes of the documents (see find)
+        :param order_by: the attributes to sort by (see find)
+        :param int offset: the number of matching records to skip
+        :param str after: a page token (see find_page)
+
+        Examples:
+
+            >>> for shape in shapes.find_iter("@sides > ?", (4,), batch_size=100):
+            ...     print(shape["ID"])
+        """
+        if isinstance(clause, Find):
+            yield from self.find_iter(
+                limit=limit,
+                batch_size=batch_size,
+                echo_sql=echo_sql,
+                after=after,
+                **clause._find_kwargs(
+                    dtype=dtype, fields=fields, order_by=order_by, offset=offset
+                ),
+            )
+            return
+
+        cursor = self._execute_find(
+            clause, params, limit, echo_sql, fields, order_by, offset, after
+        )
+
+        while True:
+            # other collections may have changed the encoder used by the field
+            # function while this generator was suspended
+            self.db.encoder = self._encoder
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if fields:
+                yield from self._project(rows, fields)
+            else:
+                yield from self._decode_rows(rows, dtype)
+
+    @_pooled_operation
+    def find_page(
+        self,
+        clause=None,
+        params=None,
+        order_by=None,
+        page_size=100,
+        token=None,
+        dtype=None,
+        fields=None,
+        echo_sql=False,
+    ):
+        """
+        Gets a page of the matching documents using keyset pagination.  The documents
+        are sorted by *order_by* and then by ID.  Instead of skipping the preceding
+        records like an offset, the next page continues after the sort key of the
+        last document of the page, so deep pages are as fast as the first one.
+
+        :param str clause: the *where* clause to use in the query, or a Find query
+        :param params: the parameters of the *where* clause
+        :param order_by: the attributes to sort by (see find)
+        :param int page_size: the number of documents per page
+        :param str token: the token of the page to get.  None gets the first page.
+        :param type dtype: dataclass type to build from the documents
+        :param list fields: only return these attributes of the documents (see find)
+        :returns Page: the documents of the page and the token of the next page, which
+            is None if this was the last page
+
+        Examples:
+
+            >>> page = shapes.find_page("@color = ?", ("red",), order_by="@sides")
+            >>> while page.token is not None:
+            ...     page = shapes.find_page(
+            ...         "@color = ?", ("red",), order_by="@sides", token=page.token
+            ...     )
+        """
+        if isinstance(clause, Find):
+            return self.find_page(
+                page_size=page_size,
+                token=token,
+                echo_sql=echo_sql,
+                **clause._find_kwargs(dtype=dtype, fields=fields, order_by=order_by),
+            )
+
+        cursor = self._execute_find(
+            clause, params, page_size, echo_sql, fields, order_by, None, token, True
+        )
+        rows = cursor.fetchall()
+
+        if fields:
+            items = self._project(rows, fields)
+        else:
+            items = self._decode_rows(rows, dtype)
+
+        next_token = None
+        if rows and page_size is not None and len(rows) == page_size:
+            order = self._page_order(order_by)
+            keys = [rows[-1]["__key{0}".format(i)] for i in range(len(order))]
+            next_token = self._page_token(order, keys)
+
+        return Page(items, next_token)
+
+    def _decode_rows(self, rows, dtype=None):
+        """
+        Decodes the documents of fetched rows and builds dataclasses from them if
+        *dtype* (or the dtype of the collection) is a dataclass
+        """
+        return self._decode_documents([row["Document"] for row in rows], dtype)
+
+    def _decode_documents(self, blobs, dtype=None):
+        """
+        Decodes stored documents and builds dataclasses from them (see _decode_rows)
+        """
+        dtype = self._dataclass_dtype(dtype)
+        results = [self.decode(blob) for blob in blobs]
+
+        if dtype is not None:
+            # results = [dtype(**res) for res in results]
+            results = list(from_dicts(results, dtype, columnar=True))
+
+        return results
+
+    def _dataclass_dtype(self, dtype=None):
+        dtype = dtype or self.dtype
+        if dtype is not None and not is_dataclass(dtype):
+            dtype = None
+        return dtype
+
+    def _worker_database_path(self):
+        """
+        Gets the file of the database if worker processes can read the collection
+        with their own connections, which is not the case for in memory databases and
+        within a transaction (whose changes the workers do not see)
+        """
+        path = self.db.connection_string.partition(":///")[-1]
+        if path in ("", ":memory:") or self.db.conn.in_transaction:
+            return None
+        return path
+
+    def _decode_rowids(self, rowids, dtype, parallel, path):
+        """
+        Fetches and decodes the documents of the rows *rowids*.  Large results are
+        fetched and decoded by *parallel* worker processes.
+        """
+        if len(rowids) < PARALLEL_DECODE_MIN_ROWS:
+            blobs = _fetch_documents(self.db.conn, self.table_name, rowids)
+            return self._decode_documents(blobs, dtype)
+
+        # a few chunks per worker evens out their load
+        size = -(-len(rowids) // (parallel * 4))
+        chunks = [rowids[i : i + size] for i in range(0, len(rowids), size)]
+        decoded = _process_pool(parallel).map(
+            _decode_chunk,
+            [path] * len(chunks),
+            [self.table_name] * len(chunks),
+            [self._encoder] * len(chunks),
+            chunks,
+            [self._dataclass_dtype(dtype)] * len(chunks),
+        )
+        return [doc for chunk in decoded for doc in chunk]
+
+    def _execute_find(
+        self,
+        clause=None,
+        params=None,
+        limit=None,
+        echo_sql=False,
+        fields=None,
+        order_by=None,
+        offset=None,
+        after=None,
+        keys=False,
+        rowids=False,
+    ):
+        """
+        Renders and executes the sql command of a find query and returns the cursor
+        """
+        if self.full_scan_hook is not None and clause:
+            query_plan = self.explain(clause, params, limit, order_by, offset)
+            if query_plan.full_scan:
+                self.full_scan_hook(query_plan)
+
+        cmd, params = self._render_find(
+            clause, params, limit, fields, order_by, offset, after, keys, rowids
+        )
 
         # execute
         if echo_sql:
@@ -913,26 +2523,319 @@ class DocumentStore(object):
         else:
             cursor.execute(cmd)
 
-        # now parse the fetched documents
-        results = [self.decode(item["Document"]) for item in cursor.fetchall()]
+        return cursor
+
+    def _render_find(
+        self,
+        clause=None,
+        params=None,
+        limit=None,
+        fields=None,
+        order_by=None,
+        offset=None,
+        after=None,
+        keys=False,
+        rowids=False,
+    ):
+        """
+        Renders the sql command of a find query and returns it with its parameters.
+        With *keys* the sort keys of the records are selected as well (as __key0,
+        __key1, ...) for keyset pagination.  With *rowids* the rowids of the records
+        are selected instead of their documents.
+        """
+        params = tuple(params or ())
+
+        if fields:
+            self.db.encoder = self._encoder
+            self.db.clear_field_cache()
+            columns = ", ".join(
+                "{0} as {1}".format(self._projection_sql(f), dialect.qname(f))
+                for f in fields
+            )
+        elif rowids:
+            columns = dialect.qname(self.table_name) + ".rowid"
+        else:
+            columns = dialect.qname("Document")
 
-        dtype = dtype or self.dtype
+        if after is not None or keys:
+            order = self._page_order(order_by)
+        else:
+            order = self._parse_order_by(order_by)
 
-        if dtype is not None:
-            from dataclasses import is_dataclass
+        if keys:
+            for i, (attribute, __) in enumerate(order):
+                columns += ", {0} as {1}".format(
+                    self._order_term(attribute), dialect.qname("__key{0}".format(i))
+                )
+
+        body = ""
+        if after is not None:
+            condition, after_params = self._keyset_condition(order, after)
+            if clause:
+                body += " where ({0}) and {1}".format(clause, condition)
+            else:
+                body += " where " + condition
+            params += after_params
+        elif clause and len(clause) > 0:
+            body += " where " + clause
+
+        if order:
+            body += " order by " + ", ".join(
+                self._order_term(attribute) + (" desc" if descending else "")
+                for attribute, descending in order
+            )
+
+        # apply the record limit
+        if limit is not None:
+            body += " limit {0}".format(int(limit))
+        if offset:
+            if limit is None:
+                body += " limit -1"
+            body += " offset {0}".format(int(offset))
+
+        return self._render_query(columns, body, clause), params
+
+    def _render_query(self, columns, body, clause=None):
+        """
+        Renders a select of *columns* from the collection table followed by *body*
+        (the where, order by, ... clauses), after replacing the attributes in both with
+        index columns or expressions reading them from the documents.  Index tables that
+        may not have a row for every document are only used for the attributes in the
+        where *clause*, as documents missing other attributes (like sort keys) must not
+        be dropped by the join.
+        """
+        where_attributes = {mi[1:] for mi in attribute_regex.findall(clause or "")}
+        optional = [
+            mi[1:]
+            for mi in attribute_regex.findall(columns + " " + body)
+            if mi[1:] not in where_attributes
+        ]
+        # columns and body are resolved together so they use the same index tables
+        sql, sqljoin = self._resolve_attributes(
+            columns + "\n" + body, use_index=True, optional=optional
+        )
+        columns, body = sql.split("\n", 1)
+
+        cmd = "select {c} from {t}".format(c=columns, t=dialect.qname(self.table_name))
+        return cmd + sqljoin + body
+
+    @staticmethod
+    def _parse_order_by(order_by):
+        """
+        Parses *order_by* (like "@sides desc" or ["@color", ("sides", "desc")]) to a
+        list of (attribute, descending)
+        """
+        if order_by is None:
+            return []
+        if isinstance(order_by, str):
+            order_by = [order_by]
+
+        order = []
+        for item in order_by:
+            if isinstance(item, (list, tuple)):
+                attribute, direction = item
+            else:
+                attribute, __, direction = item.strip().partition(" ")
+            direction = direction.strip().lower() or "asc"
+            if direction not in ("asc", "desc"):
+                raise ValueError(
+                    'Sort direction of {0} must be "asc" or "desc"'.format(item)
+                )
+            order.append((attribute.lstrip("@"), direction == "desc"))
+
+        return order
+
+    def _page_order(self, order_by):
+        """
+        Gets the sort order of keyset pagination, which ends with the ID to be unique
+        """
+        order = self._parse_order_by(order_by)
+        if "ID" not in [attribute for attribute, __ in order]:
+            order.append(("ID", False))
+        return order
+
+    def _order_term(self, attribute):
+        """
+        Gets the (unresolved) sql expression of a sort key
+        """
+        if attribute == "ID":
+            return dialect.qname(self.table_name) + ".ID"
+        return "@" + attribute
+
+    @staticmethod
+    def _page_token(order, keys):
+        """
+        Creates the page token continuing after the sort *keys* in the *order*
+        """
+        data = {"order": [list(o) for o in order], "keys": list(keys)}
+        return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode(
+            "ascii"
+        )
+
+    def _keyset_condition(self, order, token):
+        """
+        Renders the condition selecting the records following the page *token* in the
+        *order*.  NULL values sort first in ascending and last in descending order.
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token))
+            token_order = [tuple(o) for o in data["order"]]
+            keys = data["keys"]
+        except (ValueError, TypeError, KeyError):
+            raise ValueError("Invalid page token {0}".format(token))
+        if token_order != order:
+            raise ValueError("The page token was created for a different order_by")
+
+        terms = [self._order_term(attribute) for attribute, __ in order]
+
+        # a row value comparison can be searched with an index
+        if not any(descending for __, descending in order) and None not in keys:
+            condition = "({0}) > ({1})".format(
+                ", ".join(terms), ", ".join(["?"] * len(terms))
+            )
+            return condition, tuple(keys)
+
+        parts = []
+        params = []
+        for i, ((__, descending), term, key) in enumerate(zip(order, terms, keys)):
+            conditions = []
+            part_params = []
+            for previous_term, previous_key in zip(terms[:i], keys[:i]):
+                conditions.append(previous_term + " is ?")
+                part_params.append(previous_key)
+            if descending:
+                if key is None:
+                    # nothing follows a NULL in descending order
+                    continue
+                conditions.append("({0} < ? or {0} is null)".format(term))
+                part_params.append(key)
+            elif key is None:
+                conditions.append(term + " is not null")
+            else:
+                conditions.append(term + " > ?")
+                part_params.append(key)
+            parts.append("(" + " and ".join(conditions) + ")")
+            params.extend(part_params)
 
-            if is_dataclass(dtype):
-                # results = [dtype(**res) for res in results]
-                results = [from_dict(res, dtype) for res in results]
+        return "(" + " or ".join(parts) + ")", tuple(params)
 
+    def _projection_sql(self, attribute):
+        """
+        Gets the sql expression selecting *attribute* json encoded for a projection
+        """
+        if attribute == "ID":
+            return dialect.qname(self.table_name) + ".ID"
+        if self.uses_json1():
+            return "json_quote({0})".format(self._attribute_sql(attribute))
+        return "field_json(Document, {0})".format(quote_sql_string(attribute))
+
+    def _project(self, rows, fields):
+        """
+        Converts the rows of a projection to dicts with the values of *fields*
+        """
+        loads = get_json_backend().loads
+        decoders = [None if f == "ID" else loads for f in fields]
+        results = []
+        for row in rows:
+            results.append(
+                {
+                    f: (v if decoder is None else decoder(v))
+                    for f, v, decoder in zip(fields, row, decoders)
+                }
+            )
         return results
 
-    def find2(self, where=None, limit=None, dtype=None, echo_sql=False):
+    @_pooled_operation
+    def explain(self, clause=None, params=None, limit=None, order_by=None, offset=None):
+        """
+        Tells how a query is executed without running it.
+
+        :param clause: the *where* clause of a find query, the mongodb like query
+            of a find2 query or a Find query
+        :param params: the parameters of the *where* clause
+        :param int limit: the limit for the number of records to retrieve
+        :param order_by: the attributes to sort by (see find)
+        :param int offset: the number of matching records to skip
+        :returns QueryPlan: the rendered sql, the attributes read from indexes and
+            from the documents, and SQLite's EXPLAIN QUERY PLAN output
+
+        Examples:
+
+            >>> shapes.add_index("color", "TEXT")
+            >>> query_plan = shapes.explain("@color = ? and @sides > ?", ("red", 3))
+            >>> query_plan.indexes
+            {'color': 'index_color_on_shapes'}
+            >>> query_plan.decoded
+            ['sides']
+        """
+        if isinstance(clause, dict):
+            clause, params = render_op(clause, attrPrefix="@")
+        elif isinstance(clause, Find):
+            kwargs = clause._find_kwargs(order_by=order_by, offset=offset)
+            clause, params = kwargs["clause"], kwargs["params"]
+            order_by, offset = kwargs["order_by"], kwargs["offset"]
+
+        attributes = list(
+            dict.fromkeys(mi[1:] for mi in attribute_regex.findall(clause or ""))
+        )
+        optional = []
+        for attribute, __ in self._parse_order_by(order_by):
+            if attribute != "ID" and attribute not in attributes:
+                optional.append(attribute)
+        attributes += optional
+
+        indexes = {}
+        for index_name, covered in self._plan_indexes(attributes, optional):
+            for attribute in covered:
+                indexes[attribute] = index_name
+        for key, index_name in self.find_expression_indexes().items():
+            for attribute in key if isinstance(key, tuple) else (key,):
+                if attribute in attributes:
+                    indexes.setdefault(attribute, index_name)
+        decoded = [a for a in attributes if a not in indexes]
+
+        cmd, params = self._render_find(
+            clause, params, limit, order_by=order_by, offset=offset
+        )
+        cursor = self.db.conn.execute("explain query plan " + cmd, params)
+        plan = [row["detail"] for row in cursor.fetchall()]
+
+        # the collection table is scanned and attributes are read from every document
+        scanned = any(
+            detail.startswith("SCAN") and self.table_name in detail.split()
+            for detail in plan
+        )
+
+        return QueryPlan(
+            sql=cmd,
+            params=params,
+            indexes=indexes,
+            decoded=decoded,
+            function="json_extract" if self.uses_json1() else "field",
+            plan=plan,
+            full_scan=bool(decoded) and scanned,
+        )
+
+    @_pooled_operation
+    def find2(
+        self,
+        where=None,
+        limit=None,
+        dtype=None,
+        echo_sql=False,
+        fields=None,
+        order_by=None,
+        offset=None,
+        after=None,
+        parallel=None,
+    ):
         """
         Search the colleciton using mongodb like syntax like:
         {'$gt':{'a':2}}
         This translates to
         "@a > "
+
+        The other arguments are the ones of find.
         """
 
         if where is not None:
@@ -946,8 +2849,192 @@ class DocumentStore(object):
             limit=limit,
             dtype=dtype,
             echo_sql=echo_sql,
+            fields=fields,
+            order_by=order_by,
+            offset=offset,
+            after=after,
+            parallel=parallel,
         )
 
+    def find2_iter(
+        self,
+        where=None,
+        limit=None,
+        dtype=None,
+        batch_size=1000,
+        echo_sql=False,
+        fields=None,
+        order_by=None,
+        offset=None,
+        after=None,
+    ):
+        """
+        Like find2, but returns a generator yielding the documents lazily (see
+        find_iter)
+        """
+
+        if where is not None:
+            where_clause, params = render_op(where, attrPrefix="@")
+        else:
+            where_clause, params = None, None
+
+        return self.find_iter(
+            clause=where_clause,
+            params=params,
+            limit=limit,
+            dtype=dtype,
+            batch_size=batch_size,
+            echo_sql=echo_sql,
+            fields=fields,
+            order_by=order_by,
+            offset=offset,
+            after=after,
+        )
+
+    @_pooled_operation
+    def find2_page(
+        self,
+        where=None,
+        order_by=None,
+        page_size=100,
+        token=None,
+        dtype=None,
+        fields=None,
+        echo_sql=False,
+    ):
+        """
+        Like find2, but gets a page of the documents using keyset pagination (see
+        find_page)
+        """
+
+        if where is not None:
+            where_clause, params = render_op(where, attrPrefix="@")
+        else:
+            where_clause, params = None, None
+
+        return self.find_page(
+            clause=where_clause,
+            params=params,
+            order_by=order_by,
+            page_size=page_size,
+            token=token,
+            dtype=dtype,
+            fields=fields,
+            echo_sql=echo_sql,
+        )
+
+    def _where_clause(self, where=None, params=None):
+        """
+        Gets the clause and parameters of *where*, which may be a *where* clause with
+        @attributes (and *params*), a mongodb like query (see find2) or a Find query
+        """
+        if isinstance(where, dict):
+            return render_op(where, attrPrefix="@")
+        elif isinstance(where, Find):
+            kwargs = where._find_kwargs()
+            return kwargs["clause"], kwargs["params"]
+        return where, params
+
+    @_pooled_operation
+    def count(self, where=None, params=None):
+        """
+        Counts the matching documents in sqlite
+
+        :param where: a *where* clause (with *params*), a mongodb like query (see find2)
+            or a Find query.  All documents are counted if this is None.
+        :param params: the parameters of a *where* clause
+
+        Examples:
+
+            >>> shapes.count({"$eq": {"color": "red"}})
+            2
+        """
+        clause, params = self._where_clause(where, params)
+        body = " where " + clause if clause else ""
+        cmd = self._render_query("count(*)", body, clause)
+        return self.db.conn.execute(cmd, tuple(params or ())).fetchone()[0]
+
+    @_pooled_operation
+    def distinct(self, path, where=None, params=None):
+        """
+        Gets the sorted distinct values of the attribute *path* (like 'dims.width') in
+        the matching documents.  A missing attribute is a None value.
+
+        :param str path: the attribute
+        :param where: selects the documents (see count)
+        :param params: the parameters of a *where* clause
+        """
+        path = path.lstrip("@")
+        rows = self.aggregate(group_by=path, metrics={}, where=where, params=params)
+        return [row[path] for row in rows]
+
+    @_pooled_operation
+    def aggregate(self, group_by=None, metrics=None, where=None, params=None):
+        """
+        Groups the matching documents by the values of the *group_by* attributes and
+        computes the *metrics* of each group.  This is compiled to a sql group by, so
+        only one row per group is fetched and the documents are not decoded in python.
+
+        :param group_by: an attribute (like 'dims.width') or a list of attributes.  If
+            this is None the metrics are computed over all matching documents.
+        :param dict metrics: maps the name of a metric to "count" (the number of
+            documents) or a (function, attribute) tuple, where the function is one of
+            count, sum, total, avg, min or max.  Defaults to {"count": "count"}.
+        :param where: selects the documents (see count)
+        :param params: the parameters of a *where* clause
+        :returns: a list of dicts with the values of the group_by attributes and the
+            metrics, sorted by the group_by attributes
+
+        Examples:
+
+            >>> shapes.aggregate(
+            ...     group_by="color",
+            ...     metrics={"n": "count", "most_sides": ("max", "sides")},
+            ... )
+            [{'color': 'green', 'n': 2, 'most_sides': 6},
+             {'color': 'red', 'n': 2, 'most_sides': 5}]
+        """
+        if group_by is None:
+            group_by = []
+        elif isinstance(group_by, str):
+            group_by = [group_by]
+        group_by = [g.lstrip("@") for g in group_by]
+        if metrics is None:
+            metrics = {"count": "count"}
+
+        columns = [
+            "{0} as {1}".format(self._order_term(g), dialect.qname(g)) for g in group_by
+        ]
+        for name, metric in metrics.items():
+            if metric == "count":
+                expression = "count(*)"
+            else:
+                func, attribute = metric
+                if func.lower() not in AGGREGATE_FUNCTIONS:
+                    raise ValueError(
+                        "Unknown aggregate function {0}. Use one of {1}".format(
+                            func, ", ".join(AGGREGATE_FUNCTIONS)
+                        )
+                    )
+                expression = "{0}({1})".format(
+                    func.lower(), self._order_term(attribute.lstrip("@"))
+                )
+            columns.append("{0} as {1}".format(expression, dialect.qname(name)))
+
+        if not columns:
+            raise ValueError("Give the group_by attributes or metrics to aggregate")
+
+        clause, params = self._where_clause(where, params)
+        body = " where " + clause if clause else ""
+        if group_by:
+            terms = ", ".join(self._order_term(g) for g in group_by)
+            body += " group by {0} order by {0}".format(terms)
+
+        cmd = self._render_query(", ".join(columns), body, clause)
+        cursor = self.db.conn.execute(cmd, tuple(params or ()))
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
     def __eq__(self, other):
 
         return (self.name == other.name) and (self.db == other.db)
@@ -960,6 +3047,9 @@ class Find:
         self._param_name = None
         self._op = None
         self._test_val = None
+        self._fields = None
+        self._order_by = None
+        self._offset = None
 
     def where(self, param_name):
         self._param_name = param_name
@@ -982,7 +3072,7 @@ class Find:
         return self.is_greater_than_or_equal_to(test_val)
 
     def is_less_than(self, test_val):
-        self._op = ">"
+        self._op = "<"
         self._test_val = test_val
         return self
 
@@ -998,7 +3088,7 @@ class Find:
         return self.is_less_than_or_equal_to(test_val)
 
     def is_equal_to(self, test_val):
-        self._op = "<="
+        self._op = "="
         self._test_val = test_val
         return self
 
@@ -1008,6 +3098,45 @@ class Find:
     def __str__(self):
         return f"{self._param_name} {self._op} {self._test_val}"
 
+    def select(self, *fields):
+        """
+        Only returns these attributes of the matching documents (see DocumentStore.find)
+        """
+        self._fields = list(fields)
+        return self
+
     def _render(self):
         op_str, params = render_op({self._op: {self._param_name: self._test_val}}, "@")
         return op_str, params
+
+    def order_by(self, *order):
+        """
+        Sorts the matching documents by these attributes, like "@sides desc" (see
+        DocumentStore.find)
+        """
+        self._order_by = list(order)
+        return self
+
+    def offset(self, offset):
+        """
+        Skips this number of matching documents
+        """
+        self._offset = offset
+        return self
+
+    def _find_kwargs(self, **kwargs):
+        """
+        Gets the keyword arguments of DocumentStore.find for this query.  The given
+        *kwargs* (like dtype or order_by) override the settings of the query if they
+        are not None.
+        """
+        settings = {
+            "dtype": self.dtype,
+            "fields": self._fields,
+            "order_by": self._order_by,
+            "offset": self._offset,
+        }
+        kwargs = {k: (settings[k] if v is None else v) for k, v in kwargs.items()}
+        clause, params = self._render() if self._op is not None else (None, None)
+        kwargs.update(clause=clause, params=params)
+        return kwargs
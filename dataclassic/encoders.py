@@ -1,15 +1,185 @@
+import math
+import re
+import struct
+import threading
 import zlib
+from collections import Counter
+from functools import partial
 
 # try:
 #     import ujson as json
 # except ImportError:
 import json
 
+from dataclassic.dataclasses_ext import asdict, is_dataclass, to_document_value, to_json
+
+try:
+    import msgpack
+
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+try:
+    import lz4.block
+
+    HAS_LZ4 = True
+except ImportError:
+    HAS_LZ4 = False
+
+
+class JsonBackend(object):
+    """
+    A json library used to encode and decode documents.
+
+    :param str name: name of the backend
+    :param dumps: function encoding a value to a json string
+    :param loads: function decoding a json string (or bytes)
+    """
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return "JsonBackend({0})".format(self.name)
+
+
+def _has_non_finite(val):
+    """
+    Tells if the dicts, lists and tuples of *val* hold a NaN or infinite float
+    """
+    if isinstance(val, float):
+        return not math.isfinite(val)
+    elif isinstance(val, dict):
+        return any(_has_non_finite(item) for item in val.values())
+    elif isinstance(val, (list, tuple)):
+        return any(_has_non_finite(item) for item in val)
+    return False
+
+
+def _with_nan_fallback(name, dumps, loads):
+    """
+    Builds the backend of a json library that writes NaN and Infinity as null and
+    cannot read them.  Values with non-finite floats are encoded with the json
+    module instead, which keeps them (like to_json does), and text the library
+    cannot decode is decoded with the json module.
+    """
+    _json_dumps = json.JSONEncoder().encode
+    _json_loads = json.loads
+
+    def safe_dumps(val):
+        text = dumps(val)
+        # the values are only searched if the library wrote a null for something
+        if "null" in text and _has_non_finite(val):
+            try:
+                return _json_dumps(val)
+            except TypeError:
+                # values only the library can write, like numpy arrays
+                pass
+        return text
+
+    def safe_loads(text):
+        try:
+            return loads(text)
+        except ValueError:
+            return _json_loads(text)
+
+    return JsonBackend(name, safe_dumps, safe_loads)
+
+
+def _load_orjson():
+    import orjson
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(val):
+        return orjson.dumps(val, option=options).decode("utf-8")
+
+    return _with_nan_fallback("orjson", dumps, orjson.loads)
+
+
+def _load_ujson():
+    import ujson
+
+    return JsonBackend("ujson", ujson.dumps, ujson.loads)
+
+
+def _load_msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def dumps(val):
+        return encoder.encode(val).decode("utf-8")
+
+    return _with_nan_fallback("msgspec", dumps, decoder.decode)
 
-# try:
-#     import ujson as json
-# except ImportError:
-#     import json
+
+def _load_json():
+    return JsonBackend("json", json.JSONEncoder().encode, json.JSONDecoder().decode)
+
+
+JSON_BACKENDS = {
+    "orjson": _load_orjson,
+    "ujson": _load_ujson,
+    "msgspec": _load_msgspec,
+    "json": _load_json,
+}
+
+# the order in which backends are tried when none is given
+JSON_BACKEND_PREFERENCE = ("orjson", "ujson", "json")
+
+_loaded_backends = {}
+
+
+def get_json_backend(name=None):
+    """
+    Gets a json backend by name.  If *name* is None or "auto", the first of
+    JSON_BACKEND_PREFERENCE that can be imported is used.
+
+    :param str name: one of "orjson", "ujson", "msgspec", "json" or "auto"
+    """
+    if name is None or name == "auto":
+        for candidate in JSON_BACKEND_PREFERENCE:
+            try:
+                return get_json_backend(candidate)
+            except ImportError:
+                continue
+
+    if name not in _loaded_backends:
+        if name not in JSON_BACKENDS:
+            raise ValueError(
+                "Unknown json backend {0}. Available backends are {1}".format(
+                    name, ", ".join(JSON_BACKENDS)
+                )
+            )
+        _loaded_backends[name] = JSON_BACKENDS[name]()
+
+    return _loaded_backends[name]
+
+
+def available_json_backends():
+    """
+    Returns the names of the json backends that can be imported
+    """
+    names = []
+    for name in JSON_BACKENDS:
+        try:
+            get_json_backend(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
 
 
 class JsonEncoder(object):
@@ -17,18 +187,59 @@ class JsonEncoder(object):
     A json string encoder
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, backend=None, allow_nan=True, **kwargs):
+        """
+        :param str backend: the json library to use (see get_json_backend).  By
+            default the fastest one installed is used.  Any other keyword arguments
+            are passed to json.JSONEncoder and require the "json" backend.
+        :param bool allow_nan: write NaN and Infinity like the json module does.  If
+            False, encoding them raises a ValueError, so the documents are strict
+            json that SQLite's JSON1 functions can read.
+        """
+        if kwargs:
+            if backend not in (None, "auto", "json"):
+                raise ValueError(
+                    "The json backend {0} does not take the options {1}. They "
+                    "require the json backend.".format(backend, ", ".join(kwargs))
+                )
+            backend = "json"
+        self.backend = get_json_backend(backend)
+        self.allow_nan = allow_nan
+        self._kwargs = kwargs
 
         self._decoder = json.JSONDecoder()
-        self._encoder = json.JSONEncoder(**kwargs)
+        self._encoder = json.JSONEncoder(allow_nan=allow_nan, **kwargs)
+        # dataclasses are written directly only with the default formatting
+        self._direct = not kwargs
+        self._dumps = self._encoder.encode if kwargs else self.backend.dumps
+        self._loads = self.backend.loads
 
     def encode(self, val):
         """
-        encodes a dict/list object to a json string
+        encodes a dict/list object or a dataclass instance to a json string
         :param val: the value to encode
         """
+        if is_dataclass(val) and not isinstance(val, type):
+            if self._direct:
+                text = to_json(val)
+                if self.allow_nan or not self._maybe_non_finite(text):
+                    return text
+            val = asdict(val, copy=False)
 
-        return self._encoder.encode(val)
+        try:
+            text = self._dumps(val)
+        except (TypeError, OverflowError):
+            # values the backend does not support (e.g. very large integers)
+            return self._encoder.encode(val)
+        if not self.allow_nan and self._maybe_non_finite(text):
+            # the json module raises the ValueError for non-finite floats
+            return self._encoder.encode(val)
+        return text
+
+    @staticmethod
+    def _maybe_non_finite(text):
+        # NaN and (-)Infinity, or strings containing these words
+        return "NaN" in text or "Infinity" in text
 
     def decode(self, val):
         """
@@ -36,7 +247,16 @@ class JsonEncoder(object):
         :param val: the value to decode
         """
 
-        return self._decoder.decode(val)
+        return self._loads(val)
+
+    def __reduce__(self):
+        # the backend functions can not be pickled, so the encoder is rebuilt
+        return (
+            partial(
+                JsonEncoder, self.backend.name, allow_nan=self.allow_nan, **self._kwargs
+            ),
+            (),
+        )
 
 
 class ZlibEncoder(object):
@@ -46,9 +266,12 @@ class ZlibEncoder(object):
 
     def __init__(self, base_encoder=JsonEncoder):
         """
-        :param base_encoder: The encoder whose ouput will be compressed
+        :param base_encoder: The encoder (class or instance) whose ouput will be
+            compressed
         """
-        self.base_encoder = base_encoder()
+        if isinstance(base_encoder, type):
+            base_encoder = base_encoder()
+        self.base_encoder = base_encoder
 
     def encode(self, val):
         enc_val = self.base_encoder.encode(val).encode("utf-8")
@@ -59,3 +282,448 @@ class ZlibEncoder(object):
         val = zlib.decompress(val)
         val = val.decode("utf-8")
         return self.base_encoder.decode(val)
+
+    def __reduce__(self):
+        return (ZlibEncoder, (self.base_encoder,))
+
+
+# json tokens: keys (with their colon), strings, other values and punctuation
+_token_regex = re.compile(
+    rb'"(?:[^"\\]|\\.)*"\s*:\s*|"(?:[^"\\]|\\.)*"|[^\s",:{}\[\]]+|[\s,:{}\[\]]+'
+)
+
+
+def build_dictionary(samples, size=16384):
+    """
+    Builds a preset dictionary from sample documents (bytes) for compressors that
+    cannot train one (zlib, lz4).  Pieces of the documents (keys and values) that
+    occur in several samples are concatenated, with the most valuable pieces at
+    the end where they are cheapest to reference.
+
+    :param samples: list of encoded sample documents
+    :param int size: maximum size of the dictionary in bytes
+    """
+    counts = Counter()
+    for sample in samples:
+        tokens = _token_regex.findall(sample)
+        # single tokens and runs of up to four tokens
+        pieces = set(tokens)
+        for n in (2, 3, 4):
+            pieces.update(
+                b"".join(tokens[i : i + n]) for i in range(len(tokens) - n + 1)
+            )
+        counts.update(pieces)
+
+    pieces = [
+        (count * len(piece), piece) for piece, count in counts.items() if count > 1
+    ]
+    pieces.sort(reverse=True)
+
+    chosen = []
+    total = 0
+    for __, piece in pieces:
+        if total + len(piece) > size:
+            continue
+        chosen.append(piece)
+        total += len(piece)
+
+    return b"".join(reversed(chosen))
+
+
+def train_dictionary(samples, size=16384, algorithm="zlib"):
+    """
+    Trains a preset dictionary for the compression *algorithm* from sample
+    documents (bytes).  zstd uses its own trainer, other algorithms
+    build_dictionary.
+    """
+    if algorithm == "zstd":
+        try:
+            return zstandard.train_dictionary(size, list(samples)).as_bytes()
+        except zstandard.ZstdError:
+            # too few or too small samples for the zstd trainer
+            pass
+    elif algorithm == "zlib":
+        # the zlib window is 32 kB
+        size = min(size, 32768)
+    return build_dictionary(samples, size)
+
+
+COMPRESSION_ALGORITHMS = ("zlib", "zstd", "lz4")
+
+
+class CompressedEncoder(object):
+    """
+    A compressed json encoder with a selectable algorithm and compression level.
+    A preset dictionary shared by all documents of a collection can be given,
+    which greatly improves compression of small documents.
+    """
+
+    def __init__(
+        self, algorithm="zlib", level=None, dictionary=None, base_encoder=JsonEncoder
+    ):
+        """
+        :param str algorithm: one of "zlib", "zstd" (requires zstandard) or "lz4"
+            (requires lz4)
+        :param int level: the compression level.  None uses the algorithm's default
+        :param bytes dictionary: a preset dictionary (see train_dictionary)
+        :param base_encoder: The encoder (class or instance) whose ouput will be
+            compressed
+        """
+        if isinstance(base_encoder, type):
+            base_encoder = base_encoder()
+        self.base_encoder = base_encoder
+        self.algorithm = algorithm
+        self.level = level
+        self.dictionary = dictionary or None
+
+        if algorithm == "zlib":
+            self._compress, self._decompress = self._zlib_functions()
+        elif algorithm == "zstd":
+            if not HAS_ZSTD:
+                raise ImportError("zstd compression requires the zstandard library")
+            self._compress, self._decompress = self._zstd_functions()
+        elif algorithm == "lz4":
+            if not HAS_LZ4:
+                raise ImportError("lz4 compression requires the lz4 library")
+            self._compress, self._decompress = self._lz4_functions()
+        else:
+            raise ValueError(
+                "Unknown compression algorithm {0}. Use one of {1}".format(
+                    algorithm, ", ".join(COMPRESSION_ALGORITHMS)
+                )
+            )
+
+    def _zlib_functions(self):
+        # raw deflate streams, the zlib header would be a few percent of a small document
+        level = -1 if self.level is None else self.level
+        zdict = self.dictionary
+
+        if zdict:
+
+            def compress(data):
+                c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+                return c.compress(data) + c.flush()
+
+            def decompress(data):
+                d = zlib.decompressobj(-15, zdict=zdict)
+                return d.decompress(data) + d.flush()
+
+        else:
+
+            def compress(data):
+                c = zlib.compressobj(level, zlib.DEFLATED, -15)
+                return c.compress(data) + c.flush()
+
+            def decompress(data):
+                return zlib.decompress(data, -15)
+
+        return compress, decompress
+
+    def _zstd_functions(self):
+        level = 3 if self.level is None else self.level
+        dict_data = None
+        if self.dictionary:
+            dict_data = zstandard.ZstdCompressionDict(self.dictionary)
+        # zstd contexts must not be shared between threads
+        local = threading.local()
+
+        def contexts():
+            if not hasattr(local, "compressor"):
+                local.compressor = zstandard.ZstdCompressor(
+                    level=level, dict_data=dict_data, write_dict_id=False
+                )
+                local.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+            return local
+
+        def compress(data):
+            return contexts().compressor.compress(data)
+
+        def decompress(data):
+            return contexts().decompressor.decompress(data)
+
+        return compress, decompress
+
+    def _lz4_functions(self):
+        kwargs = {}
+        if self.level is not None:
+            kwargs = {"mode": "high_compression", "compression": self.level}
+        dictionary = self.dictionary
+
+        def compress(data):
+            return lz4.block.compress(data, dict=dictionary, **kwargs)
+
+        def decompress(data):
+            return lz4.block.decompress(data, dict=dictionary)
+
+        return compress, decompress
+
+    def with_dictionary(self, dictionary):
+        """
+        Returns a copy of this encoder that uses the preset *dictionary*
+        """
+        return type(self)(self.algorithm, self.level, dictionary, self.base_encoder)
+
+    def encode(self, val):
+        return self._compress(self.base_encoder.encode(val).encode("utf-8"))
+
+    def decode(self, val):
+        return self.base_encoder.decode(self._decompress(val).decode("utf-8"))
+
+    def __reduce__(self):
+        return (
+            type(self),
+            (self.algorithm, self.level, self.dictionary, self.base_encoder),
+        )
+
+
+_pack_float = struct.Struct(">Bd").pack
+
+# A pure python implementation of MessagePack (packb/unpackb).  It is several
+# times slower than the msgpack library and only meant for compatibility: reading
+# and writing existing binary collections where msgpack is not installed.
+
+# (limit, format, marker) for unsigned and signed integers of increasing size
+_UINT_FORMATS = ((0xFF, ">BB", 0xCC), (0xFFFF, ">BH", 0xCD), (0xFFFFFFFF, ">BI", 0xCE))
+_INT_FORMATS = (
+    (-0x80, ">Bb", 0xD0),
+    (-0x8000, ">Bh", 0xD1),
+    (-0x80000000, ">Bi", 0xD2),
+)
+
+
+def _pack_int(val, parts):
+    if 0 <= val < 0x80:
+        parts.append(bytes((val,)))
+    elif -32 <= val < 0:
+        parts.append(bytes((val & 0xFF,)))
+    elif val >= 0:
+        for limit, fmt, marker in _UINT_FORMATS:
+            if val <= limit:
+                parts.append(struct.pack(fmt, marker, val))
+                return
+        if val > 0xFFFFFFFFFFFFFFFF:
+            raise OverflowError("Integer value out of range for MessagePack")
+        parts.append(struct.pack(">BQ", 0xCF, val))
+    else:
+        for limit, fmt, marker in _INT_FORMATS:
+            if val >= limit:
+                parts.append(struct.pack(fmt, marker, val))
+                return
+        if val < -0x8000000000000000:
+            raise OverflowError("Integer value out of range for MessagePack")
+        parts.append(struct.pack(">Bq", 0xD3, val))
+
+
+def _pack_header(n, fix_marker, fix_limit, marker8, marker16, marker32, parts):
+    if n < fix_limit:
+        parts.append(bytes((fix_marker | n,)))
+    elif marker8 is not None and n <= 0xFF:
+        parts.append(struct.pack(">BB", marker8, n))
+    elif n <= 0xFFFF:
+        parts.append(struct.pack(">BH", marker16, n))
+    else:
+        parts.append(struct.pack(">BI", marker32, n))
+
+
+def _pack(val, parts):
+    """
+    Appends the MessagePack encoding of *val* to the list *parts*
+    """
+    t = type(val)
+    if t is str:
+        data = val.encode("utf-8")
+        _pack_header(len(data), 0xA0, 32, 0xD9, 0xDA, 0xDB, parts)
+        parts.append(data)
+    elif t is int:
+        _pack_int(val, parts)
+    elif t is float:
+        parts.append(_pack_float(0xCB, val))
+    elif val is None:
+        parts.append(b"\xc0")
+    elif val is True:
+        parts.append(b"\xc3")
+    elif val is False:
+        parts.append(b"\xc2")
+    elif isinstance(val, dict):
+        _pack_header(len(val), 0x80, 16, None, 0xDE, 0xDF, parts)
+        for key, item in val.items():
+            _pack(key, parts)
+            _pack(item, parts)
+    elif isinstance(val, (list, tuple)):
+        _pack_header(len(val), 0x90, 16, None, 0xDC, 0xDD, parts)
+        for item in val:
+            _pack(item, parts)
+    elif isinstance(val, (bytes, bytearray, memoryview)):
+        val = bytes(val)
+        _pack_header(len(val), 0, 0, 0xC4, 0xC5, 0xC6, parts)
+        parts.append(val)
+    elif isinstance(val, bool):
+        _pack(bool(val), parts)
+    elif isinstance(val, int):
+        _pack_int(int(val), parts)
+    elif isinstance(val, float):
+        parts.append(_pack_float(0xCB, float(val)))
+    elif isinstance(val, str):
+        _pack(str(val), parts)
+    else:
+        converted = to_document_value(val)
+        if converted is val:
+            raise TypeError(
+                "Object of type {0} cannot be encoded with MessagePack".format(
+                    type(val).__name__
+                )
+            )
+        _pack(converted, parts)
+
+
+def packb(val):
+    """
+    Encodes *val* as MessagePack bytes (pure python implementation, for
+    compatibility only)
+    """
+    parts = []
+    _pack(val, parts)
+    return b"".join(parts)
+
+
+_FIXED_FORMATS = {
+    0xCC: struct.Struct(">B"),
+    0xCD: struct.Struct(">H"),
+    0xCE: struct.Struct(">I"),
+    0xCF: struct.Struct(">Q"),
+    0xD0: struct.Struct(">b"),
+    0xD1: struct.Struct(">h"),
+    0xD2: struct.Struct(">i"),
+    0xD3: struct.Struct(">q"),
+    0xCA: struct.Struct(">f"),
+    0xCB: struct.Struct(">d"),
+}
+
+# marker -> (kind, struct of the length)
+_SIZED_FORMATS = {
+    0xD9: ("str", struct.Struct(">B")),
+    0xDA: ("str", struct.Struct(">H")),
+    0xDB: ("str", struct.Struct(">I")),
+    0xC4: ("bin", struct.Struct(">B")),
+    0xC5: ("bin", struct.Struct(">H")),
+    0xC6: ("bin", struct.Struct(">I")),
+    0xDC: ("array", struct.Struct(">H")),
+    0xDD: ("array", struct.Struct(">I")),
+    0xDE: ("map", struct.Struct(">H")),
+    0xDF: ("map", struct.Struct(">I")),
+}
+
+
+def _unpack(data, pos):
+    """
+    Decodes the MessagePack value starting at *pos* in *data*.  Returns the value
+    and the position after it.
+    """
+    marker = data[pos]
+    pos += 1
+    if marker < 0x80:
+        return marker, pos
+    elif marker >= 0xE0:
+        return marker - 0x100, pos
+    elif 0xA0 <= marker <= 0xBF:
+        end = pos + (marker & 0x1F)
+        return str(data[pos:end], "utf-8"), end
+    elif 0x90 <= marker <= 0x9F:
+        return _unpack_array(data, pos, marker & 0x0F)
+    elif 0x80 <= marker <= 0x8F:
+        return _unpack_map(data, pos, marker & 0x0F)
+    elif marker == 0xC0:
+        return None, pos
+    elif marker == 0xC2:
+        return False, pos
+    elif marker == 0xC3:
+        return True, pos
+    elif marker in _FIXED_FORMATS:
+        fmt = _FIXED_FORMATS[marker]
+        return fmt.unpack_from(data, pos)[0], pos + fmt.size
+    elif marker in _SIZED_FORMATS:
+        kind, fmt = _SIZED_FORMATS[marker]
+        n = fmt.unpack_from(data, pos)[0]
+        pos += fmt.size
+        if kind == "str":
+            return str(data[pos : pos + n], "utf-8"), pos + n
+        elif kind == "bin":
+            return bytes(data[pos : pos + n]), pos + n
+        elif kind == "array":
+            return _unpack_array(data, pos, n)
+        return _unpack_map(data, pos, n)
+
+    raise ValueError("Unsupported MessagePack type 0x{0:x}".format(marker))
+
+
+def _unpack_array(data, pos, n):
+    result = []
+    for __ in range(n):
+        item, pos = _unpack(data, pos)
+        result.append(item)
+    return result, pos
+
+
+def _unpack_map(data, pos, n):
+    result = {}
+    for __ in range(n):
+        key, pos = _unpack(data, pos)
+        result[key], pos = _unpack(data, pos)
+    return result, pos
+
+
+def unpackb(data):
+    """
+    Decodes MessagePack bytes (pure python implementation, for compatibility only)
+    """
+    data = memoryview(data)
+    val, pos = _unpack(data, 0)
+    if pos != len(data):
+        raise ValueError("Extra data after the MessagePack value")
+    return val
+
+
+class MsgPackEncoder(object):
+    """
+    A binary (MessagePack) document encoder using the msgpack library
+    """
+
+    def __init__(self, accelerated=True):
+        """
+        :param bool accelerated: whether to use the msgpack library (its C
+            extension), which is required by default.  False uses the pure python
+            implementation of the format (packb/unpackb), which is much slower and
+            only meant for reading existing binary collections without msgpack.
+        """
+        if accelerated and not HAS_MSGPACK:
+            raise ImportError(
+                "The msgpack library is not installed.  MsgPackEncoder("
+                "accelerated=False) uses a slow pure python implementation instead."
+            )
+        self.accelerated = accelerated
+
+        if accelerated:
+            self._packb = lambda val: msgpack.packb(val, default=to_document_value)
+            self._unpackb = lambda val: msgpack.unpackb(
+                val, raw=False, strict_map_key=False
+            )
+        else:
+            self._packb = packb
+            self._unpackb = unpackb
+
+    def encode(self, val):
+        """
+        Encodes a dict/list object or a dataclass instance to MessagePack bytes
+        """
+        if is_dataclass(val) and not isinstance(val, type):
+            val = asdict(val, copy=False)
+        return self._packb(val)
+
+    def decode(self, val):
+        """
+        Decodes MessagePack bytes into a dict/list object
+        """
+        return self._unpackb(val)
+
+    def __reduce__(self):
+        return (MsgPackEncoder, (self.accelerated,))
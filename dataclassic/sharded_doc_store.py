@@ -0,0 +1,310 @@
+"""
+sharded_doc_store module
+------------------------
+
+A JSON document store partitioned over several sqlite database files.  Documents
+are assigned to a shard by a hash of their ID, so each file only takes a part of
+the writes and the data.  Queries run on all shards in parallel threads and their
+results are merged.
+
+..code::python
+
+    >>> shapes = ShardedDocumentStore(
+    ...     "shapes", ["sqlite:///shapes0.db", "sqlite:///shapes1.db"]
+    ... )
+    >>> shapes.insert_many([triangle, rectangle, pentagon, hexagon])
+    >>> shapes.find("@sides > ?", (3,), order_by="@sides desc", limit=2)
+"""
+
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from dataclassic.doc_store import (
+    Database,
+    DocumentStore,
+    Find,
+    _returned_document,
+    render_op,
+)
+
+
+def _sql_sort_key(value):
+    """
+    Sort key ordering values like sqlite does: null values first, then numbers, text
+    and blobs.  json objects and arrays are compared as json text.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, bytes):
+        return (3, value)
+    return (2, json.dumps(value, separators=(",", ":")))
+
+
+class ShardedDocumentStore(object):
+    """
+    A collection whose documents are hash partitioned by ID over several databases,
+    with one DocumentStore per database.  The databases are used from worker
+    threads, so they must be pooled (see Database(..., pool_size=N)).
+    Adding or removing shards later requires reloading the documents, as their IDs
+    then hash to other shards.
+    """
+
+    def __init__(self, name, databases, pool_size=2, max_workers=None, **kwargs):
+        """
+        :param str name: name of the collection in each database
+        :param list databases: the shards, as connection strings (like
+            sqlite:///path/to/file.db) or pooled Database objects
+        :param int pool_size: the pool size of the databases opened from connection
+            strings
+        :param int max_workers: the number of threads querying the shards.  Defaults
+            to the number of shards.
+        :param kwargs: passed on to DocumentStore, like dtype or compression
+        """
+        if not databases:
+            raise ValueError("A sharded collection needs at least one database")
+
+        self.name = name
+        self.dbs = []
+        for db in databases:
+            if isinstance(db, str):
+                db = Database(db, pool_size=pool_size)
+            elif not db.pool_size:
+                raise ValueError(
+                    "The databases of a sharded collection are used by several "
+                    "threads and must be pooled (Database(..., pool_size=N))"
+                )
+            self.dbs.append(db)
+
+        self.shards = [DocumentStore(name, db, **kwargs) for db in self.dbs]
+        self.dtype = self.shards[0].dtype
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.shards),
+            thread_name_prefix="dataclassic-shard",
+        )
+
+    def shard_index(self, uid):
+        """
+        Gets the index of the shard holding the document with ID *uid*
+        """
+        return zlib.crc32(str(uid).encode("utf-8")) % len(self.shards)
+
+    def shard_for(self, uid):
+        """
+        Gets the DocumentStore holding the document with ID *uid*
+        """
+        return self.shards[self.shard_index(uid)]
+
+    def _scatter(self, func, items=None):
+        """
+        Calls func(shard) or, if *items* is given, func(shard, items[i]) for the shards
+        in parallel and returns the results in the order of the shards
+        """
+        if items is None:
+            return list(self.executor.map(func, self.shards))
+        return list(self.executor.map(func, self.shards, items))
+
+    def _partition(self, docs):
+        """
+        Splits *docs* into one list per shard.  Documents without an ID get one.
+        """
+        parts = [[] for __ in self.shards]
+        prepared = []
+        for doc in docs:
+            uid, doc = self.shards[0]._prepare_document(doc)
+            parts[self.shard_index(uid)].append(doc)
+            prepared.append(doc)
+        return parts, prepared
+
+    def insert(self, doc, upsert=False, as_dicts=True):
+        """
+        Inserts a document into its shard (see DocumentStore.insert)
+        """
+        uid, doc = self.shards[0]._prepare_document(doc)
+        return self.shard_for(uid).insert(doc, upsert=upsert, as_dicts=as_dicts)
+
+    def insert_many(self, docs, as_dicts=True):
+        """
+        Inserts documents into their shards, writing to the shards in parallel.  Each
+        shard inserts its documents in one transaction.
+
+        :param bool as_dicts: return dataclasses with an ID as dicts (see
+            DocumentStore.insert)
+        :returns: the inserted documents
+        """
+        parts, prepared = self._partition(docs)
+        self._scatter(
+            lambda shard, part: part and shard.insert_many(part, as_dicts=False), parts
+        )
+        return [_returned_document(doc, as_dicts) for doc in prepared]
+
+    def delete(self, doc):
+        """
+        Deletes a document from its shard
+        """
+        uid = doc.ID if not isinstance(doc, dict) else doc["ID"]
+        self.shard_for(uid).delete(doc)
+
+    def delete_many(self, docs):
+        """
+        Deletes documents from their shards, in parallel
+        """
+        parts = [[] for __ in self.shards]
+        for doc in docs:
+            uid = doc.ID if not isinstance(doc, dict) else doc["ID"]
+            parts[self.shard_index(uid)].append(doc)
+        self._scatter(lambda shard, part: part and shard.delete_many(part), parts)
+
+    def get(self, uid, default=None):
+        """
+        Gets the document with ID *uid* from its shard (see DocumentStore.get)
+        """
+        return self.shard_for(uid).get(uid, default)
+
+    def get_many(self, uids, default=None):
+        """
+        Gets the documents with the IDs *uids* from their shards, in parallel (see
+        DocumentStore.get_many)
+        """
+        uids = list(uids)
+        parts = [[] for __ in self.shards]
+        for uid in uids:
+            parts[self.shard_index(uid)].append(uid)
+        found = {}
+        results = self._scatter(
+            lambda shard, part: shard.get_many(part, default), parts
+        )
+        for part, docs in zip(parts, results):
+            found.update(zip(part, docs))
+        return [found[uid] for uid in uids]
+
+    def add_index(self, *args, **kwargs):
+        """
+        Adds the index to every shard (see DocumentStore.add_index)
+        """
+        for shard in self.shards:
+            shard.add_index(*args, **kwargs)
+
+    def update_index(self, *args, **kwargs):
+        """
+        Updates the index of every shard, in parallel (see DocumentStore.update_index)
+        """
+        self._scatter(lambda shard: shard.update_index(*args, **kwargs))
+
+    def find(
+        self,
+        clause=None,
+        params=None,
+        limit=None,
+        dtype=None,
+        fields=None,
+        order_by=None,
+        offset=None,
+    ):
+        """
+        Searches all shards in parallel and merges their records (see
+        DocumentStore.find).  With *order_by* the merged records are sorted like
+        sqlite sorts them.  Each shard returns at most *offset* + *limit* records,
+        the offset and limit are applied to the merged records.
+        """
+        if isinstance(clause, Find):
+            return self.find(
+                limit=limit,
+                **clause._find_kwargs(
+                    dtype=dtype, fields=fields, order_by=order_by, offset=offset
+                ),
+            )
+
+        order = DocumentStore._parse_order_by(order_by)
+        shard_fields = fields
+        if fields:
+            # the attributes sorted by are needed to merge the records
+            shard_fields = list(fields) + [a for a, __ in order if a not in fields]
+        shard_limit = None if limit is None else limit + (offset or 0)
+
+        results = self._scatter(
+            lambda shard: shard.find(
+                clause,
+                params,
+                limit=shard_limit,
+                dtype=dtype,
+                fields=shard_fields,
+                order_by=order_by,
+            )
+        )
+        records = [record for result in results for record in result]
+
+        # stable sorts by the last to the first attribute sort by all of them
+        for attribute, descending in reversed(order):
+            if fields:
+                key = self._field_sort_key(attribute)
+            else:
+                key = self._document_sort_key(attribute)
+            records.sort(key=key, reverse=descending)
+
+        start = offset or 0
+        stop = None if limit is None else start + limit
+        records = records[start:stop]
+
+        if fields and len(shard_fields) > len(fields):
+            keep = set(fields)
+            records = [{k: v for k, v in r.items() if k in keep} for r in records]
+        return records
+
+    def _document_sort_key(self, attribute):
+        get_attribute = self.shards[0]._get_attribute
+
+        def key(doc):
+            return _sql_sort_key(get_attribute(doc, attribute, None))
+
+        return key
+
+    @staticmethod
+    def _field_sort_key(attribute):
+        def key(record):
+            return _sql_sort_key(record[attribute])
+
+        return key
+
+    def find2(
+        self,
+        where=None,
+        limit=None,
+        dtype=None,
+        fields=None,
+        order_by=None,
+        offset=None,
+    ):
+        """
+        Searches all shards using mongodb like syntax (see DocumentStore.find2 and
+        find)
+        """
+        if where is not None:
+            clause, params = render_op(where, attrPrefix="@")
+        else:
+            clause, params = None, None
+        return self.find(clause, params, limit, dtype, fields, order_by, offset)
+
+    def count(self, where=None, params=None):
+        """
+        Counts the matching documents of all shards (see DocumentStore.count)
+        """
+        return sum(self._scatter(lambda shard: shard.count(where, params)))
+
+    def close(self):
+        """
+        Stops the worker threads and closes the databases
+        """
+        self.executor.shutdown()
+        for db in self.dbs:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
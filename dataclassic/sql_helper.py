@@ -119,13 +119,14 @@ class sqlite_dialect:
     def __init__(self):
         pass
 
-    def connect(self, dbfile):
+    def connect(self, dbfile, **kwargs):
         """
-        Establishes a connection to a sqlite database
+        Establishes a connection to a sqlite database.  The keyword arguments are
+        passed on to sqlite3.connect.
         """
         import sqlite3
 
-        return sqlite3.connect(dbfile)
+        return sqlite3.connect(dbfile, **kwargs)
 
     @classmethod
     def render_column(cls, column):
@@ -242,13 +243,18 @@ class sqlite_dialect:
         return cmd
 
     @classmethod
-    def render_insert(cls, table, dict_):
+    def render_insert(cls, table, dict_, on_conflict=None):
+        """
+        :param str on_conflict: the conflict resolution for the insert, like
+            "replace" or "ignore"
+        """
 
         k = dict_.keys()
         cols = ",".join((cls.qname(c) for c in k))
         vals = ",".join(["?"] * len(dict_))
-        cmd = "insert into {t} ({c}) values({v})".format(
-            t=cls.qname(table), c=cols, v=vals
+        verb = "insert" if on_conflict is None else "insert or " + on_conflict
+        cmd = "{i} into {t} ({c}) values({v})".format(
+            i=verb, t=cls.qname(table), c=cols, v=vals
         )
         params = tuple((dict_[c] for c in k))
         return cmd, params
@@ -283,10 +289,39 @@ class sqlite_dialect:
 
     @classmethod
     def render_index(cls, name, table, attribute):
+        """
+        Renders the sql creating an index on the column *attribute*, or on several
+        columns if *attribute* is a list or tuple
+        """
+        if isinstance(attribute, (list, tuple)):
+            cols = ", ".join(cls.qname(a) for a in attribute)
+        else:
+            cols = cls.qname(attribute)
         cmd = "create index {n} on {t} ({a});"
-        cmd = cmd.format(n=cls.qname(name), t=cls.qname(table), a=cls.qname(attribute))
+        cmd = cmd.format(n=cls.qname(name), t=cls.qname(table), a=cols)
         return cmd
 
+    @classmethod
+    def render_expression_index(cls, name, table, expression):
+        """
+        Renders the sql creating an index on an expression (like a json_extract call)
+        """
+        cmd = "create index if not exists {n} on {t} ({e});"
+        return cmd.format(n=cls.qname(name), t=cls.qname(table), e=expression)
+
+    @classmethod
+    def get_indexes(cls, db, table=None):
+        """
+        Gets a list of the names of indexes in the database, optionally only
+        those on *table*
+        """
+        query = SelectFrom("sqlite_master").columns("name")
+        if table is None:
+            query.where("type = ?", ("index",))
+        else:
+            query.where("type = ? and tbl_name = ?", ("index", table))
+        return [t["name"] for t in query.fetchall(db)]
+
     @classmethod
     def _is_quoted(cls, v, quote_char):
 
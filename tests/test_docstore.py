@@ -1,7 +1,14 @@
+import math
+import sqlite3
+import threading
+
 import pytest
 
 from dataclassic import Database, DocumentStore, Find, is_dataclass
+from dataclassic.doc_store import warn_full_scan
+from dataclassic.encoders import JsonEncoder
 from tests._test_setup import Shape, hexagon, pentagon, rectangle, triangle
+from tests._test_tools import Raises
 
 
 # class TestPostInit(TestCase):
@@ -58,5 +65,1077 @@ def test_FindClass():
     print(f)
 
 
+def test_insert_dataclass_with_index():
+    db, shapes, chairs = setUp()
+    shapes.add_index("sides", "INTEGER")
+
+    shapes.insert(triangle)
+    shapes.insert_many((rectangle, pentagon, hexagon))
+
+    res = shapes.find("@sides > ?", (4,))
+    assert sorted(s.ID for s in res) == ["hexagaon", "pentagon"]
+
+    cursor = db.cursor()
+    cursor.execute("select count(*) from index_sides_on_shapes")
+    assert cursor.fetchone()[0] == 4
+
+
+def test_insert_returns_dicts():
+    db, shapes, chairs = setUp()
+    res = shapes.insert(triangle)
+    assert res == {"ID": "triangle", "sides": 3, "color": "red"}
+    res = shapes.insert_many((rectangle, {"ID": "square", "sides": 4}))
+    assert [d["ID"] for d in res] == ["rectangle", "square"]
+
+    # the dataclasses themselves are returned on request
+    assert shapes.insert(pentagon, as_dicts=False) is pentagon
+    assert shapes.insert_many([hexagon], as_dicts=False)[0] is hexagon
+
+
+def test_insert_dataclass_zlib():
+    db = Database("sqlite:///:memory:")
+    shapes = DocumentStore("shapes", db, True, dtype=Shape)
+
+    shapes.insert_many((triangle, rectangle, pentagon, hexagon))
+    res = shapes.find("@color = ?", ("red",))
+    assert sorted(s.ID for s in res) == ["pentagon", "triangle"]
+
+
+def _nested_docs(n):
+    return [
+        {
+            "ID": f"doc{i:06d}",
+            "sides": i % 9,
+            "color": ["red", "blue", "green"][i % 3],
+            "dims": {"width": i % 11, "height": 2.0},
+        }
+        for i in range(n)
+    ]
+
+
+def test_json1_matches_udf():
+    db = Database("sqlite:///:memory:", encoder=JsonEncoder(allow_nan=False))
+    docs = DocumentStore("docs", db)
+    docs.insert_many(_nested_docs(200))
+    assert docs.uses_json1()
+
+    clause = "@sides > ? and @dims.width <= ? and @missing is null"
+    fast = docs.find(clause, (4, 5))
+    docs.use_json1 = False
+    slow = docs.find(clause, (4, 5))
+    assert len(fast) > 0
+    assert fast == slow
+
+    # compressed collections always use the field function
+    zdocs = DocumentStore("zdocs", db, True)
+    assert not zdocs.uses_json1()
+
+    # json_extract can not read the NaN and Infinity written by default
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    assert not docs.uses_json1()
+    docs.insert_many([{"ID": "nan", "sides": 50, "width": math.nan}, *_nested_docs(5)])
+    assert [d["ID"] for d in docs.find("@sides > ?", (10,))] == ["nan"]
+
+
+@pytest.mark.benchmark
+def test_benchmark_json1():
+    import timeit
+
+    db = Database("sqlite:///:memory:", encoder=JsonEncoder(allow_nan=False))
+    docs = DocumentStore("docs", db)
+    docs.insert_many(_nested_docs(20000))
+    n = 3
+    json1 = timeit.timeit(lambda: docs.find("@sides > ?", (7,)), number=n)
+    docs.use_json1 = False
+    udf = timeit.timeit(lambda: docs.find("@sides > ?", (7,)), number=n)
+    print(
+        f"\nfind('@sides > ?') on 20000 documents"
+        f"\n  field() UDF:   {udf / n * 1e3:.1f} ms"
+        f"\n  json_extract:  {json1 / n * 1e3:.1f} ms"
+    )
+
+
+def test_field_decodes_each_row_once():
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db, True)
+    docs.insert_many(_nested_docs(100))
+
+    db.reset_field_stats()
+    res = docs.find("@color = ? and @sides >= ? and @dims.width >= ?", ("red", 0, 0))
+    assert len(res) == 34
+
+    stats = db.field_stats()
+    # the color test is evaluated for all rows, the others only for red documents
+    assert stats["calls"] == 100 + 2 * 34
+    assert stats["decodes"] == 100
+    assert stats["saved"] == 2 * 34
+
+
+def test_expression_index():
+    db = Database("sqlite:///:memory:", encoder=JsonEncoder(allow_nan=False))
+    docs = DocumentStore("docs", db)
+    docs.insert_many(_nested_docs(100))
+    docs.add_index("dims.width", mode="expression")
+
+    assert docs.has_index("dims.width")
+    assert docs.find_expression_indexes() == {
+        "dims.width": "exprindex_dims.width_on_docs"
+    }
+    # no side table is created or written
+    assert db.tables() == ["collectionj_docs"]
+    docs.insert({"ID": "new", "sides": 1, "dims": {"width": 42}})
+    docs.update_index("dims.width")
+
+    res = docs.find("@dims.width = ?", (42,))
+    assert [d["ID"] for d in res] == ["new"]
+
+    clause = docs._resolve_attributes("@dims.width = ?")
+    plan = db.conn.execute(
+        f"explain query plan select Document from collectionj_docs where {clause}", (3,)
+    ).fetchall()
+    assert "exprindex_dims.width_on_docs" in plan[0]["detail"]
+
+    zdocs = DocumentStore("zdocs", db, True)
+    with Raises(ValueError):
+        zdocs.add_index("sides", mode="expression")
+
+    # json_extract can not index the NaN and Infinity written by default
+    lax = DocumentStore("lax", Database("sqlite:///:memory:"))
+    with Raises(ValueError):
+        lax.add_index("sides", mode="expression")
+    with Raises(ValueError):
+        docs.insert({"ID": "nan", "dims": {"width": math.nan}})
+    assert len(docs.find()) == 101
+
+    # the collection stays strict when opened with the default encoder
+    again = DocumentStore("docs", Database("sqlite:///:memory:", db.conn))
+    assert not again._encoder.allow_nan
+
+
 if __name__ == "__main__":
     pytest()
+
+
+def _index_rows(docs, attribute):
+    cmd = (
+        f'select ID, "{attribute}" from "{docs.get_index_name(attribute)}" order by ID'
+    )
+    return [tuple(row) for row in docs.db.conn.execute(cmd)]
+
+
+@pytest.mark.parametrize("use_zlib_encoder", [False, True])
+def test_update_index(use_zlib_encoder):
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db, use_zlib_encoder)
+    docs.insert_many(_nested_docs(50), do_commit=True)
+
+    # the index is created with the inferred type and filled
+    docs.update_index("dims.width")
+    expected = [(d["ID"], d["dims"]["width"]) for d in _nested_docs(50)]
+    assert _index_rows(docs, "dims.width") == expected
+
+    # the first incremental update starts logging changes and rebuilds the index
+    docs.update_index("dims.width", incremental=True)
+    assert "changes_on_docs" in db.tables()
+    assert _index_rows(docs, "dims.width") == expected
+
+    # documents changed behind the index' back
+    cmd = 'update "{0}" set Document = ? where ID = ?'.format(docs.table_name)
+    with db.conn as conn:
+        conn.execute(cmd, (docs.encode({"ID": "doc000003", "dims": {}}), "doc000003"))
+        conn.execute(
+            cmd, (docs.encode({"ID": "doc000004", "dims": {"width": 99}}), "doc000004")
+        )
+        conn.execute(f'delete from "{docs.table_name}" where ID = ?', ("doc000005",))
+        conn.execute(
+            f'insert into "{docs.table_name}" values(?, ?)',
+            ("new", docs.encode({"ID": "new", "dims": {"width": 7}})),
+        )
+
+    docs.update_index("dims.width", incremental=True)
+    changed = dict(expected)
+    del changed["doc000003"], changed["doc000005"]
+    changed["doc000004"] = 99
+    changed["new"] = 7
+    assert _index_rows(docs, "dims.width") == sorted(changed.items())
+    # the processed changes are pruned from the log
+    assert db.conn.execute("select count(*) from changes_on_docs").fetchone()[0] == 0
+
+    # changes after the prune are still picked up
+    with db.conn as conn:
+        conn.execute(
+            cmd, (docs.encode({"ID": "doc000006", "dims": {"width": 42}}), "doc000006")
+        )
+    docs.update_index("dims.width", incremental=True)
+    changed["doc000006"] = 42
+    assert _index_rows(docs, "dims.width") == sorted(changed.items())
+
+    # a full rebuild gives the same result
+    docs.update_index("dims.width")
+    assert _index_rows(docs, "dims.width") == sorted(changed.items())
+
+
+def test_composite_index():
+    db = Database("sqlite:///:memory:", encoder=JsonEncoder(allow_nan=False))
+    plain = DocumentStore("plain", db)
+    plain.insert_many(_nested_docs(300), do_commit=True)
+
+    docs = DocumentStore("docs", db)
+    docs.add_index(["color", "dims.width"])
+    assert docs.has_index(["color", "dims.width"])
+    assert docs.find_composite_indexes() == {
+        ("color", "dims.width"): "cindex_color,dims.width_on_docs"
+    }
+    # the index table is filled on insert
+    docs.insert_many(_nested_docs(300), do_commit=True)
+    docs.insert({"ID": "nodims", "color": "red"})
+    docs.insert({"ID": "doc000001", "color": "red", "dims": {"width": 3}}, upsert=True)
+    docs.delete({"ID": "doc000002"})
+    plain.insert({"ID": "nodims", "color": "red"})
+    plain.insert({"ID": "doc000001", "color": "red", "dims": {"width": 3}}, upsert=True)
+    plain.delete({"ID": "doc000002"})
+
+    clause = "@color = ? and @dims.width > ? and @sides < ? order by @dims.width"
+    params = ("red", 2, 7)
+    expected = plain.find(clause, params)
+    res = docs.find(clause, params)
+    assert len(expected) > 0
+    assert sorted(d["ID"] for d in res) == sorted(d["ID"] for d in expected)
+    widths = [d["dims"]["width"] for d in res]
+    assert widths == sorted(widths)
+    where = {"$eq": {"color": "red"}}
+    assert sorted(d["ID"] for d in docs.find2(where)) == sorted(
+        d["ID"] for d in plain.find2(where)
+    )
+
+    # one index table is joined for both attributes and is used for the order by
+    sql, joins = docs._resolve_attributes(clause, use_index=True)
+    assert joins.count("join") == 1
+    plan = db.conn.execute(
+        f"explain query plan select Document from collectionj_docs {joins} where {sql}",
+        params,
+    ).fetchall()
+    details = " ".join(row["detail"] for row in plan)
+    assert "index_cindex_color,dims.width_on_docs" in details
+    assert "TEMP B-TREE" not in details
+
+    # a rebuild gives the same rows as the incremental maintenance
+    cmd = 'select * from "cindex_color,dims.width_on_docs" order by ID'
+    before = [tuple(row) for row in db.conn.execute(cmd)]
+    docs.update_index(["color", "dims.width"])
+    assert [tuple(row) for row in db.conn.execute(cmd)] == before
+    assert ("nodims", "red", None) in before
+
+    plain.add_index(["color", "sides"], mode="expression")
+    assert ("color", "sides") in plain.find_expression_indexes()
+
+
+def test_explain():
+    db = Database("sqlite:///:memory:", encoder=JsonEncoder(allow_nan=False))
+    docs = DocumentStore("docs", db)
+    docs.insert_many(_nested_docs(100), do_commit=True)
+    docs.update_index("color")
+
+    query_plan = docs.explain("@color = ? and @dims.width > ?", ("red", 3))
+    assert query_plan.params == ("red", 3)
+    assert query_plan.indexes == {"color": "index_color_on_docs"}
+    assert query_plan.decoded == ["dims.width"]
+    assert query_plan.function == "json_extract"
+    assert "index_color_on_docs" in " ".join(query_plan.plan)
+    assert not query_plan.full_scan
+
+    # a find2 query on an unindexed attribute reads every document
+    query_plan = docs.explain({"$gt": {"sides": 4}})
+    assert query_plan.sql.startswith('select "Document" from "collectionj_docs"')
+    assert query_plan.params == (4,)
+    assert query_plan.decoded == ["sides"]
+    assert query_plan.full_scan
+
+    docs.use_json1 = False
+    assert docs.explain("@sides > ?", (4,)).function == "field"
+
+    seen = []
+    docs.full_scan_hook = seen.append
+    docs.find("@color = ?", ("red",))
+    assert seen == []
+    res = docs.find("@sides > ?", (4,))
+    assert len(seen) == 1 and seen[0].decoded == ["sides"]
+
+    docs.full_scan_hook = warn_full_scan
+    with pytest.warns(UserWarning, match="sides"):
+        assert docs.find("@sides > ?", (4,)) == res
+
+
+def test_find_iter():
+    db, shapes, chairs = setUp()
+    shapes.insert_many((triangle, rectangle, pentagon, hexagon))
+
+    res = shapes.find_iter("@sides > ?", (3,), batch_size=1)
+    assert not isinstance(res, list)
+    assert list(res) == shapes.find("@sides > ?", (3,))
+    assert all(isinstance(s, Shape) for s in shapes.find2_iter({"$gt": {"sides": 3}}))
+    assert list(shapes.find_iter(dtype=dict, limit=2)) == shapes.find(
+        dtype=dict, limit=2
+    )
+
+    # find2_iter decodes with its own collection's encoder even when interleaved
+    zdocs = DocumentStore("zdocs", db, True)
+    zdocs.insert_many(_nested_docs(10), do_commit=True)
+    zdocs.use_json1 = shapes.use_json1 = False
+    zres = zdocs.find2_iter({"$lt": {"sides": 5}}, batch_size=2)
+    first = next(zres)
+    shapes.find("@sides > ?", (3,))
+    assert [first] + list(zres) == zdocs.find("@sides < ?", (5,))
+
+
+def test_find_iter_memory():
+    import tracemalloc
+
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    docs.insert_many(_nested_docs(20000), do_commit=True)
+
+    def peak(func):
+        tracemalloc.start()
+        func()
+        __, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    count = [0]
+
+    def consume():
+        for doc in docs.find_iter(batch_size=500):
+            count[0] += 1
+
+    full = peak(lambda: len(docs.find()))
+    lazy = peak(consume)
+    assert count[0] == 20000
+    print(f"\npeak memory find: {full / 1e6:.1f} MB  find_iter: {lazy / 1e6:.1f} MB")
+    assert lazy < full / 4
+
+
+@pytest.mark.parametrize("use_zlib_encoder", [False, True])
+def test_find_fields(use_zlib_encoder):
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db, use_zlib_encoder)
+    docs.insert_many(_nested_docs(30), do_commit=True)
+    docs.insert({"ID": "odd", "sides": "7", "color": None})
+
+    fields = ["ID", "dims.width", "color", "dims", "missing"]
+    res = docs.find("@sides = ?", (7,), fields=fields)
+    expected = [
+        {
+            "ID": d["ID"],
+            "dims.width": d["dims"]["width"],
+            "color": d["color"],
+            "dims": d["dims"],
+            "missing": None,
+        }
+        for d in _nested_docs(30)
+        if d["sides"] == 7
+    ]
+    assert res == expected
+    assert docs.find("@ID = ?", ("odd",), fields=["sides", "color"]) == [
+        {"sides": "7", "color": None}
+    ]
+    assert docs.find2({"$eq": {"sides": 7}}, fields=fields) == expected
+    assert list(docs.find_iter("@sides = ?", (7,), fields=fields, batch_size=2)) == (
+        expected
+    )
+
+
+def test_find_fields_with_find_query():
+    db, shapes, chairs = setUp()
+    shapes.insert_many((triangle, rectangle, pentagon, hexagon))
+
+    query = Find(Shape).where("sides").is_greater_than(4).select("ID", "sides")
+    assert shapes.find(query) == [
+        {"ID": s.ID, "sides": s.sides} for s in (pentagon, hexagon)
+    ]
+    assert shapes.find(Find(Shape).where("sides").is_less_than(4)) == [triangle]
+    assert shapes.explain(query).decoded == ["sides"]
+
+
+@pytest.mark.benchmark
+def test_benchmark_find_fields():
+    import timeit
+
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    wide = [
+        dict(d, **{f"key{k}": f"value {k}" for k in range(200)})
+        for d in _nested_docs(2000)
+    ]
+    docs.insert_many(wide, do_commit=True)
+    n = 3
+    full = timeit.timeit(lambda: docs.find("@sides > ?", (4,)), number=n)
+    projected = timeit.timeit(
+        lambda: docs.find("@sides > ?", (4,), fields=["ID", "dims.width"]), number=n
+    )
+    print(
+        f"\nfind on 2000 documents with 200 keys"
+        f"\n  whole documents:  {full / n * 1e3:.1f} ms"
+        f"\n  two fields:       {projected / n * 1e3:.1f} ms"
+    )
+
+
+def _sorted(docs, order):
+    # sqlite sorts NULL first and ties are broken by the ID
+    docs = sorted(docs, key=lambda d: d["ID"])
+    for attribute, descending in reversed(order):
+        docs.sort(
+            key=lambda d: (d.get(attribute) is not None, d.get(attribute) or 0),
+            reverse=descending,
+        )
+    return docs
+
+
+def _paged_docs():
+    docs = _nested_docs(200)
+    for doc in docs[::7]:
+        del doc["sides"]
+    return docs
+
+
+@pytest.mark.parametrize(
+    "order",
+    [
+        [("sides", False)],
+        [("sides", True)],
+        [("color", False), ("sides", True)],
+        [("sides", True), ("color", True)],
+    ],
+)
+def test_find_page(order):
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    docs.add_index(["color", "sides"])
+    docs.insert_many(_paged_docs(), do_commit=True)
+
+    order_by = [f"@{a} desc" if d else f"@{a}" for a, d in order]
+    expected = _sorted((d for d in _paged_docs() if d["color"] != "green"), order)
+
+    pages = []
+    token = None
+    while True:
+        page = docs.find_page("@color <> ?", ("green",), order_by, 17, token)
+        pages.append(page.items)
+        token = page.token
+        if token is None:
+            break
+    assert [d["ID"] for p in pages for d in p] == [d["ID"] for d in expected]
+    assert len(pages) == len(expected) // 17 + 1
+
+    # the same page from find with the token, and with an offset
+    token = docs.find_page("@color <> ?", ("green",), order_by, 17).token
+    second = docs.find("@color <> ?", ("green",), 17, order_by=order_by, after=token)
+    assert second == pages[1]
+    assert docs.find("@color <> ?", ("green",), 17, order_by=order_by, offset=17) == (
+        pages[1]
+    )
+    where = {"$ne": {"color": "green"}}
+    assert docs.find2_page(where, order_by, 17, token).items == pages[1]
+
+    with Raises(ValueError):
+        docs.find_page(order_by="@color", token=token)
+
+
+def test_find_order_by():
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    docs.insert_many(_paged_docs(), do_commit=True)
+
+    res = docs.find("@color = ?", ("red",), order_by=["@sides desc", "ID"])
+    expected = _sorted(
+        (d for d in _paged_docs() if d["color"] == "red"), [("sides", True)]
+    )
+    assert res == expected
+    assert docs.find2({"$eq": {"color": "red"}}, order_by=["@sides desc", "ID"]) == (
+        expected
+    )
+    assert docs.find(order_by="@sides", offset=190) == (
+        _sorted(_paged_docs(), [("sides", False)])[190:]
+    )
+    with Raises(ValueError):
+        docs.find(order_by="@sides up")
+
+    # a single attribute index table does not drop documents missing the attribute
+    docs.update_index("sides")
+    assert len(docs.find(order_by="@sides")) == 200
+    assert len(docs.find("@sides > ?", (-1,), order_by="@sides")) < 200
+
+    # a composite index sorts without a temporary b-tree
+    docs.add_index(["color", "sides"])
+    docs.update_index(["color", "sides"])
+    query = Find(dict).where("color").is_equal_to("red").order_by("@sides")
+    assert docs.find(query) == docs.find("@color = ?", ("red",), order_by="@sides")
+    query_plan = docs.explain(query)
+    assert "TEMP B-TREE" not in " ".join(query_plan.plan)
+    assert query_plan.decoded == []
+    assert (
+        docs.find(query.offset(3).select("ID"))
+        == [
+            {"ID": d["ID"]}
+            for d in docs.find("@color = ?", ("red",), order_by="@sides")
+        ][3:]
+    )
+
+
+@pytest.mark.benchmark
+def test_benchmark_find_page():
+    import timeit
+
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    docs.add_index(["sides", "color"])
+    docs.insert_many(_nested_docs(20000), do_commit=True)
+
+    page = docs.find_page(order_by="@sides", page_size=100)
+    for __ in range(150):
+        page = docs.find_page(order_by="@sides", page_size=100, token=page.token)
+    n = 10
+    keyset = timeit.timeit(
+        lambda: docs.find_page(order_by="@sides", page_size=100, token=page.token),
+        number=n,
+    )
+    offset = timeit.timeit(
+        lambda: docs.find(limit=100, order_by="@sides", offset=15100), number=n
+    )
+    print(
+        f"\npage 152 of 100 documents ordered by an indexed attribute"
+        f"\n  offset:  {offset / n * 1e3:.2f} ms"
+        f"\n  keyset:  {keyset / n * 1e3:.2f} ms"
+    )
+
+
+@pytest.mark.parametrize("use_zlib_encoder", [False, True])
+def test_aggregate(use_zlib_encoder):
+    from collections import Counter
+
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db, use_zlib_encoder)
+    docs.insert_many(_paged_docs(), do_commit=True)
+    source = _paged_docs()
+
+    assert docs.count() == 200
+    assert docs.count("@color = ?", ("red",)) == 67
+    assert docs.count({"$gt": {"sides": 4}}) == sum(
+        1 for d in source if d.get("sides", -1) > 4
+    )
+    assert docs.count(Find(dict).where("sides").is_less_than(2)) == sum(
+        1 for d in source if d.get("sides", 99) < 2
+    )
+
+    assert docs.distinct("color") == ["blue", "green", "red"]
+    assert docs.distinct("@sides") == [None] + list(range(9))
+    assert docs.distinct("dims.width", {"$eq": {"color": "red"}}) == sorted(
+        {d["dims"]["width"] for d in source if d["color"] == "red"}
+    )
+
+    res = docs.aggregate(
+        group_by=["color", "sides"],
+        metrics={
+            "n": "count",
+            "with_sides": ("count", "sides"),
+            "width": ("sum", "dims.width"),
+            "max_width": ("MAX", "@dims.width"),
+            "height": ("avg", "dims.height"),
+        },
+        where="@dims.width < ?",
+        params=(9,),
+    )
+    selected = [d for d in source if d["dims"]["width"] < 9]
+    counts = Counter((d["color"], d.get("sides")) for d in selected)
+    assert [(r["color"], r["sides"]) for r in res] == sorted(
+        counts, key=lambda k: (k[0], k[1] is not None, k[1] or 0)
+    )
+    for row in res:
+        group = [
+            d
+            for d in selected
+            if (d["color"], d.get("sides")) == (row["color"], row["sides"])
+        ]
+        assert row["n"] == len(group)
+        assert row["with_sides"] == (0 if row["sides"] is None else len(group))
+        assert row["width"] == sum(d["dims"]["width"] for d in group)
+        assert row["max_width"] == max(d["dims"]["width"] for d in group)
+        assert row["height"] == 2.0
+
+    assert docs.aggregate() == [{"count": 200}]
+    with Raises(ValueError):
+        docs.aggregate(metrics={"x": ("median", "sides")})
+
+
+def test_aggregate_uses_index():
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    docs.add_index(["color", "sides"])
+    docs.insert_many(_paged_docs(), do_commit=True)
+
+    cmd = docs._render_query("@color, count(*)", " group by @color", None)
+    assert "cindex_color,sides_on_docs" in cmd
+    assert docs.aggregate("color", {"sides": ("sum", "sides")}) == [
+        {
+            "color": c,
+            "sides": sum(d.get("sides", 0) for d in _paged_docs() if d["color"] == c),
+        }
+        for c in ("blue", "green", "red")
+    ]
+
+
+def test_bulk_load():
+    db = Database("sqlite:///:memory:")
+    docs = DocumentStore("docs", db)
+    docs.add_index(["color", "dims.width"])
+    docs.insert({"ID": "doc000001", "color": "old"})
+
+    stats = docs.bulk_load((d for d in _nested_docs(100)), batch_size=30)
+    assert stats == {"documents": 100, "written": 99}
+    assert docs.count() == 100
+    assert docs.find("@ID = ?", ("doc000001",))[0]["color"] == "old"
+    assert docs.count("@color = ?", ("old",)) == 1
+
+    changed = [dict(d, color="new") for d in _nested_docs(10)]
+    stats = docs.bulk_load(changed, on_conflict="replace", pragmas=True)
+    assert stats == {"documents": 10, "written": 10}
+    assert docs.count("@color = ?", ("new",)) == 10
+    assert docs.explain("@color = ?", ("new",)).decoded == []
+    # the pragmas are restored
+    assert db.conn.execute("pragma synchronous").fetchone()[0] == 2
+
+    db, shapes, chairs = setUp()
+    with Raises(sqlite3.IntegrityError):
+        shapes.bulk_load(
+            [triangle, rectangle, triangle, hexagon], batch_size=2, on_conflict="error"
+        )
+    # the first batch is committed, the failing batch is rolled back
+    assert [s.ID for s in shapes.find(order_by="ID")] == ["rectangle", "triangle"]
+    with Raises(ValueError):
+        shapes.bulk_load([], on_conflict="update")
+
+
+@pytest.mark.benchmark
+def test_benchmark_bulk_load(tmp_path):
+    import time
+
+    n = 20000
+    source = _nested_docs(n)
+    results = {}
+    for name in ("insert_many", "bulk_load", "bulk_load(pragmas=True)"):
+        db = Database(f"sqlite:///{tmp_path / name}.db")
+        docs = DocumentStore("docs", db)
+        docs.add_index(["color", "sides"])
+        start = time.perf_counter()
+        if name == "insert_many":
+            for i in range(0, n, 1000):
+                docs.insert_many(source[i : i + 1000], do_commit=True)
+        else:
+            docs.bulk_load(iter(source), batch_size=1000, pragmas=name.endswith(")"))
+        results[name] = n / (time.perf_counter() - start)
+        assert docs.count() == n
+        db.close()
+
+    print(f"\nloading {n} documents into a file database")
+    for name, rate in results.items():
+        print(f"  {name:25s} {rate:10.0f} docs/sec")
+
+
+def test_pooled_database(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with Raises(ValueError):
+        Database("sqlite:///:memory:", pool_size=2)
+
+    db = Database(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=2)
+    assert db.conn.execute("pragma journal_mode").fetchone()[0] == "wal"
+    docs = DocumentStore("docs", db)
+    packed = DocumentStore("packed", db, use_binary_encoder=True)
+    docs.add_index("color")
+    source = _nested_docs(400)
+
+    def write(i):
+        docs.insert_many(source[i : i + 50])
+        for doc in source[i : i + 50]:
+            packed.insert(doc)
+        return i
+
+    def read(color):
+        # the binary collection is queried with the field function
+        res = (
+            len(docs.find("@color = ?", (color,))),
+            packed.count("@color = ?", (color,)),
+            id(db.conn),
+        )
+        # db.conn is used outside of the operations, so it is given back here
+        db.release()
+        return res
+
+    # connections taken outside of DocumentStore operations are kept by the thread
+    db.release()
+    with ThreadPoolExecutor(4) as pool:
+        assert sorted(pool.map(write, range(0, 400, 50))) == list(range(0, 400, 50))
+        results = list(pool.map(read, ["red", "blue", "green"] * 4))
+
+    assert docs.count() == packed.count() == 400
+    assert docs.explain("@color = ?", ("red",)).decoded == []
+    assert [r[:2] for r in results[:3]] == [(134, 134), (133, 133), (133, 133)]
+    # the 4 threads shared at most pool_size connections, and gave them back after
+    # each operation
+    assert len({r[2] for r in results}) <= 2
+    assert db._idle.qsize() == 2
+
+    # a thread waits for a connection while pool_size connections are in use
+    def keep(started, done):
+        db.conn
+        started.set()
+        done.wait()
+
+    def take(errors):
+        try:
+            db.conn
+        except sqlite3.OperationalError as err:
+            errors.append(err)
+
+    db.conn
+    started, done = threading.Event(), threading.Event()
+    keeper = threading.Thread(target=keep, args=(started, done))
+    keeper.start()
+    started.wait()
+    db.timeout, errors = 0.1, []
+    taker = threading.Thread(target=take, args=(errors,))
+    taker.start()
+    taker.join()
+    assert len(errors) == 1
+    # the connection of a finished thread is free again
+    done.set()
+    keeper.join()
+    taker = threading.Thread(target=take, args=(errors,))
+    taker.start()
+    taker.join()
+    assert len(errors) == 1
+
+    # a failed transaction is rolled back
+    with Raises(sqlite3.IntegrityError):
+        with db.transaction() as conn:
+            conn.execute("delete from collectionj_docs")
+            conn.execute("insert into collectionj_docs values (null, null)")
+    assert docs.count() == 400
+
+    db.reopen()
+    assert docs.count() == 400
+    db.close()
+
+
+@pytest.mark.benchmark
+def test_benchmark_pooled_reads(tmp_path):
+    import os
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    if (os.cpu_count() or 1) < 4:
+        pytest.skip("parallel reads need several cores")
+
+    path = f"sqlite:///{tmp_path / 'pool.db'}"
+    with Database(path) as db:
+        DocumentStore("docs", db).insert_many(_nested_docs(20000), do_commit=True)
+    queries = [("@sides = ? and @dims.width > ?", (i % 9, i % 5)) for i in range(16)]
+
+    results = {}
+    for name, pool_size in (("single", None), ("pooled", 4)):
+        db = Database(path, pool_size=pool_size)
+        docs = DocumentStore("docs", db)
+        start = time.perf_counter()
+        if name == "single":
+            counts = [docs.count(*q) for q in queries]
+        else:
+            with ThreadPoolExecutor(4) as pool:
+                counts = list(pool.map(lambda q: docs.count(*q), queries))
+        results[name] = time.perf_counter() - start
+        results[name + " counts"] = counts
+        db.close()
+
+    assert results["single counts"] == results["pooled counts"]
+    print(f"\n{len(queries)} queries of 20000 documents")
+    print(f"  one connection:           {results['single'] * 1000:8.1f} ms")
+    print(f"  4 threads, pool_size=4:   {results['pooled'] * 1000:8.1f} ms")
+    assert results["pooled"] < results["single"]
+
+
+def test_async_document_store(tmp_path):
+    import asyncio
+    from contextlib import aclosing
+
+    from dataclassic import AsyncDatabase, AsyncDocumentStore
+
+    async def main():
+        path = f"sqlite:///{tmp_path / 'async.db'}"
+        async with AsyncDatabase(path, pool_size=4) as db:
+            shapes = await AsyncDocumentStore.open("shapes", db, dtype=Shape)
+            docs = AsyncDocumentStore("docs", db)
+            source = _nested_docs(3000)
+            await asyncio.gather(
+                shapes.insert_many([triangle, rectangle, pentagon, hexagon]),
+                *(docs.insert_many(source[i : i + 500]) for i in range(0, 3000, 500)),
+            )
+            assert shapes.dtype is Shape
+            assert await shapes.get("triangle") == triangle
+            found = await docs.get_many(["doc000002", "nope", "doc000001"])
+            assert [d and d["ID"] for d in found] == ["doc000002", None, "doc000001"]
+
+            # the event loop keeps running while the queries run on the workers
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            ticker = asyncio.create_task(tick())
+            counts = await asyncio.gather(
+                *(docs.count("@sides = ?", (i,)) for i in range(9)),
+                docs.find2({"$eq": {"color": "red"}}),
+                shapes.find("@sides > ?", (4,)),
+            )
+            ticker.cancel()
+            assert ticks > 0
+            assert sum(counts[:9]) == 3000
+            assert len(counts[9]) == 1000
+            assert sorted(s.ID for s in counts[10]) == ["hexagaon", "pentagon"]
+
+            ids = [d["ID"] async for d in docs.find_iter(order_by="ID", batch_size=64)]
+            assert ids == [d["ID"] for d in source]
+
+            # closing an iteration left early ends it on the worker thread
+            async with aclosing(docs.find_iter(order_by="ID", batch_size=10)) as found:
+                async for doc in found:
+                    if doc["ID"] == "doc000015":
+                        break
+            assert await docs.count() == 3000
+
+            # errors of the worker are raised by the iteration
+            with Raises(KeyError):
+                async for doc in docs.find2_iter({"$nope": {"sides": 1}}):
+                    pass
+
+            # an iteration left without closing it is stopped by closing the database
+            abandoned = docs.find_iter(order_by="ID", batch_size=10)
+            assert (await abandoned.__anext__())["ID"] == "doc000000"
+            await asyncio.sleep(0.2)
+
+        await abandoned.aclose()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"use_zlib_encoder": True}])
+def test_find_parallel(monkeypatch, tmp_path, kwargs):
+    from dataclassic import doc_store
+
+    db = Database(f"sqlite:///{tmp_path / 'parallel.db'}")
+    shapes = DocumentStore("shapes", db, dtype=Shape)
+    docs = DocumentStore("docs", db, **kwargs)
+    docs.insert_many(_nested_docs(500), do_commit=True)
+    shapes.insert_many([triangle, rectangle, pentagon, hexagon], do_commit=True)
+
+    monkeypatch.setattr(doc_store, "PARALLEL_DECODE_MIN_ROWS", 100)
+    order = ["@sides desc", "ID"]
+    assert docs.find(order_by=order, parallel=2) == docs.find(order_by=order)
+    assert docs.find2(
+        {"$eq": {"color": "red"}}, order_by="ID", parallel=3
+    ) == docs.find2({"$eq": {"color": "red"}}, order_by="ID")
+    # small results are decoded serially
+    assert shapes.find(order_by="ID", parallel=2) == shapes.find(order_by="ID")
+
+    monkeypatch.setattr(doc_store, "PARALLEL_DECODE_MIN_ROWS", 2)
+    res = shapes.find(Find(Shape).order_by("ID"), parallel=2)
+    assert [s.ID for s in res] == ["hexagaon", "pentagon", "rectangle", "triangle"]
+    assert all(isinstance(s, Shape) for s in res)
+
+    # the workers do not see uncommitted changes, so they are decoded serially
+    with db.transaction() as conn:
+        conn.execute(f"delete from {shapes.table_name} where ID = 'triangle'")
+        assert len(shapes.find(parallel=2)) == 3
+    # neither are in memory databases
+    memory = DocumentStore("docs", Database("sqlite:///:memory:"), **kwargs)
+    memory.insert_many(_nested_docs(500))
+    assert memory.find(order_by=order, parallel=2) == docs.find(order_by=order)
+
+    # threads share one pool per size, whose workers are not forked
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(4) as threads:
+        pools = list(threads.map(doc_store._process_pool, [2] * 8))
+    assert all(pool is pools[0] for pool in pools)
+    assert pools[0]._mp_context.get_start_method() == "spawn"
+    doc_store._shutdown_process_pools()
+    assert doc_store._process_pools == {}
+
+
+@pytest.mark.benchmark
+def test_benchmark_find_parallel(tmp_path):
+    import os
+    import time
+
+    if (os.cpu_count() or 1) < 4:
+        pytest.skip("parallel decoding needs several cores")
+
+    db = Database(f"sqlite:///{tmp_path / 'bench.db'}")
+    docs = DocumentStore("docs", db, compression="zlib")
+    docs.insert_many(
+        [dict(d, notes=["note"] * 20) for d in _nested_docs(40000)], do_commit=True
+    )
+    # start the workers before timing
+    docs.find(parallel=4)
+
+    results = {}
+    for parallel in (None, 2, 4):
+        start = time.perf_counter()
+        found = docs.find(parallel=parallel)
+        results[parallel] = time.perf_counter() - start
+        assert len(found) == 40000
+
+    print("\nfind of 40000 zlib compressed documents")
+    for parallel, seconds in results.items():
+        print(f"  parallel={str(parallel):5s} {seconds * 1000:8.1f} ms")
+    assert results[4] < results[None]
+
+
+def test_sharded_document_store(tmp_path):
+    from dataclassic import ShardedDocumentStore
+
+    paths = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)]
+    with Raises(ValueError):
+        ShardedDocumentStore("docs", [Database("sqlite:///:memory:")])
+
+    plain = DocumentStore("docs", Database("sqlite:///:memory:"))
+    with ShardedDocumentStore("docs", paths) as docs:
+        source = _paged_docs()
+        docs.insert_many(source)
+        plain.insert_many(source)
+        docs.insert({"ID": "extra", "sides": 100, "color": "red"})
+        plain.insert({"ID": "extra", "sides": 100, "color": "red"})
+        docs.add_index("color")
+        docs.update_index("color")
+
+        # every shard holds a part of the documents, each in the shard of its ID
+        for shard in docs.shards:
+            assert shard.count() > 0
+            assert all(docs.shard_for(d["ID"]) is shard for d in shard.find())
+        assert docs.count() == plain.count()
+        assert docs.count("@color = ?", ("red",)) == plain.count("@color = ?", ("red",))
+
+        for order in (["ID"], ["@sides desc", "ID"], ["@color", "@dims.width", "ID"]):
+            assert docs.find(order_by=order) == plain.find(order_by=order)
+            for limit, offset in ((5, None), (7, 11), (None, 20)):
+                expected = plain.find(order_by=order, limit=limit, offset=offset)
+                assert expected == docs.find(order_by=order, limit=limit, offset=offset)
+
+        where = {"$gt": {"sides": 3}}
+        order = ["@sides desc", "ID"]
+        assert docs.find2(where, order_by=order, limit=3) == plain.find2(
+            where, order_by=order, limit=3
+        )
+        assert docs.find(
+            "@color = ?", ("red",), fields=["ID"], order_by=["@sides", "ID"]
+        ) == plain.find(
+            "@color = ?", ("red",), fields=["ID"], order_by=["@sides", "ID"]
+        )
+        assert len(docs.find(limit=10)) == 10
+
+        ids = ["doc000003", "nope", "extra", "doc000100"]
+        assert docs.get_many(ids) == plain.get_many(ids)
+        assert docs.get("extra")["sides"] == 100
+
+        docs.delete({"ID": "extra"})
+        docs.delete_many(docs.find(Find(dict).where("sides").is_less_than(3)))
+        assert docs.count() == plain.count() - plain.count("@sides < ?", (3,)) - 1
+
+
+def test_delete_many_dataclasses():
+    db, shapes, chairs = setUp()
+    shapes.insert_many((triangle, rectangle, pentagon, hexagon))
+
+    shapes.delete_many([triangle, {"ID": rectangle.ID}])
+
+    assert sorted(s.ID for s in shapes.find()) == sorted([pentagon.ID, hexagon.ID])
+
+
+def test_get_cache():
+    db, shapes, chairs = setUp()
+    shapes.insert_many([triangle, rectangle, pentagon, hexagon])
+    # without a cache
+    assert shapes.get("triangle") == triangle
+    assert shapes.get("nope") is None
+    assert shapes.get_many(["pentagon", "nope", "triangle"], default=0) == [
+        pentagon,
+        0,
+        triangle,
+    ]
+    assert shapes.cache_stats()["size"] == 0
+
+    cached = DocumentStore("shapes", db, dtype=Shape, cache_size=2)
+    assert cached.get_many(["triangle", "rectangle", "triangle"]) == [
+        triangle,
+        rectangle,
+        triangle,
+    ]
+    assert cached.cache_stats() == {"hits": 0, "misses": 2, "evictions": 0, "size": 2}
+    assert cached.get("triangle") is cached.get("triangle")
+    # the rectangle is the least recently used one
+    assert cached.get("hexagaon") == hexagon
+    assert cached.cache_stats() == {"hits": 2, "misses": 3, "evictions": 1, "size": 2}
+    assert cached.get("hexagaon") is cached._cache["hexagaon"]
+    assert list(cached._cache) == ["triangle", "hexagaon"]
+
+    # writes of the store invalidate the cached documents
+    changed = Shape(ID="triangle", sides=3, color="yellow")
+    cached.insert(changed, upsert=True)
+    assert cached.get("triangle").color == "yellow"
+    cached.delete(changed)
+    assert cached.get("triangle") is None
+    cached.get("hexagaon")
+    cached.delete_many([hexagon])
+    assert cached.get("hexagaon", "gone") == "gone"
+    cached.insert_many([hexagon])
+    assert cached.get("hexagaon") == hexagon
+    cached.bulk_load(
+        [Shape(ID="hexagaon", sides=6, color="red")], on_conflict="replace"
+    )
+    assert cached.get("hexagaon").color == "red"
+
+    cached.reset_cache_stats()
+    cached.clear_cache()
+    assert cached.cache_stats() == {"hits": 0, "misses": 0, "evictions": 0, "size": 0}
+
+
+@pytest.mark.benchmark
+def test_benchmark_get_cache():
+    import random
+    import time
+
+    db = Database("sqlite:///:memory:")
+    plain = DocumentStore("docs", db)
+    cached = DocumentStore("docs", db, cache_size=1000)
+    plain.insert_many(_nested_docs(20000), do_commit=True)
+    random.seed(1)
+    hot = ["doc{0:06d}".format(random.randrange(20000)) for i in range(1000)]
+    lookups = [random.choice(hot) for i in range(20000)]
+
+    results = {}
+    start = time.perf_counter()
+    for uid in lookups:
+        plain.find("ID = ?", (uid,))
+    results["find"] = time.perf_counter() - start
+    for name, store in (("get", plain), ("get, cache_size=1000", cached)):
+        start = time.perf_counter()
+        for uid in lookups:
+            store.get(uid)
+        results[name] = time.perf_counter() - start
+
+    print(f"\n{len(lookups)} lookups of 1000 hot documents")
+    for name, seconds in results.items():
+        print(f"  {name:22s} {seconds / len(lookups) * 1e6:8.1f} us/lookup")
+    print(" ", cached.cache_stats())
@@ -0,0 +1,298 @@
+import json
+import math
+import timeit
+
+import pytest
+
+from dataclassic import Database, DocumentStore, dataclass
+from dataclassic.encoders import (
+    HAS_LZ4,
+    HAS_MSGPACK,
+    HAS_ZSTD,
+    CompressedEncoder,
+    JsonEncoder,
+    MsgPackEncoder,
+    ZlibEncoder,
+    available_json_backends,
+    get_json_backend,
+    packb,
+    train_dictionary,
+    unpackb,
+)
+from tests._test_setup import Shape, hexagon, pentagon, rectangle, triangle
+
+DOC = {
+    "ID": "abc",
+    "sides": 3,
+    "color": "red",
+    "dims": {"width": 1.5, "height": 2.25},
+    "tags": ["a", "b", "c"],
+    "big": 2**70,
+}
+
+
+def test_auto_backend_preference():
+    backend = get_json_backend()
+    assert backend.name == available_json_backends()[0]
+    assert get_json_backend("auto") is backend
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_json_backend("nope")
+
+
+@pytest.mark.parametrize("backend", available_json_backends())
+def test_backend_roundtrip(backend):
+    for encoder in (JsonEncoder(backend=backend), ZlibEncoder(JsonEncoder(backend))):
+        assert encoder.decode(encoder.encode(DOC)) == DOC
+        assert encoder.decode(encoder.encode(triangle)) == {
+            "ID": "triangle",
+            "sides": 3,
+            "color": "red",
+        }
+
+
+@dataclass
+class Measure:
+    ID: str
+    value: float
+
+
+@pytest.mark.parametrize("backend", available_json_backends())
+def test_backend_non_finite_floats(backend):
+    doc = {"ID": "nan", "values": [math.nan, math.inf, -math.inf], "none": None}
+    for encoder in (JsonEncoder(backend=backend), ZlibEncoder(JsonEncoder(backend))):
+        res = encoder.decode(encoder.encode(doc))
+        assert math.isnan(res["values"][0])
+        assert res["values"][1:] == [math.inf, -math.inf]
+        assert res["none"] is None
+        # dataclasses are written directly by to_json
+        res = encoder.decode(encoder.encode(Measure("inf", -math.inf)))
+        assert res == {"ID": "inf", "value": -math.inf}
+
+    # strict json rejects non-finite floats, but not strings naming them
+    strict = JsonEncoder(backend=backend, allow_nan=False)
+    for value in (doc, Measure("inf", -math.inf)):
+        with pytest.raises(ValueError):
+            strict.encode(value)
+    text = {"ID": "NaN", "value": 1.5, "note": "Infinity", "none": None}
+    assert strict.decode(strict.encode(text)) == text
+
+    # documents with null but finite floats are written by the backend itself
+    encoder = JsonEncoder(backend=backend)
+    plain = {"ID": "null", "value": 1.5, "none": None, "items": [None, 2.5]}
+    text = encoder.encode(plain)
+    assert encoder.decode(text) == plain
+    if backend in ("orjson", "msgspec"):
+        # compact, not encoded again by the json module
+        assert ", " not in text
+
+    db = Database("sqlite:///:memory:", encoder=backend)
+    measures = DocumentStore("measures", db, dtype=Measure)
+    measures.insert_many((Measure("a", math.inf), {"ID": "b", "value": math.nan}))
+    res = measures.find(order_by="ID")
+    assert res[0].value == math.inf
+    assert math.isnan(res[1].value)
+
+
+def test_json_options_need_json_backend():
+    encoder = JsonEncoder(indent=2)
+    assert encoder.backend.name == "json"
+    assert encoder.encode({"a": 1}) == '{\n  "a": 1\n}'
+    assert JsonEncoder(backend="json", sort_keys=True).encode({"b": 1, "a": 2}) == (
+        '{"a": 2, "b": 1}'
+    )
+    for backend in available_json_backends():
+        if backend != "json":
+            with pytest.raises(ValueError):
+                JsonEncoder(backend=backend, indent=2)
+
+
+@pytest.mark.parametrize("backend", available_json_backends())
+def test_docstore_backend(backend):
+    db = Database("sqlite:///:memory:", encoder=backend)
+    assert db.encoder.backend.name == backend
+
+    shapes = DocumentStore("shapes", db, dtype=Shape)
+    assert shapes._encoder.backend.name == backend
+    shapes.insert_many((triangle, rectangle, pentagon, hexagon))
+
+    res = shapes.find("@sides > ?", (4,))
+    assert sorted(s.ID for s in res) == ["hexagaon", "pentagon"]
+
+    # a query with the encoder of another collection does not change the backend
+    # of collections created later
+    other = DocumentStore("other", db, json_backend="json", use_zlib_encoder=True)
+    other.find()
+    assert DocumentStore("later", db)._encoder.backend.name == backend
+
+    # the database can be cloned with an encoder instance
+    assert db.clone().default_encoder is db.default_encoder
+
+
+@pytest.mark.benchmark
+def test_benchmark_backends():
+    docs = [dict(DOC, ID=str(i), big=i) for i in range(2000)]
+    n = 5
+    print()
+    for backend in available_json_backends():
+        encoder = JsonEncoder(backend=backend)
+        encoded = [encoder.encode(d) for d in docs]
+        enc = timeit.timeit(lambda: [encoder.encode(d) for d in docs], number=n)
+        dec = timeit.timeit(lambda: [encoder.decode(e) for e in encoded], number=n)
+        count = n * len(docs)
+        print(
+            f"{backend:8s} encode: {count / enc:10.0f} docs/s"
+            f"   decode: {count / dec:10.0f} docs/s"
+        )
+
+
+@pytest.mark.parametrize("accelerated", [False, True])
+def test_msgpack_roundtrip(accelerated):
+    if accelerated:
+        pytest.importorskip("msgpack")
+    encoder = MsgPackEncoder(accelerated=accelerated)
+    doc = dict(DOC, big=2**40, small=-(2**40), blob=b"\x00\x01", nested=[{"a": None}])
+    assert encoder.decode(encoder.encode(doc)) == doc
+    assert encoder.decode(encoder.encode(triangle)) == {
+        "ID": "triangle",
+        "sides": 3,
+        "color": "red",
+    }
+
+
+def test_pure_msgpack_matches_library():
+    msgpack = pytest.importorskip("msgpack")
+    doc = dict(DOC, big=2**40, text="x" * 300, items=list(range(40)))
+    assert packb(doc) == msgpack.packb(doc)
+    assert unpackb(msgpack.packb(doc)) == doc
+
+
+def test_binary_docstore(monkeypatch):
+    pytest.importorskip("msgpack")
+    db = Database("sqlite:///:memory:")
+    shapes = DocumentStore("shapes", db, dtype=Shape, use_binary_encoder=True)
+    assert shapes.table_name == "collectionb_shapes"
+    shapes.insert_many((triangle, rectangle, pentagon, hexagon))
+
+    res = shapes.find("@sides > ? and @color = ?", (4, "red"))
+    assert [s.ID for s in res] == ["pentagon"]
+
+    # the encoding is detected from the table name
+    again = DocumentStore("shapes", db, dtype=Shape)
+    assert isinstance(again._encoder, MsgPackEncoder)
+    assert again._encoder.accelerated
+    assert len(again.find("@sides = ?", (3,))) == 1
+
+    # without msgpack new binary collections are refused, while existing ones are
+    # read with the pure python implementation
+    from dataclassic import doc_store, encoders
+
+    monkeypatch.setattr(encoders, "HAS_MSGPACK", False)
+    monkeypatch.setattr(doc_store, "HAS_MSGPACK", False)
+    with pytest.raises(ImportError):
+        DocumentStore("others", db, use_binary_encoder=True)
+    fallback = DocumentStore("shapes", db, dtype=Shape)
+    assert not fallback._encoder.accelerated
+    assert fallback.find(order_by="ID") == shapes.find(order_by="ID")
+
+
+@pytest.mark.benchmark
+def test_benchmark_binary_encoders():
+    docs = [dict(DOC, ID=str(i), big=i, values=[i * 0.5] * 20) for i in range(1000)]
+    n = 3
+    encoders = [("json", JsonEncoder()), ("zlib", ZlibEncoder(JsonEncoder()))]
+    if HAS_MSGPACK:
+        encoders.append(("msgpack", MsgPackEncoder()))
+    encoders.append(("msgpack (pure)", MsgPackEncoder(accelerated=False)))
+
+    print()
+    for name, encoder in encoders:
+        encoded = [encoder.encode(d) for d in docs]
+        size = sum(len(e) for e in encoded) / len(docs)
+        dec = timeit.timeit(lambda: [encoder.decode(e) for e in encoded], number=n)
+        print(
+            f"{name:15s} decode: {n * len(docs) / dec:10.0f} docs/s"
+            f"   size: {size:6.0f} bytes/doc"
+        )
+
+
+def _sample_docs(n):
+    return [
+        {
+            "ID": f"doc{i:05d}",
+            "sides": i % 7,
+            "color": ["red", "blue", "green"][i % 3],
+            "dims": {"width": i * 0.5, "height": 2.0},
+            "tags": ["a", "b"],
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("algorithm", ["zlib", "zstd", "lz4"])
+def test_compressed_encoder(algorithm):
+    if algorithm == "zstd":
+        pytest.importorskip("zstandard")
+    elif algorithm == "lz4":
+        pytest.importorskip("lz4")
+
+    docs = _sample_docs(200)
+    encoder = CompressedEncoder(algorithm)
+    samples = [encoder.base_encoder.encode(d).encode("utf-8") for d in docs]
+    trained = encoder.with_dictionary(train_dictionary(samples, 4096, algorithm))
+
+    for enc in (encoder, trained):
+        assert [enc.decode(enc.encode(d)) for d in docs] == docs
+    assert sum(len(trained.encode(d)) for d in docs) < sum(
+        len(encoder.encode(d)) for d in docs
+    )
+
+
+def test_compressed_docstore_dictionary():
+    db = Database("sqlite:///:memory:")
+    store = DocumentStore("things", db, compression="zlib", compression_level=9)
+    assert store.table_name == "collectionc_things"
+    store.insert_many(_sample_docs(300))
+
+    stats = store.train_dictionary(sample_size=100, dictionary_size=2048)
+    assert stats["documents"] == 300
+    assert stats["bytes_after"] < stats["bytes_before"]
+
+    # the settings and dictionary are read back from the metadata table
+    again = DocumentStore("things", db)
+    assert again._encoder.algorithm == "zlib"
+    assert again._encoder.level == 9
+    assert again._encoder.dictionary == store._encoder.dictionary
+    res = again.find("@color = ? and @sides > ?", ("red", 4))
+    assert sorted(d["ID"] for d in res) == sorted(
+        d["ID"] for d in _sample_docs(300) if d["color"] == "red" and d["sides"] > 4
+    )
+    assert [c.name for c in db.get_collections()] == ["things"]
+
+
+@pytest.mark.benchmark
+def test_benchmark_compression():
+    docs = _sample_docs(2000)
+    n = 3
+    samples = [json.dumps(d).encode("utf-8") for d in docs[:500]]
+    encoders = [("zlib (per document)", ZlibEncoder(JsonEncoder()))]
+    for algorithm, available in (("zlib", True), ("zstd", HAS_ZSTD), ("lz4", HAS_LZ4)):
+        if available:
+            enc = CompressedEncoder(algorithm)
+            dictionary = train_dictionary(samples, 8192, algorithm)
+            encoders.append(
+                (f"{algorithm} + dictionary", enc.with_dictionary(dictionary))
+            )
+
+    print()
+    raw = sum(len(s) for s in samples) / len(samples)
+    for name, encoder in encoders:
+        encoded = [encoder.encode(d) for d in docs]
+        size = sum(len(e) for e in encoded) / len(docs)
+        dec = timeit.timeit(lambda: [encoder.decode(e) for e in encoded], number=n)
+        print(
+            f"{name:20s} ratio: {raw / size:5.2f}"
+            f"   decode: {n * len(docs) / dec:10.0f} docs/s"
+        )
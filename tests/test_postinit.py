@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import timeit
+from dataclasses import dataclass as std_dataclass
+
+import pytest
+
+from dataclassic import (
+    DataClassicValidationError,
+    dataclass,
+    field,
+    from_dict,
+    from_dicts,
+)
+from dataclassic.dataclasses_ext import get_coercion_plan
+from tests._test_tools import Raises
+
+
+@dataclass
+class Dims:
+    width: float = 0.0
+    height: float = 0.0
+
+
+def MinSidesValidator(shape):
+    return shape.sides > 2
+
+
+@dataclass
+class Part:
+    ID: str = field(converter=str)
+    sides: int = field(converter=int, validator=MinSidesValidator)
+    weight: float = 0.0
+    dims: Dims = None
+    tags: list[str] = None
+    children: dict[str, Dims] = None
+
+
+def test_plan_is_cached():
+    Part("a", 3, 1.0, Dims())
+    plan = get_coercion_plan(Part)
+    assert plan is get_coercion_plan(Part)
+    assert [step.kind for step in plan] == [
+        "convert",
+        "convert",
+        "cast",
+        "nested",
+        "list",
+        "dict",
+    ]
+
+
+def test_string_annotations_are_resolved():
+    # this module uses "from __future__ import annotations"
+    p = Part(
+        ID=1,
+        sides="4",
+        weight="2.5",
+        dims={"width": 1, "height": 2},
+        tags=[1, 2],
+        children={"a": {"width": "3"}},
+    )
+    assert p.ID == "1"
+    assert p.sides == 4
+    assert p.weight == 2.5
+    assert isinstance(p.dims, Dims)
+    assert p.tags == ["1", "2"]
+    assert p.children["a"].width == 3.0
+
+
+def test_validator_runs():
+    with Raises(DataClassicValidationError):
+        Part(ID="x", sides=1)
+
+
+def test_unresolved_annotation_keeps_others():
+    @dataclass
+    class Holder:
+        dims: Dims = None
+        other: NotDefinedAnywhere = None  # noqa: F821
+
+    holder = Holder(dims={"width": 1.0}, other=1)
+    assert holder.dims == Dims(1.0, 0.0)
+    assert holder.other == 1
+
+
+@dataclass(codegen=True)
+class FastPart:
+    ID: str = field(converter=str)
+    sides: int = field(converter=int, validator=MinSidesValidator)
+    weight: float = 0.0
+    dims: Dims = None
+    tags: list[str] = None
+    children: dict[str, Dims] = None
+
+
+def test_codegen_matches_generic():
+    kwargs = dict(
+        ID=1,
+        sides="4",
+        weight="2.5",
+        dims={"width": 1, "height": 2},
+        tags=[1, 2],
+        children={"a": {"width": "3"}},
+    )
+    fast = FastPart(**kwargs)
+    slow = Part(**kwargs)
+    assert FastPart.__post_init__.__qualname__ == "FastPart.__post_init__"
+    assert [getattr(fast, f) for f in kwargs] == [getattr(slow, f) for f in kwargs]
+
+    with Raises(DataClassicValidationError):
+        FastPart(ID="x", sides=1)
+
+    with Raises(ValueError):
+        FastPart(ID="x", sides=3, dims=5)
+
+
+@pytest.mark.benchmark
+def test_benchmark_post_init():
+    # the same fields coerced by the generic plan and by the generated code
+    dims = Dims(1.0, 2.0)
+    n = 20000
+    Part("a", 3, 1.0, dims, ["x"])
+    FastPart("a", 3, 1.0, dims, ["x"])
+    generic = timeit.timeit(lambda: Part("a", 3, 1.0, dims, ["x"]), number=n)
+    fast = timeit.timeit(lambda: FastPart("a", 3, 1.0, dims, ["x"]), number=n)
+    print(
+        f"\ngeneric: {generic / n * 1e6:.2f} us/instance"
+        f"\ncodegen: {fast / n * 1e6:.2f} us/instance"
+    )
+    assert fast < generic
+
+
+@dataclass
+class Keyed:
+    ID: str = field(converter=str)
+    sides: int = field(converter=int, validator=MinSidesValidator, json_key="nSides")
+    color: str = "red"
+
+
+def test_from_dicts_remaps_keys():
+    records = [{"ID": "a", "nSides": 3}, {"ID": "b", "nSides": "4", "color": "blue"}]
+    result = from_dicts(records, Keyed)
+    assert not isinstance(result, list)
+    assert list(result) == [Keyed("a", 3), Keyed("b", 4, "blue")]
+    # the input records are not modified
+    assert "nSides" in records[0]
+
+
+def test_from_dicts_columnar():
+    clean = [{"ID": str(i), "nSides": 3 + i} for i in range(10)]
+    assert list(from_dicts(clean, Keyed, columnar=True)) == list(
+        from_dicts(clean, Keyed)
+    )
+
+    # a value needing coercion falls back to the regular constructor
+    mixed = clean + [{"ID": 11, "nSides": "5"}]
+    result = list(from_dicts(mixed, Keyed, columnar=True))
+    assert result[-1] == Keyed("11", 5)
+
+    with Raises(DataClassicValidationError):
+        list(from_dicts([{"ID": "x", "nSides": 1}], Keyed, columnar=True))
+
+
+def TagsValidator(obj):
+    return all(tag.islower() for tag in obj.tags)
+
+
+@dataclass
+class Tagged:
+    ID: str
+    tags: list[str] = field(default_factory=list, validator=TagsValidator)
+
+
+def test_from_dicts_columnar_skips_validators_like_post_init():
+    # empty and None lists are skipped by the coercion, and so is their validator
+    records = [{"ID": "a"}, {"ID": "b", "tags": []}, {"ID": "c", "tags": None}]
+    generic = list(from_dicts(records, Tagged))
+    assert list(from_dicts(records, Tagged, columnar=True)) == generic
+    assert [t.tags for t in generic] == [[], [], None]
+
+    for columnar in (False, True):
+        with Raises(DataClassicValidationError):
+            list(from_dicts([{"ID": "d", "tags": ["X"]}], Tagged, columnar=columnar))
+
+
+@std_dataclass
+class Square:
+    side: float
+
+    def __post_init__(self):
+        self.perimeter_cache = 4 * self.side
+
+
+@std_dataclass
+class Circle:
+    radius: float
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.perimeter_cache = 2 * radius
+
+
+def test_from_dicts_columnar_runs_custom_init():
+    squares = list(from_dicts([{"side": 1.5}, {"side": 2.0}], Square, columnar=True))
+    assert [s.perimeter_cache for s in squares] == [6.0, 8.0]
+
+    circles = list(from_dicts([{"radius": 1.0}], Circle, columnar=True))
+    assert circles[0].perimeter_cache == 2.0
+
+
+@pytest.mark.benchmark
+def test_benchmark_from_dicts():
+    records = [{"ID": str(i), "nSides": 3 + i % 5, "color": "red"} for i in range(5000)]
+    n = 3
+    one_by_one = timeit.timeit(
+        lambda: [from_dict(dict(r), Keyed) for r in records], number=n
+    )
+    batch = timeit.timeit(lambda: list(from_dicts(records, Keyed)), number=n)
+    columnar = timeit.timeit(
+        lambda: list(from_dicts(records, Keyed, columnar=True)), number=n
+    )
+    scale = 1e6 / (n * len(records))
+    print(
+        f"\nfrom_dict:                  {one_by_one * scale:.2f} us/record"
+        f"\nfrom_dicts:                 {batch * scale:.2f} us/record"
+        f"\nfrom_dicts(columnar=True):  {columnar * scale:.2f} us/record"
+    )
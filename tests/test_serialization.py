@@ -0,0 +1,182 @@
+import json
+import timeit
+from dataclasses import asdict as std_asdict
+from enum import Enum
+from uuid import UUID, uuid4
+
+import pytest
+
+from dataclassic import Unset, asdict, dataclass, field, from_dict, to_json
+from dataclassic.dataclasses_ext import JSON_TYPE_CONVERTERS
+
+
+class Color(Enum):
+    red = "red"
+    blue = "blue"
+
+
+@dataclass
+class Dims:
+    width: float = 0.0
+    height: float = 0.0
+
+
+@dataclass
+class Part:
+    ID: str = field(converter=str)
+    sides: int = field(converter=int, json_key="nSides")
+    color: Color = Color.red
+    dims: Dims = None
+    tags: list[str] = None
+    extra: dict = None
+    note: str = field(converter=str, default_factory=Unset)
+
+
+def make_part(i=0):
+    return Part(
+        ID=f"part{i}",
+        sides=3 + i % 4,
+        color=Color.blue,
+        dims=Dims(1.0, 2.0),
+        tags=["a", "b"],
+        extra={"k": [1, 2, {"x": None}], "empty": None},
+    )
+
+
+def test_asdict():
+    d = asdict(make_part())
+    assert d == {
+        "ID": "part0",
+        "nSides": 3,
+        "color": "blue",
+        "dims": {"width": 1.0, "height": 2.0},
+        "tags": ["a", "b"],
+        "extra": {"k": [1, 2, {}]},
+    }
+
+
+def test_asdict_skip_fields():
+    d = asdict(make_part(), skip_fields=("dims", "extra"))
+    assert "dims" not in d and "extra" not in d
+
+
+def test_asdict_copy():
+    @dataclass
+    class Holder:
+        ID: UUID = None
+        payload: object = None
+
+    payload = bytearray(b"abc")
+    h = Holder(uuid4(), payload)
+    assert asdict(h)["payload"] is not payload
+    assert asdict(h, copy=False)["payload"] is payload
+    assert asdict(h)["ID"] is h.ID
+
+
+@pytest.mark.benchmark
+def test_benchmark_asdict():
+    parts = [make_part(i) for i in range(1000)]
+    n = 5
+    std = timeit.timeit(lambda: [std_asdict(p) for p in parts], number=n)
+    fast = timeit.timeit(lambda: [asdict(p) for p in parts], number=n)
+    no_copy = timeit.timeit(lambda: [asdict(p, copy=False) for p in parts], number=n)
+    scale = 1e6 / (n * len(parts))
+    print(
+        f"\ndataclasses.asdict:  {std * scale:.2f} us/object"
+        f"\nasdict:              {fast * scale:.2f} us/object"
+        f"\nasdict(copy=False):  {no_copy * scale:.2f} us/object"
+    )
+
+
+def test_to_json_matches_asdict():
+    from datetime import date
+
+    @dataclass
+    class Dated:
+        when: date = None
+        parts: list[Part] = None
+        ratio: float = 0.5
+
+    obj = Dated(date(2020, 1, 2), [make_part(1), make_part(2)], float("inf"))
+    assert to_json(obj) == json.dumps(asdict(obj))
+    assert to_json(make_part()) == json.dumps(asdict(make_part()))
+
+
+@pytest.mark.benchmark
+def test_benchmark_to_json():
+    parts = [make_part(i) for i in range(1000)]
+    n = 5
+    via_dict = timeit.timeit(lambda: [json.dumps(asdict(p)) for p in parts], number=n)
+    direct = timeit.timeit(lambda: [to_json(p) for p in parts], number=n)
+    scale = 1e6 / (n * len(parts))
+    print(
+        f"\njson.dumps(asdict()):  {via_dict * scale:.2f} us/object"
+        f"\nto_json:               {direct * scale:.2f} us/object"
+    )
+
+
+def test_asdict_numpy_arrays():
+    numpy = pytest.importorskip("numpy")
+
+    @dataclass
+    class Grid:
+        values: numpy.ndarray = None
+        empty: numpy.ndarray = None
+        count: int = 0
+
+    g = Grid(numpy.arange(6.0).reshape(2, 3), numpy.array([]), numpy.int64(4))
+    d = asdict(g)
+    assert d == {"values": [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]], "empty": [], "count": 4}
+    assert to_json(g) == json.dumps(d)
+
+    g2 = from_dict(json.loads(to_json(g)), Grid)
+    assert isinstance(g2.values, numpy.ndarray)
+    assert (g2.values == g.values).all()
+
+
+def test_binary_numpy_arrays():
+    numpy = pytest.importorskip("numpy")
+
+    @dataclass
+    class Signal:
+        samples: numpy.ndarray = field(array_encoding="base64", default=None)
+
+    s = Signal(numpy.linspace(0, 1, 12, dtype="float32").reshape(3, 4))
+    d = asdict(s)
+    assert set(d["samples"]) == {"__ndarray__", "dtype", "shape"}
+    assert to_json(s) == json.dumps(d)
+
+    s2 = from_dict(json.loads(to_json(s)), Signal)
+    assert s2.samples.dtype == s.samples.dtype
+    assert s2.samples.shape == (3, 4)
+    assert (s2.samples == s.samples).all()
+    s2.samples[0, 0] = 5.0
+
+
+@pytest.mark.benchmark
+def test_benchmark_numpy_arrays():
+    numpy = pytest.importorskip("numpy")
+
+    @dataclass
+    class Series:
+        as_list: numpy.ndarray = None
+        as_bytes: numpy.ndarray = field(array_encoding="base64", default=None)
+
+    def elementwise_asdict(obj):
+        # the previous conversion of arrays in asdict, one value at a time
+        converter = JSON_TYPE_CONVERTERS[type(obj.as_list[0])]
+        return {"as_list": [converter(x) for x in obj.as_list], "as_bytes": None}
+
+    series = Series(as_list=numpy.random.random(100_000))
+    assert elementwise_asdict(series) == asdict(series)
+    n = 5
+    elementwise = timeit.timeit(lambda: elementwise_asdict(series), number=n)
+    vectorized = timeit.timeit(lambda: asdict(series), number=n)
+    binary = Series(as_bytes=series.as_list)
+    as_bytes = timeit.timeit(lambda: asdict(binary), number=n)
+    print(
+        f"\nasdict, elementwise:  {elementwise / n * 1e3:.2f} ms"
+        f"\nasdict, tolist:       {vectorized / n * 1e3:.2f} ms"
+        f"\nasdict, base64:       {as_bytes / n * 1e3:.2f} ms"
+    )
+    assert vectorized < elementwise